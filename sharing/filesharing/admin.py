@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare, FileComment
+from . import counters, heartbeats
+from .models import Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare, FileComment, UploadSession, Blob, FileDownloadDaily, UserStats, StorageUsage, Thumbnail, ConnectionUsage
 
 
 @admin.register(Device)
@@ -18,6 +19,11 @@ class DeviceAdmin(admin.ModelAdmin):
         }),
     )
     
+    def changelist_view(self, request, extra_context=None):
+        # Write buffered heartbeats so statuses below are current
+        heartbeats.flush()
+        return super().changelist_view(request, extra_context)
+    
     def status_badge(self, obj):
         if obj.is_online:
             color = '#28a745'
@@ -69,9 +75,13 @@ class WiFiNetworkAdmin(admin.ModelAdmin):
         )
     status_badge.short_description = 'Status'
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_usage()
+    
     def connected_count(self, obj):
-        return f"{obj.connected_devices_count()}/{obj.max_devices}"
+        return f"{obj.connected_count}/{obj.max_devices}"
     connected_count.short_description = 'Connected'
+    connected_count.admin_order_field = 'connected_count'
 
 
 @admin.register(SharedNetwork)
@@ -93,6 +103,14 @@ class SharedNetworkAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ConnectionUsage)
+class ConnectionUsageAdmin(admin.ModelAdmin):
+    list_display = ('connection', 'network', 'resolution', 'bucket', 'bytes_used')
+    list_filter = ('resolution',)
+    search_fields = ('network__network_name', 'connection__device__device_name')
+    raw_id_fields = ('connection', 'network')
+
+
 @admin.register(NetworkShare)
 class NetworkShareAdmin(admin.ModelAdmin):
     list_display = ('network', 'shared_with_user', 'permission_level', 'is_active', 'created_at')
@@ -128,10 +146,25 @@ class NetworkInvitationAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'devices_count', 'networks_count', 'shared_networks_count', 'active_connections', 'pending_invitations', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'devices_count', 'networks_count', 'shared_networks_count', 'active_connections', 'pending_invitations', 'updated_at')
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'bytes_used', 'file_count', 'quota_bytes', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'bytes_used', 'file_count', 'image_bytes', 'document_bytes', 'video_bytes',
+                       'audio_bytes', 'archive_bytes', 'other_bytes', 'updated_at')
+
+
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
-    list_display = ('filename', 'owner', 'file_type', 'file_size_display', 'is_public', 'download_count', 'created_at')
-    list_filter = ('file_type', 'is_public', 'created_at')
+    list_display = ('filename', 'owner', 'file_type', 'file_size_display', 'is_public', 'downloads', 'status', 'created_at')
+    list_filter = ('file_type', 'is_public', 'status', 'created_at')
     search_fields = ('filename', 'owner__username')
     readonly_fields = ('id', 'created_at', 'updated_at', 'file_size')
     fieldsets = (
@@ -142,7 +175,7 @@ class FileAdmin(admin.ModelAdmin):
             'fields': ('file_type', 'file_size', 'mime_type')
         }),
         ('Access', {
-            'fields': ('is_public', 'download_count')
+            'fields': ('is_public', 'download_count', 'status')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -150,9 +183,57 @@ class FileAdmin(admin.ModelAdmin):
         }),
     )
     
+    def changelist_view(self, request, extra_context=None):
+        # Write buffered downloads so the totals below are exact
+        counters.flush()
+        return super().changelist_view(request, extra_context)
+    
     def file_size_display(self, obj):
         return obj.get_display_size()
     file_size_display.short_description = 'Size'
+    
+    def downloads(self, obj):
+        return obj.download_count + counters.pending_downloads(obj.pk)
+    downloads.short_description = 'Downloads'
+    downloads.admin_order_field = 'download_count'
+
+
+@admin.register(FileDownloadDaily)
+class FileDownloadDailyAdmin(admin.ModelAdmin):
+    list_display = ('file', 'day', 'count')
+    list_filter = ('day',)
+    search_fields = ('file__filename',)
+    date_hierarchy = 'day'
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size', 'encoding', 'stored_size', 'ref_count', 'tier', 'created_at')
+    list_filter = ('tier', 'encoding')
+    search_fields = ('digest',)
+    readonly_fields = (
+        'digest', 'file', 'size', 'encoding', 'stored_size', 'ref_count', 'tier', 'tiered_at', 'created_at',
+    )
+
+
+@admin.register(Thumbnail)
+class ThumbnailAdmin(admin.ModelAdmin):
+    list_display = ('blob', 'size', 'format', 'width', 'height', 'created_at')
+    list_filter = ('size', 'format')
+    search_fields = ('blob__digest',)
+    readonly_fields = ('blob', 'size', 'format', 'file', 'width', 'height', 'created_at')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('file', 'owner', 'progress', 'chunk_size', 'updated_at')
+    list_filter = ('created_at',)
+    search_fields = ('file__filename', 'owner__username')
+    readonly_fields = ('id', 'created_at', 'updated_at')
+    
+    def progress(self, obj):
+        return f"{obj.received_bytes * 100 // max(obj.total_size, 1)}%"
+    progress.short_description = 'Progress'
 
 
 @admin.register(FileShare)
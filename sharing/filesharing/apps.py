@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FilesharingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'filesharing'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,8 @@
+"""
+Benchmark suite for the file and network endpoints.
+
+seed.py generates a reproducible data set, scenarios.py holds the scripted
+requests and runner.py times them and compares against stored baselines.
+Everything runs in-process against a throwaway database, see the
+``benchmark`` management command.
+"""
@@ -0,0 +1,201 @@
+"""
+Timing, reporting and baselines.
+
+run_scenario() sends a scenario's requests from ``concurrency`` threads,
+each with its own test clients and database connection, and records the
+latency, status and number of SQL queries of every request. Results are
+summarised as p50/p95/p99 latency, throughput and queries per request, and
+can be saved as a JSON baseline. compare() then flags scenarios that got
+slower or issue more queries than the baseline.
+"""
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .scenarios import SCENARIOS
+
+# Attempts at finding a user the scenario has something to do for
+MAX_USER_ATTEMPTS = 20
+
+# Queries per request a scenario may gain over its baseline before it counts
+# as a regression; periodic flushes (download counters, heartbeats) make
+# the average wobble a little between runs
+QUERY_SLACK = 0.5
+
+# Latency growth below this is treated as noise, whatever the percentage
+LATENCY_SLACK_MS = 5.0
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    throughput_rps: float
+    queries_per_request: float
+    max_queries: int
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def _consume(response):
+    """Read the whole body, as a client would, so streamed responses are timed completely"""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+
+
+class _Worker:
+    """One thread's share of a scenario; keeps a logged-in client per user"""
+
+    def __init__(self, scenario, world, seed):
+        self.scenario = scenario
+        self.world = world
+        self.rng = random.Random(seed)
+        self.clients = {}
+
+    def client_for(self, user_id):
+        if user_id not in self.clients:
+            client = Client()
+            client.force_login(User.objects.get(pk=user_id))
+            # Browsers get their CSRF cookie from the login form; pages are only cached once it is set
+            client.get(reverse('filesharing:file-upload'))
+            self.clients[user_id] = client
+        return self.clients[user_id]
+
+    def request(self):
+        """(seconds, queries, ok) of one request"""
+        for _ in range(MAX_USER_ATTEMPTS):
+            user_id = self.rng.choice(self.world.user_ids)
+            client = self.client_for(user_id)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                try:
+                    response = self.scenario(client, user_id, self.world, self.rng)
+                    if response is None:
+                        continue
+                    _consume(response)
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - started
+            return elapsed, len(queries), ok
+        raise RuntimeError('No seeded user has anything to do in this scenario')
+
+    def run(self, count):
+        try:
+            return [self.request() for _ in range(count)]
+        finally:
+            connection.close()
+
+
+def run_scenario(name, world, requests=200, concurrency=1, warmup=10, seed=0):
+    """Run ``requests`` timed requests of a scenario and summarise them"""
+    scenario = SCENARIOS[name]
+    _Worker(scenario, world, seed=-1 - seed).run(warmup)
+
+    per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    workers = [_Worker(scenario, world, seed=seed * 1000 + i) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = [s for batch in pool.map(lambda args: args[0].run(args[1]), zip(workers, per_worker)) for s in batch]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [n for _, n, _ in samples]
+    return ScenarioResult(
+        name=name,
+        requests=len(samples),
+        errors=sum(1 for _, _, ok in samples if not ok),
+        p50_ms=round(percentile(latencies, 50), 2),
+        p95_ms=round(percentile(latencies, 95), 2),
+        p99_ms=round(percentile(latencies, 99), 2),
+        mean_ms=round(sum(latencies) / len(latencies), 2),
+        throughput_rps=round(len(samples) / wall, 1),
+        queries_per_request=round(sum(queries) / len(queries), 2),
+        max_queries=max(queries),
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, options):
+    """JSON-serialisable record of a run, with what is needed to reproduce it"""
+    return {
+        'created_at': timezone.now().isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'options': options,
+        'scenarios': {result.name: asdict(result) for result in results},
+    }
+
+
+def save_baseline(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Regressions against a baseline.
+
+    A scenario regresses when its p95 latency grows by more than
+    ``tolerance`` (a fraction) and LATENCY_SLACK_MS, or it issues more
+    than QUERY_SLACK extra queries per request.
+    Returns a list of human-readable descriptions; empty means no regression.
+    """
+    regressions = []
+    for result in results:
+        before = baseline.get('scenarios', {}).get(result.name)
+        if before is None:
+            continue
+        limit = max(before['p95_ms'] * (1 + tolerance), before['p95_ms'] + LATENCY_SLACK_MS)
+        if before['p95_ms'] and result.p95_ms > limit:
+            regressions.append(
+                f'{result.name}: p95 {before["p95_ms"]}ms -> {result.p95_ms}ms '
+                f'(+{(result.p95_ms / before["p95_ms"] - 1) * 100:.0f}%)'
+            )
+        if result.queries_per_request > before['queries_per_request'] + QUERY_SLACK:
+            regressions.append(
+                f'{result.name}: queries/request {before["queries_per_request"]} -> {result.queries_per_request}'
+            )
+    return regressions
@@ -0,0 +1,134 @@
+"""
+Scripted benchmark scenarios.
+
+Each scenario sends one request as a random seeded user through the Django
+test client (the full middleware stack, no network) and returns the
+response. World holds what the scenarios need to pick realistic targets:
+the files each user may download or comment on, their networks and
+devices, and the newest comment of every file for polling.
+"""
+import json
+from dataclasses import dataclass, field
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from ..comments import encode_cursor
+from ..models import Device, File, FileComment, FileShare, SharedNetwork, WiFiNetwork
+from .seed import WORDS
+
+
+@dataclass
+class World:
+    user_ids: list
+    downloadable: dict = field(default_factory=dict)  # user_id -> [file_id]
+    viewable: dict = field(default_factory=dict)  # user_id -> [file_id]
+    networks: dict = field(default_factory=dict)  # owner_id -> [network_id]
+    devices: dict = field(default_factory=dict)  # user_id -> [device_id]
+    connections: dict = field(default_factory=dict)  # device user_id -> [shared_network_id]
+    latest_cursor: dict = field(default_factory=dict)  # file_id -> cursor of its newest comment
+    upload_size: int = 64 * 1024
+
+    @classmethod
+    def load(cls, upload_size=64 * 1024):
+        """Read the targets from the seeded database"""
+        world = cls(user_ids=[], upload_size=upload_size)
+        for file_id, owner_id in File.objects.filter(status='ready').values_list('pk', 'owner_id'):
+            world.downloadable.setdefault(owner_id, []).append(file_id)
+            world.viewable.setdefault(owner_id, []).append(file_id)
+        shares = FileShare.objects.filter(is_active=True).values_list('file_id', 'shared_with_user_id', 'permission_level')
+        for file_id, user_id, level in shares:
+            world.viewable.setdefault(user_id, []).append(file_id)
+            if level == 'download':
+                world.downloadable.setdefault(user_id, []).append(file_id)
+        for network_id, owner_id in WiFiNetwork.objects.values_list('pk', 'owner_id'):
+            world.networks.setdefault(owner_id, []).append(network_id)
+        for device_id, user_id in Device.objects.values_list('pk', 'user_id'):
+            world.devices.setdefault(user_id, []).append(device_id)
+        for connection_id, user_id in SharedNetwork.objects.values_list('pk', 'device__user_id'):
+            world.connections.setdefault(user_id, []).append(connection_id)
+        newest = FileComment.objects.order_by('file_id', '-created_at', '-id')
+        for comment in newest.only('id', 'file_id', 'created_at'):
+            world.latest_cursor.setdefault(comment.file_id, encode_cursor(comment))
+        world.user_ids = sorted(world.devices.keys() | world.viewable.keys())
+        return world
+
+
+def dashboard(client, user_id, world, rng):
+    return client.get(reverse('filesharing:dashboard'))
+
+
+def networks_list(client, user_id, world, rng):
+    return client.get(reverse('filesharing:networks-list'))
+
+
+def network_stats(client, user_id, world, rng):
+    networks = world.networks.get(user_id)
+    if not networks:
+        return None
+    return client.get(reverse('filesharing:api-network-stats', args=[rng.choice(networks)]))
+
+
+def files_list(client, user_id, world, rng):
+    return client.get(reverse('filesharing:files-list'))
+
+
+def shared_files(client, user_id, world, rng):
+    return client.get(reverse('filesharing:shared-files'))
+
+
+def upload(client, user_id, world, rng):
+    content = SimpleUploadedFile(
+        f'{rng.choice(WORDS)}-{rng.randrange(10 ** 6)}.bin', rng.randbytes(world.upload_size), 'application/octet-stream',
+    )
+    return client.post(reverse('filesharing:file-upload'), {'file': content})
+
+
+def download(client, user_id, world, rng):
+    files = world.downloadable.get(user_id)
+    if not files:
+        return None
+    return client.get(reverse('filesharing:file-download', args=[rng.choice(files)]))
+
+
+def comment_polling(client, user_id, world, rng):
+    files = world.viewable.get(user_id)
+    if not files:
+        return None
+    file_id = rng.choice(files)
+    params = {'since': world.latest_cursor[file_id]} if file_id in world.latest_cursor else {}
+    return client.get(reverse('filesharing:api-file-comments', args=[file_id]), params)
+
+
+def search(client, user_id, world, rng):
+    query = ' '.join(rng.sample(WORDS, rng.choice([1, 1, 2])))
+    return client.get(reverse('filesharing:search'), {'q': query})
+
+
+def heartbeat(client, user_id, world, rng):
+    devices = world.devices.get(user_id, [])
+    connections = world.connections.get(user_id, [])
+    if not devices:
+        return None
+    payload = {
+        'devices': [{'id': str(device_id), 'is_online': True} for device_id in devices],
+        'connections': [
+            {'id': str(connection_id), 'connection_quality': rng.randint(20, 100), 'data_used': rng.randint(0, 10 ** 9)}
+            for connection_id in connections
+        ],
+    }
+    return client.post(reverse('filesharing:api-heartbeat'), json.dumps(payload), content_type='application/json')
+
+
+SCENARIOS = {
+    'dashboard': dashboard,
+    'networks_list': networks_list,
+    'network_stats': network_stats,
+    'files_list': files_list,
+    'shared_files': shared_files,
+    'upload': upload,
+    'download': download,
+    'comment_polling': comment_polling,
+    'search': search,
+    'heartbeat': heartbeat,
+}
@@ -0,0 +1,177 @@
+"""
+Reproducible benchmark data.
+
+seed() fills an empty database with users, devices, networks, connections,
+files, shares and comments in the requested volumes. The same ``seed``
+always yields the same data set. Rows are bulk-inserted, so the
+denormalized tables (dashboard counters, search index) are rebuilt at
+the end instead of being maintained by signals.
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .. import search, stats, typeahead
+from ..models import (
+    Blob, Device, File, FileComment, FileShare, NetworkShare, SharedNetwork, UserLookupKey, WiFiNetwork,
+)
+from ..storage import store_blob
+
+WORDS = (
+    'report budget holiday photo invoice draft notes slides backup music video archive contract '
+    'meeting summary design plan research family travel project release schedule receipt'
+).split()
+
+FILE_KINDS = [
+    ('document', 'pdf', 'application/pdf'),
+    ('document', 'txt', 'text/plain'),
+    ('image', 'jpg', 'image/jpeg'),
+    ('spreadsheet', 'csv', 'text/csv'),
+    ('archive', 'zip', 'application/zip'),
+]
+
+
+@dataclass
+class Volumes:
+    """How much data to generate; counts are per user unless named otherwise"""
+    users: int = 20
+    devices: int = 3
+    networks: int = 2
+    connections: int = 4  # per network
+    files: int = 25
+    shares: int = 3  # per file
+    comments: int = 5  # per file
+    distinct_contents: int = 20  # blobs shared by all files
+    file_size: int = 64 * 1024  # bytes
+
+    @classmethod
+    def scaled(cls, scale):
+        """Preset volumes: small, medium or large"""
+        presets = {
+            'small': cls(),
+            'medium': cls(users=100, files=50, comments=10),
+            'large': cls(users=500, devices=4, networks=3, files=100, shares=5, comments=20),
+        }
+        return presets[scale]
+
+
+def _phrase(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(volumes=None, seed=0):
+    """Populate the database; returns the generated row counts"""
+    volumes = volumes or Volumes()
+    rng = random.Random(seed)
+
+    with transaction.atomic():
+        password = make_password('benchmark')
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+            for i in range(volumes.users)
+        ])
+        UserLookupKey.objects.bulk_create([UserLookupKey(user=user, **typeahead.lookup_keys(user)) for user in users])
+        devices = Device.objects.bulk_create([
+            Device(
+                user=user,
+                device_name=f'{user.username} {rng.choice(["laptop", "phone", "tablet"])} {j}',
+                device_type=rng.choice(['laptop', 'phone', 'tablet', 'router']),
+                mac_address=':'.join(f'{b:02x}' for b in (i * volumes.devices + j).to_bytes(6, 'big')),
+                ip_address=f'10.{i // 250}.{i % 250}.{j + 1}',
+            )
+            for i, user in enumerate(users)
+            for j in range(volumes.devices)
+        ])
+        devices_of = {}
+        for device in devices:
+            devices_of.setdefault(device.user_id, []).append(device)
+
+        networks = WiFiNetwork.objects.bulk_create([
+            WiFiNetwork(
+                owner=user,
+                source_device=devices_of[user.pk][0],
+                network_name=f'{user.username}-net-{j}',
+                password='benchmark-pass',
+                frequency_band=rng.choice(['2.4GHz', '5GHz']),
+                channel=rng.choice([1, 6, 11, 36, 44]),
+            )
+            for user in users if devices_of.get(user.pk)
+            for j in range(volumes.networks)
+        ])
+        connections = {}
+        for network in networks:
+            for device in rng.sample(devices, min(volumes.connections, len(devices))):
+                connections[(network.pk, device.pk)] = SharedNetwork(
+                    network=network,
+                    device=device,
+                    is_connected=rng.random() < 0.8,
+                    connection_quality=rng.randint(20, 100),
+                    data_used=rng.randint(0, 10 ** 9),
+                )
+        SharedNetwork.objects.bulk_create(connections.values())
+        NetworkShare.objects.bulk_create([
+            NetworkShare(network=network, shared_with_user=recipient)
+            for network in networks
+            for recipient in rng.sample(users, min(2, len(users)))
+            if recipient.pk != network.owner_id
+        ], ignore_conflicts=True)
+
+        blobs = [
+            store_blob(ContentFile(rng.randbytes(volumes.file_size), name='seed'))
+            for _ in range(volumes.distinct_contents)
+        ]
+        files = []
+        for user in users:
+            for j in range(volumes.files):
+                file_type, ext, mime_type = rng.choice(FILE_KINDS)
+                blob = rng.choice(blobs)
+                files.append(File(
+                    owner=user,
+                    blob=blob,
+                    file=blob.file.name,
+                    checksum=blob.digest,
+                    filename=f'{_phrase(rng, 2).replace(" ", "-")}-{j}.{ext}',
+                    file_type=file_type,
+                    file_size=blob.size,
+                    mime_type=mime_type,
+                    is_public=rng.random() < 0.1,
+                ))
+        File.objects.bulk_create(files)
+        # store_blob() took one reference per blob; the files hold the real count
+        references = Counter(file_obj.blob_id for file_obj in files)
+        for blob in blobs:
+            Blob.objects.filter(pk=blob.digest).update(ref_count=references[blob.digest])
+
+        shares = {}
+        for file_obj in files:
+            for recipient in rng.sample(users, min(volumes.shares, len(users))):
+                if recipient.pk != file_obj.owner_id:
+                    shares[(file_obj.pk, recipient.pk)] = FileShare(
+                        file=file_obj,
+                        shared_with_user=recipient,
+                        permission_level=rng.choice(['view', 'download', 'download']),
+                    )
+        FileShare.objects.bulk_create(shares.values())
+        comments = FileComment.objects.bulk_create([
+            FileComment(file=file_obj, user=rng.choice(users), comment=_phrase(rng, 8))
+            for file_obj in files
+            for _ in range(volumes.comments)
+        ])
+
+        stats.rebuild_user_stats([user.pk for user in users])
+    search.rebuild_index()
+
+    return {
+        'users': len(users),
+        'devices': len(devices),
+        'networks': len(networks),
+        'connections': len(connections),
+        'files': len(files),
+        'shares': len(shares),
+        'comments': len(comments),
+    }
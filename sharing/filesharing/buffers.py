@@ -0,0 +1,89 @@
+"""
+In-process write buffers, flushed to the database in batches.
+
+Hot writes (download counts, device heartbeats) are merged into a
+WriteBuffer in process memory and written with a few bulk statements. Once
+enough entries have piled up, or the flush interval has passed, add()
+queues a flush on the worker pool (tasks.submit), so the request that
+crosses the line does not pay for the write; one flush is queued at a time.
+A batch whose write fails (a locked database, say) is merged back into
+the buffer, so the next flush retries it. Whatever is still buffered when
+the process exits is flushed then, and a failure there is logged with the
+number of entries lost.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import tasks
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """
+    Pending writes behind a lock, handed to ``write(batch)`` on flush.
+
+    ``new()`` makes an empty batch and ``size(batch)`` measures one against
+    the threshold. ``requeue(pending, batch)`` merges a batch whose write
+    failed back into the entries buffered since, which take precedence.
+    The interval and threshold are read from the named settings on every
+    add(), so they can be changed at runtime.
+    """
+
+    def __init__(self, name, write, requeue, interval_setting, threshold_setting, new=dict, size=len):
+        self.name = name
+        self._write = write
+        self._requeue = requeue
+        self._interval_setting = interval_setting
+        self._threshold_setting = threshold_setting
+        self._new = new
+        self._size = size
+        self._lock = threading.Lock()
+        self._pending = new()
+        self._last_flush = time.monotonic()
+        self._flush_queued = False
+        atexit.register(self._flush_at_exit)
+
+    def add(self, merge):
+        """Apply ``merge(pending)`` under the lock and queue a flush if one is due"""
+        with self._lock:
+            merge(self._pending)
+            due = not self._flush_queued and (
+                self._size(self._pending) >= getattr(settings, self._threshold_setting)
+                or time.monotonic() - self._last_flush >= getattr(settings, self._interval_setting)
+            )
+            if due:
+                self._flush_queued = True
+        if due:
+            tasks.submit(self.flush)
+
+    def read(self, view):
+        """``view(pending)`` under the lock, for peeking at unflushed entries"""
+        with self._lock:
+            return view(self._pending)
+
+    def flush(self):
+        """Write everything buffered so far; returns what ``write`` returns (0 if nothing was pending)"""
+        with self._lock:
+            batch, self._pending = self._pending, self._new()
+            self._last_flush = time.monotonic()
+            self._flush_queued = False
+        if not self._size(batch):
+            return 0
+        try:
+            return self._write(batch)
+        except Exception:
+            with self._lock:
+                self._requeue(self._pending, batch)
+            raise
+
+    def _flush_at_exit(self):
+        pending = self.read(self._size)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing %s at exit failed, %d buffered entries lost', self.name, pending)
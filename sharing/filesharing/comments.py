@@ -0,0 +1,90 @@
+"""
+Serialization and keyset pagination of file comments for the JSON API and
+the push stream.
+
+Cursors are opaque strings encoding a comment's (created_at, id), so pages
+are fetched with an indexed range scan on (file, created_at) instead of an
+OFFSET, and clients polling for new comments only receive the delta.
+"""
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def time_ago(moment, now=None):
+    """Short relative age like '5m ago'"""
+    time_diff = (now or timezone.now()) - moment
+    if time_diff.days > 0:
+        return f"{time_diff.days}d ago"
+    elif time_diff.seconds > 3600:
+        return f"{time_diff.seconds // 3600}h ago"
+    elif time_diff.seconds > 60:
+        return f"{time_diff.seconds // 60}m ago"
+    return "just now"
+
+
+def serialize_comment(comment, now=None):
+    """JSON-ready representation of a FileComment"""
+    return {
+        'id': str(comment.id),
+        'user': comment.user.username,
+        'comment': comment.comment,
+        'time_ago': time_ago(comment.created_at, now),
+        'created_at': comment.created_at.isoformat(),
+        'cursor': encode_cursor(comment),
+    }
+
+
+def encode_cursor(comment):
+    """Opaque cursor pointing at a comment"""
+    raw = f'{comment.created_at.isoformat()}|{comment.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) a cursor points at; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, comment_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(comment_id)
+    except (TypeError, ValueError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def comments_page(queryset, since=None, before=None, limit=20):
+    """
+    Fetch one page of comments, newest first.
+
+    ``since`` returns comments posted after that cursor (the oldest ones
+    first if there are more than ``limit``), ``before`` returns the page of
+    history preceding it; with neither, the newest page is returned.
+    Returns the comments and whether more remain in the requested direction.
+    """
+    queryset = queryset.select_related('user')
+    if since:
+        created_at, comment_id = decode_cursor(since)
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=comment_id)
+        ).order_by('created_at', 'id')
+    else:
+        if before:
+            created_at, comment_id = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=comment_id)
+            )
+        queryset = queryset.order_by('-created_at', '-id')
+
+    comments = list(queryset[:limit + 1])
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    if since:
+        comments.reverse()
+    return comments, has_more
+
+
+def comment_channel(file_id):
+    """Pub/sub channel carrying new comments on a file"""
+    return f'file-comments:{file_id}'
@@ -0,0 +1,171 @@
+"""
+Transparent at-rest compression of stored file content.
+
+When store_blob() writes new content it asks choose_encoding() whether to
+gzip it. Media that is already compressed (images, video, audio, archives,
+going by the MIME type) is never touched; everything else is probed by
+compressing a few small slices of it, and only content that shrinks by at
+least FILE_COMPRESSION_MIN_RATIO is stored compressed. Blob.encoding
+records the choice and Blob.stored_size the bytes on disk, while Blob.size
+and File.file_size stay the original size.
+
+Readers call open_content(), which returns the original bytes whatever
+the encoding (seeking works, so byte ranges and image decoding do too).
+serve_file() can also send the stored gzip bytes as they are, with
+``Content-Encoding: gzip``, to clients that accept it. Only new content is
+compressed; savings_report() (the ``compression_report`` command) shows
+what it saves.
+"""
+import gzip
+import os
+import tempfile
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Blob, File
+
+GZIP = 'gzip'
+
+# File types (see uploads.detect_file_type) whose content is already compressed
+SKIPPED_FILE_TYPES = {'image', 'video', 'audio', 'archive'}
+SKIPPED_MIME_TYPES = {
+    'application/gzip', 'application/x-gzip', 'application/x-bzip2', 'application/x-xz',
+    'application/x-7z-compressed', 'application/vnd.rar', 'application/zstd',
+}
+
+# Size of the reads used when compressing
+COPY_BLOCK_SIZE = 64 * 1024
+
+# Number of evenly spread slices read by the ratio probe
+PROBE_SLICES = 3
+
+
+@contextmanager
+def _reading(content):
+    """``content`` (an uploaded or already-stored Django File) open for reading from its start"""
+    if hasattr(content, 'temporary_file_path'):
+        with open(content.temporary_file_path(), 'rb') as fh:
+            yield fh
+    else:
+        content.seek(0)
+        yield content
+        content.seek(0)
+
+
+def is_candidate(mime_type, size):
+    """Whether content of this type and size is worth probing at all"""
+    from .uploads import detect_file_type
+
+    mime_type = (mime_type or '').lower()
+    return (
+        settings.FILE_COMPRESSION_ENABLED
+        and size >= settings.FILE_COMPRESSION_MIN_SIZE
+        and detect_file_type(mime_type) not in SKIPPED_FILE_TYPES
+        and mime_type not in SKIPPED_MIME_TYPES
+    )
+
+
+def probe_ratio(fh, size):
+    """Compression ratio of a few slices spread over the content (fast deflate level)"""
+    if size <= settings.FILE_COMPRESSION_PROBE_BYTES:
+        sample = fh.read(size)
+    else:
+        slice_size = settings.FILE_COMPRESSION_PROBE_BYTES // PROBE_SLICES
+        sample = b''
+        for i in range(PROBE_SLICES):
+            fh.seek((size - slice_size) * i // (PROBE_SLICES - 1))
+            sample += fh.read(slice_size)
+    return len(sample) / max(len(zlib.compress(sample, 1)), 1)
+
+
+def choose_encoding(content, mime_type):
+    """GZIP if ``content`` should be stored compressed, '' to store it as it is"""
+    if not is_candidate(mime_type, content.size):
+        return ''
+    with _reading(content) as fh:
+        ratio = probe_ratio(fh, content.size)
+    return GZIP if ratio >= settings.FILE_COMPRESSION_MIN_RATIO else ''
+
+
+def compress_to_tempfile(content):
+    """Gzip ``content`` into a temporary file; returns (path, size) and the caller owns the file"""
+    fd, path = tempfile.mkstemp(suffix='.gz', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(
+            fileobj=raw, mode='wb', compresslevel=settings.FILE_COMPRESSION_LEVEL, mtime=0,
+        ) as out, _reading(content) as src:
+            while True:
+                block = src.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                out.write(block)
+        return path, os.path.getsize(path)
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+class _GzipReader(gzip.GzipFile):
+    """GzipFile that also closes the stored file it reads from"""
+
+    def close(self):
+        stored = self.fileobj
+        try:
+            super().close()
+        finally:
+            if stored is not None:
+                stored.close()
+
+
+def open_content(obj):
+    """The original bytes of a Blob, or of a File through its blob, open for reading"""
+    blob = getattr(obj, 'blob', None) or obj
+    stored = obj.file.open('rb')
+    if getattr(blob, 'encoding', '') == GZIP:
+        return _GzipReader(fileobj=stored, mode='rb')
+    return stored
+
+
+def accepts_encoding(request, encoding):
+    """Whether the request's Accept-Encoding allows ``encoding`` (q=0 refuses it)"""
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() in (encoding, '*'):
+            q = params.strip().lower()
+            try:
+                return not (q.startswith('q=') and float(q[2:]) == 0)
+            except ValueError:
+                return False
+    return False
+
+
+def savings_report():
+    """
+    Original and stored bytes of live content, per encoding and per file type.
+
+    Returns ``{'encodings': [...], 'file_types': [...]}``, rows of dicts
+    with ``original_bytes`` and ``stored_bytes`` totals. The encoding rows
+    count each blob once; the file type rows count every file, so shared
+    content repeats.
+    """
+    encodings = (
+        Blob.objects.filter(ref_count__gt=0)
+        .values('encoding')
+        .annotate(blobs=Count('pk'), original_bytes=Sum('size'), stored_bytes=Sum(Coalesce('stored_size', 'size')))
+        .order_by('encoding')
+    )
+    file_types = (
+        File.objects.filter(blob__isnull=False)
+        .values('file_type')
+        .annotate(
+            files=Count('pk'),
+            original_bytes=Sum('file_size'),
+            stored_bytes=Sum(Coalesce('blob__stored_size', 'blob__size')),
+        )
+        .order_by('file_type')
+    )
+    return {'encodings': list(encodings), 'file_types': list(file_types)}
@@ -0,0 +1,91 @@
+"""
+Buffered download counters.
+
+Downloads are tallied in process memory (a buffers.WriteBuffer) and
+flushed in batches on the worker pool, either when enough have piled up or
+when the flush interval has passed. A flush issues one
+``download_count = download_count + n`` UPDATE per distinct increment and
+bumps the per-day FileDownloadDaily rows the same way, so concurrent
+downloads never lose increments and nothing else on the File row (including
+``updated_at``) is rewritten.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .buffers import WriteBuffer
+from .models import File, FileDownloadDaily
+
+
+def record_download(file_id):
+    """Count one download of a file"""
+    record_downloads([file_id])
+
+
+def record_downloads(file_ids):
+    """Count one download of each of the given files"""
+    today = timezone.localdate()
+
+    def merge(pending):
+        for file_id in file_ids:
+            pending[(file_id, today)] += 1
+
+    _buffer.add(merge)
+
+
+def pending_downloads(file_id):
+    """Downloads of a file recorded by this process but not flushed yet"""
+    return _buffer.read(
+        lambda pending: sum(n for (pending_id, _), n in pending.items() if pending_id == file_id)
+    )
+
+
+def _write(batch):
+    """Write a ``{(file_id, day): n}`` batch; returns how many downloads were written"""
+    totals = Counter()
+    for (file_id, _), n in batch.items():
+        totals[file_id] += n
+
+    # Files deleted since they were downloaded are dropped
+    existing = set(File.objects.filter(pk__in=totals).values_list('pk', flat=True))
+
+    by_increment = defaultdict(list)
+    for file_id, n in totals.items():
+        if file_id in existing:
+            by_increment[n].append(file_id)
+
+    daily_by_increment = defaultdict(list)
+    for (file_id, day), n in batch.items():
+        if file_id in existing:
+            daily_by_increment[(day, n)].append(file_id)
+
+    with transaction.atomic():
+        for n, ids in by_increment.items():
+            File.objects.filter(pk__in=ids).update(download_count=F('download_count') + n)
+
+        FileDownloadDaily.objects.bulk_create(
+            [FileDownloadDaily(file_id=file_id, day=day) for (file_id, day) in batch if file_id in existing],
+            ignore_conflicts=True,
+        )
+        for (day, n), ids in daily_by_increment.items():
+            FileDownloadDaily.objects.filter(file_id__in=ids, day=day).update(count=F('count') + n)
+
+    return sum(totals[file_id] for file_id in existing)
+
+
+_buffer = WriteBuffer(
+    'download counts',
+    _write,
+    requeue=lambda pending, batch: pending.update(batch),  # Counter.update() adds
+    interval_setting='DOWNLOAD_COUNTER_FLUSH_INTERVAL',
+    threshold_setting='DOWNLOAD_COUNTER_FLUSH_THRESHOLD',
+    new=Counter,
+    size=lambda pending: sum(pending.values()),
+)
+
+
+def flush():
+    """Write all buffered downloads to the database; returns how many were written"""
+    return _buffer.flush()
@@ -0,0 +1,18 @@
+"""
+Database helpers shared by the precomputed per-user tables.
+
+The counters in stats.py and quotas.py rebuild their rows with one
+upserting bulk_create(). PostgreSQL and SQLite (ON CONFLICT) need the
+conflicting columns named; MySQL and MariaDB (ON DUPLICATE KEY UPDATE)
+refuse them and match on the table's unique keys instead, which for these
+one-row-per-user tables is the same column.
+"""
+from django.db import connection
+
+
+def upsert_options(unique_fields, update_fields):
+    """bulk_create() keyword arguments that update rows conflicting on ``unique_fields``"""
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = unique_fields
+    return options
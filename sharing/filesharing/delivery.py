@@ -0,0 +1,94 @@
+"""
+Pluggable file delivery backends.
+
+download_file does the permission check and bookkeeping, then hands the
+transfer to the backend named by settings.FILE_DELIVERY_BACKEND:
+
+- StreamingDelivery streams the file through the Django worker (default,
+  fine for development).
+- XAccelRedirectDelivery lets nginx send the file. It needs an ``internal``
+  location matching FILE_DELIVERY_INTERNAL_URL, e.g.::
+
+      location /protected-media/ {
+          internal;
+          alias /path/to/media/;
+      }
+
+- XSendfileDelivery lets Apache (mod_xsendfile) or lighttpd send the file
+  from its absolute path.
+
+With either offload backend the worker is released as soon as the headers
+are written; the front-end server handles ranges and conditional requests.
+Content stored gzipped (see compression.py) is offloaded as is, with
+``Content-Encoding: gzip``, to clients that accept it; download_file
+streams and decodes it in the worker for ranges and other clients.
+"""
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header
+from django.utils.module_loading import import_string
+
+from . import downloads
+
+
+class StreamingDelivery:
+    """Stream the file from the Django worker"""
+
+    def deliver(self, request, file_obj):
+        return downloads.serve_file(request, file_obj)
+
+    def counts_as_download(self, request, response):
+        return downloads.counts_as_download(request, response)
+
+
+class OffloadDelivery:
+    """Base for backends that let the front-end web server send the file"""
+    header = None
+
+    def file_location(self, file_obj):
+        raise NotImplementedError
+
+    def deliver(self, request, file_obj):
+        response = HttpResponse(content_type=file_obj.mime_type or 'application/octet-stream')
+        response['Content-Disposition'] = content_disposition_header(True, file_obj.filename)
+        response[self.header] = self.file_location(file_obj)
+        encoding = file_obj.blob.encoding if file_obj.blob_id else ''
+        if encoding:
+            # The stored bytes are sent unchanged; download_file only offloads them to clients that accept this
+            response['Content-Encoding'] = encoding
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def counts_as_download(self, request, response):
+        # The front-end server answers ranges and revalidations itself, so
+        # only count requests that will receive the file from its first byte
+        if request.method != 'GET':
+            return False
+        if 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            return False
+        range_header = request.META.get('HTTP_RANGE', '').replace(' ', '')
+        return not range_header or range_header.startswith('bytes=0-')
+
+
+class XAccelRedirectDelivery(OffloadDelivery):
+    """Hand the transfer to nginx through an internal location"""
+    header = 'X-Accel-Redirect'
+
+    def file_location(self, file_obj):
+        return settings.FILE_DELIVERY_INTERNAL_URL + quote(file_obj.file.name)
+
+
+class XSendfileDelivery(OffloadDelivery):
+    """Hand the transfer to Apache mod_xsendfile or lighttpd"""
+    header = 'X-Sendfile'
+
+    def file_location(self, file_obj):
+        return file_obj.file.path
+
+
+def get_delivery_backend():
+    """Instantiate the backend configured in settings.FILE_DELIVERY_BACKEND"""
+    return import_string(settings.FILE_DELIVERY_BACKEND)()
@@ -0,0 +1,256 @@
+"""
+Byte-range and conditional GET support for file downloads.
+
+serve_file() answers If-None-Match / If-Modified-Since with 304, honours
+If-Range, and serves single or multiple byte ranges (RFC 7233) as 206
+responses, falling back to a plain 200 for everything else. Permission
+checks are the caller's job and must happen before serve_file() is called.
+
+Content stored gzipped (compression.py) is decoded on the fly, except for
+whole-file GET/HEAD requests from clients that accept gzip, which get the
+stored bytes as they are with ``Content-Encoding: gzip`` and their own ETag.
+"""
+import hashlib
+import re
+import uuid
+
+from django.core.cache import cache
+from django.core.files import File as DjangoFile
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from . import tasks
+from .compression import accepts_encoding, open_content
+from .models import File
+
+# Size of the reads used when hashing and streaming stored files
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Requests asking for more (coalesced) ranges than this get the whole file
+MAX_RANGES = 20
+
+# How long a queued checksum backfill keeps further downloads from queueing another
+CHECKSUM_BACKFILL_TTL = 60 * 60
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+def compute_checksum(content):
+    """SHA-256 hex digest of a Django File/UploadedFile, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backfill_checksum(file_id):
+    """Hash a file stored without a checksum (legacy rows); runs on the worker pool"""
+    file_obj = File.objects.filter(pk=file_id, checksum='').select_related('blob').first()
+    if file_obj is None:
+        return None
+    with open_content(file_obj) as fh:
+        checksum = compute_checksum(DjangoFile(fh))
+    File.objects.filter(pk=file_id, checksum='').update(checksum=checksum)
+    return checksum
+
+
+def file_etag(file_obj, encoding=''):
+    """
+    Strong ETag derived from the stored content, suffixed with ``encoding``.
+
+    Files without a checksum get no ETag (they are validated by
+    Last-Modified alone) and are hashed in the background, so a large
+    legacy file never stalls the request that first downloads it.
+    """
+    if not file_obj.checksum:
+        if cache.add(f'checksum-backfill:{file_obj.pk}', True, CHECKSUM_BACKFILL_TTL):
+            tasks.submit(backfill_checksum, file_obj.pk)
+        return None
+    return quote_etag(f'{file_obj.checksum}-{encoding}' if encoding else file_obj.checksum)
+
+
+def parse_range_header(header, size):
+    """
+    Parse a Range header into a sorted list of coalesced (start, end) pairs.
+
+    Returns None if the header is missing, malformed or should be ignored
+    (so the whole file is served), and [] if no range is satisfiable.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+
+    # Merge overlapping and adjacent ranges
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def _if_range_passes(request, etag, last_modified):
+    """Check the If-Range precondition; a Range is only honoured if it passes"""
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Strong comparison: weak validators never match
+        return not if_range.startswith('W/') and parse_etags(if_range) == [etag]
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _stream_range(fh, start, end):
+    """Yield the bytes start..end (inclusive) of an open file"""
+    fh.seek(start)
+    remaining = end - start + 1
+    while remaining:
+        block = fh.read(min(STREAM_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def _stream_file(fh):
+    """Yield an open file from its start, closing it at the end"""
+    try:
+        while True:
+            block = fh.read(STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        fh.close()
+
+
+def _stream_file_range(fh, start, end):
+    """Yield one byte range of an open file, closing it at the end"""
+    try:
+        yield from _stream_range(fh, start, end)
+    finally:
+        fh.close()
+
+
+def _stream_multipart(fh, parts, boundary):
+    """Yield a multipart/byteranges body from pre-rendered part headers"""
+    try:
+        for head, (start, end) in parts:
+            yield head
+            yield from _stream_range(fh, start, end)
+        yield f'\r\n--{boundary}--\r\n'.encode()
+    finally:
+        fh.close()
+
+
+def serve_file(request, file_obj):
+    """Build the response for a download, honouring conditional and range headers"""
+    size = file_obj.file_size
+    last_modified = int(file_obj.created_at.timestamp())
+    content_type = file_obj.mime_type or 'application/octet-stream'
+
+    # Ranges always count in original bytes, so they are served decoded
+    encoding = file_obj.blob.encoding if file_obj.blob_id else ''
+    passthrough = bool(encoding) and not request.META.get('HTTP_RANGE') and accepts_encoding(request, encoding)
+    if passthrough:
+        size = file_obj.blob.stored_size
+    etag = file_etag(file_obj, encoding if passthrough else '')
+
+    def finish(response):
+        if etag:
+            response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        if encoding:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    # 304 Not Modified / 412 Precondition Failed
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return finish(conditional)
+
+    ranges = None
+    if request.method == 'GET' and _if_range_passes(request, etag, last_modified):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE', ''), size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    fh = file_obj.file.open('rb') if passthrough else open_content(file_obj)
+    disposition = content_disposition_header(True, file_obj.filename)
+
+    if ranges is None:
+        response = StreamingHttpResponse(_stream_file(fh), content_type=content_type)
+        response['Content-Length'] = str(size)
+        if passthrough:
+            response['Content-Encoding'] = encoding
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_stream_file_range(fh, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for start, end in ranges:
+            head = (
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode()
+            parts.append((head, (start, end)))
+            length += len(head) + end - start + 1
+        length += len(f'\r\n--{boundary}--\r\n')
+        response = StreamingHttpResponse(
+            _stream_multipart(fh, parts, boundary),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(length)
+
+    response['Content-Disposition'] = disposition
+    return finish(response)
+
+
+def counts_as_download(request, response):
+    """Whether a response delivers the file from its first byte (scrubbing and resumes don't count)"""
+    if request.method != 'GET':
+        return False
+    if response.status_code == 200:
+        return True
+    return response.status_code == 206 and response.get('Content-Range', '').startswith('bytes 0-')
@@ -0,0 +1,120 @@
+"""
+Expiry of file shares, network shares and invitations.
+
+sweep_expired() (run on a schedule by the ``sweep_expired`` management
+command) deactivates shares and marks pending invitations ``expired`` once
+their ``expires_at`` has passed. Rows are found through the
+``(is_active, expires_at)`` and ``(status, expires_at)`` indexes and changed
+with one UPDATE per batch of EXPIRY_SWEEP_BATCH_SIZE, each batch in its own
+short transaction, so a large backlog never holds locks for long. List
+queries can then filter on ``is_active`` / ``status`` alone.
+
+Bulk updates skip model signals, so each batch rebuilds the dashboard
+counters of the users involved, drops their cached file permissions and
+invalidates their cached pages itself. Permission checks still compare
+``expires_at`` on the share they load, so access ends on time even if a
+sweep is late.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import pagecache, permissions, stats
+from .models import FileShare, NetworkInvitation, NetworkShare
+
+logger = logging.getLogger(__name__)
+
+
+def _expire_batch(queryset, changes, fields, batch_size):
+    """Apply ``changes`` to the next ``batch_size`` rows of ``queryset``; returns their ``fields`` values"""
+    rows = list(
+        queryset.select_for_update(of=('self',))
+        .order_by('expires_at')
+        .values_list('pk', *fields)[:batch_size]
+    )
+    if rows:
+        queryset.model.objects.filter(pk__in=[row[0] for row in rows]).update(**changes)
+    return [row[1:] for row in rows]
+
+
+def expire_file_shares(now, batch_size):
+    """Deactivate one batch of expired file shares; returns how many"""
+    with transaction.atomic():
+        rows = _expire_batch(
+            FileShare.objects.filter(is_active=True, expires_at__lte=now),
+            {'is_active': False},
+            ('file_id', 'shared_with_user_id', 'file__owner_id'),
+            batch_size,
+        )
+        pairs = [(file_id, user_id) for file_id, user_id, _ in rows]
+        users = {user_id for row in rows for user_id in row[1:]}
+        transaction.on_commit(lambda: permissions.invalidate_shares(pairs))
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.FILES, users))
+    return len(rows)
+
+
+def expire_network_shares(now, batch_size):
+    """Deactivate one batch of expired network shares; returns how many"""
+    with transaction.atomic():
+        rows = _expire_batch(
+            NetworkShare.objects.filter(is_active=True, expires_at__lte=now),
+            {'is_active': False},
+            ('shared_with_user_id', 'network__owner_id'),
+            batch_size,
+        )
+        stats.rebuild_user_stats({recipient for recipient, _ in rows})
+        users = {user_id for row in rows for user_id in row}
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.NETWORKS, users))
+    return len(rows)
+
+
+def expire_invitations(now, batch_size):
+    """Mark one batch of overdue pending invitations expired; returns how many"""
+    with transaction.atomic():
+        rows = _expire_batch(
+            NetworkInvitation.objects.filter(status='pending', expires_at__lte=now),
+            {'status': 'expired'},
+            ('invited_user_id', 'network__owner_id'),
+            batch_size,
+        )
+        stats.rebuild_user_stats({invited for invited, _ in rows})
+        owners = {owner for _, owner in rows}
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.NETWORKS, owners))
+    return len(rows)
+
+
+SWEEPS = {
+    'file_shares': expire_file_shares,
+    'network_shares': expire_network_shares,
+    'invitations': expire_invitations,
+}
+
+
+def sweep_expired(now=None, batch_size=None):
+    """
+    Expire everything whose ``expires_at`` is at or before ``now``.
+
+    Returns ``{'file_shares': n, 'network_shares': n, 'invitations': n}``
+    and logs the counts with the run time.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.EXPIRY_SWEEP_BATCH_SIZE
+    started = time.monotonic()
+    counts = {}
+    for kind, expire in SWEEPS.items():
+        counts[kind] = 0
+        while True:
+            expired = expire(now, batch_size)
+            counts[kind] += expired
+            if expired < batch_size:
+                break
+    logger.info(
+        'Expiry sweep: %(file_shares)d file share(s), %(network_shares)d network share(s), '
+        '%(invitations)d invitation(s) expired in %(seconds).3fs',
+        {**counts, 'seconds': time.monotonic() - started},
+        extra={'expired': counts},
+    )
+    return counts
@@ -1,10 +1,50 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from django.forms.utils import flatatt
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare, FileComment
 import re
 
 
+class UserAutocompleteWidget(forms.Widget):
+    """
+    Username search box backed by the typeahead API.
+
+    The chosen user's id travels in a hidden input, so the field still
+    validates it against its queryset; no user list is rendered.
+    """
+
+    def id_for_label(self, id_):
+        return f'{id_}_search' if id_ else id_
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        field_id = attrs.pop('id', f'id_{name}')
+        username = ''
+        try:
+            user_id = int(value) if value else None
+        except (TypeError, ValueError):
+            # A tampered value; the field reports it as invalid
+            user_id = None
+        if user_id is not None:
+            username = User.objects.filter(pk=user_id).values_list('username', flat=True).first() or ''
+        return format_html(
+            '<input type="hidden" name="{name}" id="{id}" value="{value}">'
+            '<input type="text" id="{id}_search" list="{id}_options" autocomplete="off" value="{username}"'
+            ' data-user-typeahead="{url}" data-target="{id}"{attrs}>'
+            '<datalist id="{id}_options"></datalist>',
+            name=name, id=field_id, value=value or '', username=username,
+            url=reverse('filesharing:api-user-typeahead'), attrs=flatatt(attrs),
+        )
+
+
+def recipient_queryset(user):
+    """Users a share or invitation from ``user`` may target"""
+    return User.objects.filter(is_active=True).exclude(pk=user.pk)
+
+
 class DeviceRegistrationForm(forms.ModelForm):
     """Form for registering a new device"""
     mac_address = forms.CharField(
@@ -100,9 +140,9 @@ class ShareNetworkForm(forms.ModelForm):
     """Form for sharing networks with other users"""
     shared_with_user = forms.ModelChoiceField(
         queryset=User.objects.all(),
-        widget=forms.Select(attrs={
-            'class': 'form-select',
-            'placeholder': 'Select user'
+        widget=UserAutocompleteWidget(attrs={
+            'class': 'form-control',
+            'placeholder': 'Start typing a username or email'
         }),
         label='Share with user'
     )
@@ -126,14 +166,17 @@ class ShareNetworkForm(forms.ModelForm):
     def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
         if user:
-            self.fields['shared_with_user'].queryset = User.objects.exclude(pk=user.pk)
+            self.fields['shared_with_user'].queryset = recipient_queryset(user)
 
 
 class NetworkInvitationForm(forms.ModelForm):
     """Form for sending network invitations"""
     invited_user = forms.ModelChoiceField(
         queryset=User.objects.all(),
-        widget=forms.Select(attrs={'class': 'form-select'}),
+        widget=UserAutocompleteWidget(attrs={
+            'class': 'form-control',
+            'placeholder': 'Start typing a username or email'
+        }),
         label='Invite user'
     )
     
@@ -150,7 +193,7 @@ class NetworkInvitationForm(forms.ModelForm):
     def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
         if user:
-            self.fields['invited_user'].queryset = User.objects.exclude(pk=user.pk)
+            self.fields['invited_user'].queryset = recipient_queryset(user)
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -250,9 +293,9 @@ class FileShareForm(forms.ModelForm):
     """Form for sharing files with other users"""
     shared_with_user = forms.ModelChoiceField(
         queryset=User.objects.all(),
-        widget=forms.Select(attrs={
-            'class': 'form-select',
-            'placeholder': 'Select user'
+        widget=UserAutocompleteWidget(attrs={
+            'class': 'form-control',
+            'placeholder': 'Start typing a username or email'
         }),
         label='Share with user'
     )
@@ -275,7 +318,7 @@ class FileShareForm(forms.ModelForm):
     def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
         if user:
-            self.fields['shared_with_user'].queryset = User.objects.exclude(pk=user.pk)
+            self.fields['shared_with_user'].queryset = recipient_queryset(user)
 
 
 class FileCommentForm(forms.ModelForm):
@@ -0,0 +1,175 @@
+"""
+Device and connection heartbeats.
+
+Agents on routers and laptops report device status (online, IP address)
+and per-connection telemetry (connected, quality, cumulative data used).
+Reports are coalesced in process memory (a buffers.WriteBuffer), the
+latest value winning, and written with bulk_update on the worker pool
+when enough have piled up or the flush interval has passed, so the
+database cost of a heartbeat does not grow with the number of devices it
+covers. Growth in a connection's ``data_used`` is added to its usage time
+series (see usage.py) by the same flush. Cached pages are only
+invalidated for shown values that actually changed (online status,
+address, connection telemetry), not for the timestamps every report
+refreshes (pagecache.HEARTBEAT_TIMESTAMPS).
+
+Devices are never marked offline on read: sweep_offline_devices() (run by
+the ``sweep_devices`` management command) flips every device whose last
+heartbeat is older than DEVICE_OFFLINE_AFTER seconds.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import transaction
+from django.utils import timezone
+
+from . import pagecache, stats, usage
+from .buffers import WriteBuffer
+from .models import Device, SharedNetwork
+
+
+def _as_bool(value):
+    if not isinstance(value, bool):
+        raise TypeError('expected true or false')
+    return value
+
+
+# Fields a heartbeat may set, with the type values are coerced to
+DEVICE_FIELDS = {'is_online': _as_bool, 'ip_address': str}
+CONNECTION_FIELDS = {'is_connected': _as_bool, 'connection_quality': int, 'data_used': int}
+
+
+class HeartbeatError(ValueError):
+    """A malformed status report"""
+
+
+def clean_report(report, fields):
+    """Validate one report entry into (id, {field: value}) with only known fields"""
+    if not isinstance(report, dict) or 'id' not in report:
+        raise HeartbeatError('Every report needs an "id"')
+    try:
+        report_id = str(uuid.UUID(str(report['id'])))
+    except ValueError:
+        raise HeartbeatError(f'Invalid id {report["id"]!r}')
+    values = {}
+    for name, kind in fields.items():
+        if name in report and report[name] is not None:
+            try:
+                values[name] = kind(report[name])
+            except (TypeError, ValueError):
+                raise HeartbeatError(f'Invalid {name} for {report["id"]}')
+    if 'connection_quality' in values and not 0 <= values['connection_quality'] <= 100:
+        raise HeartbeatError(f'connection_quality must be 0-100 for {report["id"]}')
+    if values.get('data_used', 0) < 0:
+        raise HeartbeatError(f'data_used must not be negative for {report["id"]}')
+    if 'ip_address' in values:
+        try:
+            validate_ipv46_address(values['ip_address'])
+        except ValidationError:
+            raise HeartbeatError(f'Invalid ip_address for {report["id"]}')
+    return report_id, values
+
+
+def record_heartbeat(devices, connections):
+    """Buffer already validated device and connection reports ({id: {field: value}})"""
+    now = timezone.now()
+
+    def merge(pending):
+        for device_id, values in devices.items():
+            # Reporting at all means the device is up unless it says otherwise
+            pending['devices'].setdefault(device_id, {}).update({'is_online': True, **values, 'last_seen': now})
+        for connection_id, values in connections.items():
+            pending['connections'].setdefault(connection_id, {}).update(values, last_activity=now)
+
+    _buffer.add(merge)
+
+
+def _bulk_update(model, pending):
+    """One bulk_update per distinct set of reported fields"""
+    by_fields = defaultdict(list)
+    for pk, values in pending.items():
+        by_fields[tuple(sorted(values))].append(model(pk=pk, **values))
+    for fields, objs in by_fields.items():
+        model.objects.bulk_update(objs, fields, batch_size=500)
+
+
+def _write(batch):
+    """Write a batch of buffered device and connection reports; returns how many rows were updated"""
+    devices, connections = batch['devices'], batch['connections']
+    with transaction.atomic():
+        current = (
+            SharedNetwork.objects.select_for_update(of=('self',))
+            .filter(pk__in=connections)
+            .values_list('pk', 'network_id', 'network__owner_id', 'is_connected', 'connection_quality', 'data_used')
+        )
+        flipped, deltas, owners = set(), {}, set()
+        for pk, network_id, owner_id, is_connected, connection_quality, data_used in current:
+            report = connections[str(pk)]
+            shown = {'is_connected': is_connected, 'connection_quality': connection_quality, 'data_used': data_used}
+            if any(report.get(field, value) != value for field, value in shown.items()):
+                owners.add(owner_id)
+            if report.get('is_connected', is_connected) != is_connected:
+                flipped.add(owner_id)
+            if 'data_used' in report:
+                deltas[(pk, network_id)] = usage.usage_delta(data_used, report['data_used'])
+        device_users = set()
+        if devices:
+            current = Device.objects.filter(pk__in=devices).values_list('pk', 'user_id', 'is_online', 'ip_address')
+            for pk, user_id, is_online, ip_address in current:
+                report = devices[str(pk)]
+                if report['is_online'] != is_online or report.get('ip_address', ip_address) != ip_address:
+                    device_users.add(user_id)
+        _bulk_update(Device, devices)
+        _bulk_update(SharedNetwork, connections)
+        usage.record_usage(deltas)
+        if flipped:
+            # bulk_update sends no signals, so fix the dashboard counters
+            # of owners whose connections changed state
+            stats.rebuild_user_stats(flipped)
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.DEVICES, device_users))
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.NETWORKS, owners))
+
+    return len(devices) + len(connections)
+
+
+def _requeue(pending, batch):
+    """Merge reports of a failed flush back, under the values reported since"""
+    for kind, reports in batch.items():
+        for pk, values in reports.items():
+            pending[kind][pk] = {**values, **pending[kind].get(pk, {})}
+
+
+_buffer = WriteBuffer(
+    'heartbeats',
+    _write,
+    requeue=_requeue,
+    interval_setting='HEARTBEAT_FLUSH_INTERVAL',
+    threshold_setting='HEARTBEAT_FLUSH_THRESHOLD',
+    new=lambda: {'devices': {}, 'connections': {}},
+    size=lambda pending: len(pending['devices']) + len(pending['connections']),
+)
+
+
+def flush():
+    """Write buffered heartbeats to the database; returns how many rows were updated"""
+    return _buffer.flush()
+
+
+def sweep_offline_devices(max_silence=None):
+    """Mark devices offline once they have missed heartbeats for ``max_silence``"""
+    flush()
+    if max_silence is None:
+        max_silence = timedelta(seconds=settings.DEVICE_OFFLINE_AFTER)
+    cutoff = timezone.now() - max_silence
+    with transaction.atomic():
+        silent = Device.objects.select_for_update().filter(is_online=True, last_seen__lt=cutoff)
+        users = set(silent.values_list('user_id', flat=True))
+        # update() leaves last_seen alone, unlike save() with auto_now
+        swept = silent.update(is_online=False)
+        transaction.on_commit(lambda: pagecache.bump_versions(pagecache.DEVICES, users))
+    return swept
+
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from dataclasses import fields
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from filesharing import counters, heartbeats, tasks
+from filesharing.benchmarks.runner import compare, load_baseline, report, run_scenario, save_baseline
+from filesharing.benchmarks.scenarios import SCENARIOS, World
+from filesharing.benchmarks.seed import Volumes, seed
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the file and network endpoints against a freshly seeded throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=['small', 'medium', 'large'], default='small',
+                            help='Preset data volumes')
+        for volume in fields(Volumes):
+            parser.add_argument(f'--{volume.name.replace("_", "-")}', dest=volume.name, type=int,
+                                help=f'Override the preset {volume.name.replace("_", " ")}')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Scenario to run (repeatable); all by default')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads sending requests')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests before each scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request choices')
+        parser.add_argument('--json', help='Write the full report to this file')
+        parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE,
+                            help=f'Store the results as a baseline (default {DEFAULT_BASELINE})')
+        parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE,
+                            help='Fail if a scenario regressed against this baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 latency growth over the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['compare'] and not os.path.exists(options['compare']):
+            raise CommandError(
+                f'No baseline at {options["compare"]}; record one on this machine with --save-baseline first'
+            )
+        volumes = Volumes.scaled(options['scale'])
+        for volume in fields(Volumes):
+            if options[volume.name] is not None:
+                setattr(volumes, volume.name, options[volume.name])
+        names = options['scenario'] or list(SCENARIOS)
+
+        workdir = tempfile.mkdtemp(prefix='filesharing-benchmark-')
+        database = connections['default']
+        if database.vendor == 'sqlite':
+            # A file rather than the in-memory default, so worker threads share it
+            database.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            with override_settings(MEDIA_ROOT=os.path.join(workdir, 'media')):
+                self.stdout.write(f'Seeding {options["scale"]} data set...')
+                counts = seed(volumes, seed=options['seed'])
+                self.stdout.write(', '.join(f'{n} {name}' for name, n in counts.items()))
+                world = World.load(upload_size=volumes.file_size)
+
+                results = []
+                for name in names:
+                    result = run_scenario(
+                        name, world,
+                        requests=options['requests'],
+                        concurrency=options['concurrency'],
+                        warmup=options['warmup'],
+                        seed=options['seed'],
+                    )
+                    results.append(result)
+                    self.stdout.write(self.format_result(result))
+                counters.flush()
+                heartbeats.flush()
+                tasks.shutdown()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        run_options = {key: options[key] for key in ('scale', 'requests', 'concurrency', 'warmup', 'seed')}
+        run_options['volumes'] = {volume.name: getattr(volumes, volume.name) for volume in fields(Volumes)}
+        data = report(results, run_options)
+        if options['json']:
+            save_baseline(options['json'], data)
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], data)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {options["save_baseline"]}'))
+        if options['compare']:
+            baseline = load_baseline(options['compare'])
+            if baseline.get('options') != run_options:
+                self.stdout.write(self.style.WARNING(
+                    'The baseline was recorded with different options; results may not be comparable'
+                ))
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def format_result(self, result):
+        line = (
+            f'{result.name:<16} p50 {result.p50_ms:>8.2f}ms  p95 {result.p95_ms:>8.2f}ms  '
+            f'p99 {result.p99_ms:>8.2f}ms  {result.throughput_rps:>8.1f} req/s  '
+            f'{result.queries_per_request:>6.2f} queries/req'
+        )
+        if result.errors:
+            return self.style.WARNING(f'{line}  {result.errors} errors')
+        return line
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from filesharing.uploads import process_stale_batches, reap_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked uploads and finish batch uploads left unprocessed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+            help='Reap uploads that have not received a chunk for this many hours',
+        )
+        parser.add_argument(
+            '--stale-minutes',
+            type=int,
+            default=settings.BATCH_UPLOAD_STALE_MINUTES,
+            help='Finish batch uploads that have been processing for this many minutes',
+        )
+
+    def handle(self, *args, **options):
+        reaped = reap_stale_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Reaped {reaped} abandoned upload(s)'))
+        processed = process_stale_batches(timedelta(minutes=options['stale_minutes']))
+        if processed:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} stalled batch upload(s)'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from filesharing.compression import savings_report
+
+
+def _describe(count, original, stored):
+    saved = original - stored
+    percent = saved * 100 / original if original else 0
+    return f'{count}, {original} -> {stored} bytes, {saved} bytes saved ({percent:.1f}%)'
+
+
+class Command(BaseCommand):
+    help = 'Report how much space at-rest compression saves in the blob store'
+
+    def handle(self, *args, **options):
+        report = savings_report()
+
+        self.stdout.write('By encoding (each blob once):')
+        for row in report['encodings']:
+            self.stdout.write(f'  {row["encoding"] or "none":<8} ' + _describe(
+                f'{row["blobs"]} blob(s)', row['original_bytes'], row['stored_bytes'],
+            ))
+
+        self.stdout.write('By file type (every file):')
+        for row in report['file_types']:
+            self.stdout.write(f'  {row["file_type"]:<8} ' + _describe(
+                f'{row["files"]} file(s)', row['original_bytes'], row['stored_bytes'],
+            ))
+
+        blobs = sum(row['blobs'] for row in report['encodings'])
+        original = sum(row['original_bytes'] for row in report['encodings'])
+        stored = sum(row['stored_bytes'] for row in report['encodings'])
+        self.stdout.write(self.style.SUCCESS('Blob store: ' + _describe(f'{blobs} blob(s)', original, stored)))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from filesharing.models import Blob
+from filesharing.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnails for every image file in the blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', dest='sizes', help='Only render this size (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        unknown = set(sizes or []) - set(settings.THUMBNAIL_SIZES)
+        if unknown:
+            raise CommandError(f'Unknown size(s): {", ".join(sorted(unknown))}')
+
+        blobs = Blob.objects.filter(files__file_type='image', files__status='ready').distinct().order_by('pk')
+        created = failed = 0
+        for blob in blobs.iterator(chunk_size=options['batch_size']):
+            result = generate_thumbnails(blob, sizes=sizes)
+            if result is None:
+                failed += 1
+                self.stderr.write(f'Could not decode {blob.digest}, skipped')
+            else:
+                created += result
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} thumbnail(s)'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} image(s) could not be decoded'))
@@ -0,0 +1,73 @@
+from django.core.files import File as DjangoFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from filesharing.downloads import compute_checksum
+from filesharing.models import Blob, File
+from filesharing.storage import MovableFile, attach_blob, store_blob
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads into the content-addressed blob store and report the space reclaimed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be reclaimed')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        files = File.objects.filter(blob__isnull=True, status='ready').exclude(file='')
+
+        migrated = duplicates = missing = 0
+        reclaimed = 0
+        seen = set()  # digests that would exist after a dry run
+
+        for file_obj in files.iterator(chunk_size=options['batch_size']):
+            storage = file_obj.file.storage
+            name = file_obj.file.name
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing content for {file_obj.pk} ({name}), skipped')
+                continue
+
+            size = storage.size(name)
+            with file_obj.file.open('rb') as fh:
+                digest = compute_checksum(fh)
+
+            if digest in seen or Blob.objects.filter(pk=digest).exists():
+                duplicates += 1
+                reclaimed += size
+            seen.add(digest)
+            migrated += 1
+            if dry_run:
+                continue
+
+            try:
+                content = MovableFile(storage.path(name), size)
+            except NotImplementedError:
+                content = DjangoFile(storage.open(name, 'rb'))
+
+            with transaction.atomic():
+                attach_blob(file_obj, store_blob(content, digest, file_obj.mime_type))
+                file_obj.save(update_fields=['file', 'blob', 'checksum'])
+            content.close()
+
+            # New blobs took the original over by rename; duplicates leave it behind
+            if storage.exists(name):
+                storage.delete(name)
+
+        verb = 'Would migrate' if dry_run else 'Migrated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {migrated} file(s), {duplicates} duplicate(s), '
+            f'{format_bytes(reclaimed)} reclaimed'
+        ))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} file(s) had no stored content'))
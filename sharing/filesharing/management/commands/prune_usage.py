@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from filesharing.usage import prune_usage
+
+
+class Command(BaseCommand):
+    help = 'Delete connection usage rows older than their resolution\'s retention'
+
+    def handle(self, *args, **options):
+        deleted = prune_usage()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} usage row(s)'))
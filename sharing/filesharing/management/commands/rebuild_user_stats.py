@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from filesharing.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized dashboard counters from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only rebuild this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_user_stats(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} user(s)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from filesharing.quotas import rebuild_storage_usage
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user storage usage ledger from the File table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only rebuild this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_storage_usage(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt storage usage for {rebuilt} user(s)'))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from filesharing.heartbeats import sweep_offline_devices
+
+
+class Command(BaseCommand):
+    help = 'Mark devices offline when they have stopped sending heartbeats'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds',
+            type=int,
+            default=settings.DEVICE_OFFLINE_AFTER,
+            help='Mark devices offline after this many seconds without a heartbeat',
+        )
+
+    def handle(self, *args, **options):
+        swept = sweep_offline_devices(timedelta(seconds=options['seconds']))
+        self.stdout.write(self.style.SUCCESS(f'Marked {swept} device(s) offline'))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from filesharing.expiry import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Deactivate expired file and network shares and expire overdue invitations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.EXPIRY_SWEEP_BATCH_SIZE,
+            help='Rows changed per UPDATE (and per transaction)',
+        )
+
+    def handle(self, *args, **options):
+        counts = sweep_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {counts["file_shares"]} file share(s), {counts["network_shares"]} network share(s) '
+            f'and {counts["invitations"]} invitation(s)'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from filesharing.tiering import cold_candidates, get_policy, run_tiering
+
+
+class Command(BaseCommand):
+    help = 'Move content of files nobody downloads anymore to the cold storage tier'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without moving anything')
+        parser.add_argument('--min-age-days', type=int, help='Override TIERING_POLICY["min_age_days"]')
+        parser.add_argument('--idle-days', type=int, help='Override TIERING_POLICY["idle_days"]')
+        parser.add_argument('--max-downloads', type=int, help='Override TIERING_POLICY["max_downloads"]')
+        parser.add_argument('--batch-size', type=int, help='Blobs fetched per candidate query')
+        parser.add_argument('--limit', type=int, help='Stop after this many blobs; the next run carries on')
+
+    def handle(self, *args, **options):
+        policy = get_policy(
+            min_age_days=options['min_age_days'],
+            idle_days=options['idle_days'],
+            max_downloads=options['max_downloads'],
+        )
+        report = run_tiering(policy, batch_size=options['batch_size'], limit=options['limit'], dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            if options['verbosity'] > 1:
+                candidates = cold_candidates(policy)
+                if options['limit'] is not None:
+                    candidates = candidates[:options['limit']]
+                for digest, size in candidates.values_list('digest', 'size').iterator():
+                    self.stdout.write(f'{digest}  {size}')
+            self.stdout.write(f'Would move {report["blobs"]} blob(s), {report["bytes"]} bytes, to the cold tier')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Moved {report["blobs"]} blob(s), {report["bytes"]} bytes, to the cold tier '
+                f'({report["skipped"]} skipped)'
+            ))
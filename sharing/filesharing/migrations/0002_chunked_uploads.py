@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:46
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('ready', 'Ready')], default='ready', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('total_size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('received_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='upload_session', to='filesharing.file')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='filesharing_updated_3eb122_idx')],
+            },
+        ),
+    ]
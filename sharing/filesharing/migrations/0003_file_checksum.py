@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0002_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:49
+
+import django.db.models.deletion
+import filesharing.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0003_file_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to=filesharing.models.blob_upload_to)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='filesharing.blob'),
+        ),
+    ]
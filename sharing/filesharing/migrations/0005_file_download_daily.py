@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0004_blob_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileDownloadDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_downloads', to='filesharing.file')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'unique_together': {('file', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('filesharing', '0005_file_download_daily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('devices_count', models.IntegerField(default=0)),
+                ('networks_count', models.IntegerField(default=0)),
+                ('shared_networks_count', models.IntegerField(default=0)),
+                ('active_connections', models.IntegerField(default=0)),
+                ('pending_invitations', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0006_user_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filecomment',
+            index=models.Index(fields=['file', '-created_at'], name='filesharing_file_id_35533f_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:58
+
+import django.db.models.deletion
+import filesharing.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0007_filecomment_file_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(max_length=20)),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('file', models.FileField(upload_to=filesharing.models.thumbnail_upload_to)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='filesharing.blob')),
+            ],
+            options={
+                'unique_together': {('blob', 'size', 'format')},
+            },
+        ),
+    ]
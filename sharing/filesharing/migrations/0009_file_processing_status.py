@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0008_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('processing', 'Processing'), ('ready', 'Ready')], default='ready', max_length=10),
+        ),
+    ]
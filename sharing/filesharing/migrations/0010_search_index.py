@@ -0,0 +1,100 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FTS_TABLE = 'filesharing_search_fts'
+DOCUMENT_TABLE = 'filesharing_searchdocument'
+
+# External-content FTS5 index over SearchDocument, kept in step by triggers
+CREATE_FTS = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, content='{DOCUMENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+DROP_FTS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return  # other databases use DatabaseSearchBackend
+    for statement in CREATE_FTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_FTS:
+            schema_editor.execute(statement)
+
+
+def index_existing(apps, schema_editor):
+    SearchDocument = apps.get_model('filesharing', 'SearchDocument')
+    File = apps.get_model('filesharing', 'File')
+    FileComment = apps.get_model('filesharing', 'FileComment')
+    WiFiNetwork = apps.get_model('filesharing', 'WiFiNetwork')
+    Device = apps.get_model('filesharing', 'Device')
+
+    def documents():
+        for f in File.objects.filter(status='ready').iterator():
+            yield SearchDocument(kind='file', object_id=f.pk, file_id=f.pk, title=f.filename[:255], body=f'{f.mime_type} {f.file_type}')
+        for c in FileComment.objects.iterator():
+            yield SearchDocument(kind='comment', object_id=c.pk, file_id=c.file_id, title='', body=c.comment)
+        for n in WiFiNetwork.objects.iterator():
+            yield SearchDocument(kind='network', object_id=n.pk, owner_id=n.owner_id, title=n.network_name, body=n.get_security_type_display())
+        for d in Device.objects.iterator():
+            yield SearchDocument(kind='device', object_id=d.pk, owner_id=d.user_id, title=d.device_name, body=d.get_device_type_display())
+
+    batch = []
+    for document in documents():
+        batch.append(document)
+        if len(batch) >= 1000:
+            SearchDocument.objects.bulk_create(batch)
+            batch = []
+    SearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0009_file_processing_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('file', 'File'), ('comment', 'Comment'), ('network', 'Network'), ('device', 'Device')], max_length=10)),
+                ('object_id', models.UUIDField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='filesharing.file')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
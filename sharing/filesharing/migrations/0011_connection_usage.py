@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('bytes_used', models.BigIntegerField(default=0)),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='filesharing.sharednetwork')),
+                ('network', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='filesharing.wifinetwork')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'indexes': [models.Index(fields=['network', 'resolution', 'bucket'], name='usage_network_range_idx'), models.Index(fields=['resolution', 'bucket'], name='usage_retention_idx')],
+                'unique_together': {('connection', 'resolution', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# Expression indexes on auth_user for the recipient typeahead (see typeahead.py).
+# auth.User belongs to another app, so they are created directly rather than
+# through the model state.
+INDEXES = [
+    models.Index(Lower('username'), name='auth_user_username_lower_idx'),
+    models.Index(Lower('email'), name='auth_user_email_lower_idx'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if not schema_editor.connection.features.supports_expression_indexes:
+        return
+    User = apps.get_model('auth', 'User')
+    for index in INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def drop_indexes(apps, schema_editor):
+    if not schema_editor.connection.features.supports_expression_indexes:
+        return
+    User = apps.get_model('auth', 'User')
+    for index in INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('filesharing', '0011_connection_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0012_user_prefix_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fileshare',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expires_at'], name='fileshare_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkinvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='invitation_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkshare',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expires_at'], name='networkshare_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('filesharing', '0013_expiry_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bytes_used', models.BigIntegerField(default=0)),
+                ('file_count', models.IntegerField(default=0)),
+                ('image_bytes', models.BigIntegerField(default=0)),
+                ('document_bytes', models.BigIntegerField(default=0)),
+                ('video_bytes', models.BigIntegerField(default=0)),
+                ('audio_bytes', models.BigIntegerField(default=0)),
+                ('archive_bytes', models.BigIntegerField(default=0)),
+                ('other_bytes', models.BigIntegerField(default=0)),
+                ('quota_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'storage usage',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0014_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='tier',
+            field=models.CharField(choices=[('hot', 'Hot (MEDIA_ROOT)'), ('cold', 'Cold (TIERING_COLD_ROOT)')], default='hot', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='tiered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0015_blob_tier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='encoding',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
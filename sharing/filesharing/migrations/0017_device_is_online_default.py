@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesharing', '0016_blob_encoding'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='device',
+            name='is_online',
+            field=models.BooleanField(default=True),
+        ),
+    ]
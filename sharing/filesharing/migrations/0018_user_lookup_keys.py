@@ -0,0 +1,62 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# The LOWER() expression indexes of 0012, replaced by the UserLookupKey columns
+LOWER_INDEXES = [
+    models.Index(Lower('username'), name='auth_user_username_lower_idx'),
+    models.Index(Lower('email'), name='auth_user_email_lower_idx'),
+]
+
+
+def fill_lookup_keys(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserLookupKey = apps.get_model('filesharing', 'UserLookupKey')
+    users = User.objects.order_by('pk').values_list('pk', 'username', 'email')
+    UserLookupKey.objects.bulk_create(
+        (
+            UserLookupKey(user_id=pk, username=username.lower(), email=email.lower())
+            for pk, username, email in users.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+def drop_lower_indexes(apps, schema_editor):
+    if not schema_editor.connection.features.supports_expression_indexes:
+        return
+    User = apps.get_model('auth', 'User')
+    for index in LOWER_INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+def create_lower_indexes(apps, schema_editor):
+    if not schema_editor.connection.features.supports_expression_indexes:
+        return
+    User = apps.get_model('auth', 'User')
+    for index in LOWER_INDEXES:
+        schema_editor.add_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('filesharing', '0017_device_is_online_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserLookupKey',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lookup_key', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username', models.CharField(db_index=True, max_length=150)),
+                ('email', models.CharField(db_index=True, max_length=254)),
+            ],
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+        migrations.RunPython(drop_lower_indexes, create_lower_indexes),
+    ]
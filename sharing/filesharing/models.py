@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import uuid
 
 class Device(models.Model):
@@ -31,6 +33,24 @@ class Device(models.Model):
         return f"{self.device_name} ({self.device_type})"
 
 
+class WiFiNetworkQuerySet(models.QuerySet):
+    def with_usage(self):
+        """Annotate connected_count, total_data_used and share_count in the same query"""
+        active_shares = (
+            NetworkShare.objects.filter(network=models.OuterRef('pk'), is_active=True)
+            .order_by()
+            .values('network')
+            .annotate(n=models.Count('pk'))
+            .values('n')
+        )
+        return self.annotate(
+            connected_count=models.Count('connected_devices', filter=models.Q(connected_devices__is_connected=True)),
+            total_data_used=Coalesce(models.Sum('connected_devices__data_used'), 0),
+            # A subquery, so joining shares does not multiply the connection rows
+            share_count=Coalesce(models.Subquery(active_shares), 0),
+        )
+
+
 class WiFiNetwork(models.Model):
     """Represents a WiFi network that can be shared"""
     SECURITY_CHOICES = [
@@ -55,6 +75,8 @@ class WiFiNetwork(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = WiFiNetworkQuerySet.as_manager()
+    
     class Meta:
         unique_together = ('owner', 'network_name')
         ordering = ['-updated_at']
@@ -63,6 +85,8 @@ class WiFiNetwork(models.Model):
         return f"{self.network_name} - {self.security_type}"
     
     def connected_devices_count(self):
+        if hasattr(self, 'connected_count'):  # annotated by with_usage()
+            return self.connected_count
         return self.connected_devices.filter(is_connected=True).count()
 
 
@@ -85,6 +109,32 @@ class SharedNetwork(models.Model):
         return f"{self.device.device_name} -> {self.network.network_name}"
 
 
+class ConnectionUsage(models.Model):
+    """Bytes used by a connection during one minute, hour or day"""
+    RESOLUTION_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    connection = models.ForeignKey(SharedNetwork, on_delete=models.CASCADE, related_name='usage')
+    network = models.ForeignKey(WiFiNetwork, on_delete=models.CASCADE, related_name='usage')
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()  # start of the minute, hour or day
+    bytes_used = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('connection', 'resolution', 'bucket')
+        indexes = [
+            models.Index(fields=['network', 'resolution', 'bucket'], name='usage_network_range_idx'),
+            models.Index(fields=['resolution', 'bucket'], name='usage_retention_idx'),
+        ]
+        ordering = ['bucket']
+
+    def __str__(self):
+        return f"{self.connection_id} {self.resolution} {self.bucket}: {self.bytes_used}"
+
+
 class NetworkShare(models.Model):
     """Manages sharing permissions for networks"""
     PERMISSION_CHOICES = [
@@ -104,6 +154,10 @@ class NetworkShare(models.Model):
     class Meta:
         unique_together = ('network', 'shared_with_user')
         ordering = ['-created_at']
+        indexes = [
+            # Only live shares can expire; partial so the sweeper's scan stays small
+            models.Index(fields=['expires_at'], condition=models.Q(is_active=True), name='networkshare_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"{self.network.network_name} shared with {self.shared_with_user.username}"
@@ -130,13 +184,122 @@ class NetworkInvitation(models.Model):
     class Meta:
         unique_together = ('network', 'invited_user')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='invitation_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"Invitation: {self.network.network_name} to {self.invited_user.username}"
 
 
+class UserStats(models.Model):
+    """Denormalized per-user counters for the dashboard, kept current by signals"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    devices_count = models.IntegerField(default=0)
+    networks_count = models.IntegerField(default=0)
+    shared_networks_count = models.IntegerField(default=0)
+    active_connections = models.IntegerField(default=0)
+    pending_invitations = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"Stats for {self.user.username}"
+
+
+class StorageUsage(models.Model):
+    """Per-user ledger of stored bytes, in total and by file type, kept current by quotas.py"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    bytes_used = models.BigIntegerField(default=0)
+    file_count = models.IntegerField(default=0)
+    image_bytes = models.BigIntegerField(default=0)
+    document_bytes = models.BigIntegerField(default=0)
+    video_bytes = models.BigIntegerField(default=0)
+    audio_bytes = models.BigIntegerField(default=0)
+    archive_bytes = models.BigIntegerField(default=0)
+    other_bytes = models.BigIntegerField(default=0)
+    quota_bytes = models.BigIntegerField(null=True, blank=True)  # overrides settings.STORAGE_QUOTA_BYTES
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'storage usage'
+    
+    def __str__(self):
+        return f"Storage used by {self.user.username}"
+
+
+class UserLookupKey(models.Model):
+    """A user's username and email lowercased in Python, for the recipient typeahead (see typeahead.py)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='lookup_key')
+    username = models.CharField(max_length=150, db_index=True)
+    email = models.CharField(max_length=254, db_index=True)
+    
+    def __str__(self):
+        return f"Lookup keys of {self.user_id}"
+
+
 # ============ FILE SHARING MODELS ============
 
+def blob_upload_to(instance, filename):
+    """Store blobs under their digest, fanned out over two directory levels"""
+    digest = instance.digest
+    return f'blobs/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+class Blob(models.Model):
+    """Content-addressed file content, stored once and shared by every File with the same bytes"""
+    TIER_CHOICES = [
+        ('hot', 'Hot (MEDIA_ROOT)'),
+        ('cold', 'Cold (TIERING_COLD_ROOT)'),
+    ]
+    
+    digest = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the content
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField()  # in bytes, uncompressed
+    encoding = models.CharField(max_length=10, blank=True, default='')  # 'gzip' when stored compressed
+    stored_size = models.BigIntegerField(null=True, blank=True)  # bytes on disk when compressed
+    ref_count = models.IntegerField(default=0)  # number of File rows using this blob
+    tier = models.CharField(max_length=4, choices=TIER_CHOICES, default='hot')
+    tiered_at = models.DateTimeField(null=True, blank=True)  # last move between tiers
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.ref_count} refs)"
+
+
+def thumbnail_upload_to(instance, filename):
+    """Store derivatives next to their blob, e.g. thumbnails/ab/cd/<digest>-medium.webp"""
+    d = instance.blob_id
+    return f"thumbnails/{d[:2]}/{d[2:4]}/{filename}"
+
+
+class Thumbnail(models.Model):
+    """A downscaled rendition of an image blob at one of settings.THUMBNAIL_SIZES"""
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+    
+    blob = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name='thumbnails')
+    size = models.CharField(max_length=20)  # key of settings.THUMBNAIL_SIZES
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    file = models.FileField(upload_to=thumbnail_upload_to)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['blob', 'size', 'format']
+    
+    def __str__(self):
+        return f"{self.blob_id[:12]} {self.size} ({self.format})"
+
+
 class File(models.Model):
     """Represents an uploaded file"""
     FILE_TYPE_CHOICES = [
@@ -148,15 +311,24 @@ class File(models.Model):
         ('other', 'Other'),
     ]
     
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files')
     file = models.FileField(upload_to='files/%Y/%m/%d/')
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
     filename = models.CharField(max_length=255)
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES, default='other')
     file_size = models.BigIntegerField()  # in bytes
     mime_type = models.CharField(max_length=100, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 of the content
     is_public = models.BooleanField(default=False)
     download_count = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ready')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -190,6 +362,45 @@ class File(models.Model):
         return f"{self.file_size:.1f} TB"
 
 
+class FileDownloadDaily(models.Model):
+    """Number of downloads of a file on a given day"""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='daily_downloads')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('file', 'day')
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.file.filename} on {self.day}: {self.count}"
+
+
+class UploadSession(models.Model):
+    """Tracks a resumable, chunked upload into a pending File"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.OneToOneField(File, on_delete=models.CASCADE, related_name='upload_session')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    total_size = models.BigIntegerField()  # in bytes
+    chunk_size = models.IntegerField()  # in bytes
+    received_bytes = models.BigIntegerField(default=0)  # last acknowledged offset
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Upload of {self.file.filename} ({self.received_bytes}/{self.total_size})"
+    
+    def is_complete(self):
+        """Check if every byte of the file has been received"""
+        return self.received_bytes >= self.total_size
+
+
 class FileShare(models.Model):
     """Manages file sharing permissions"""
     PERMISSION_CHOICES = [
@@ -208,6 +419,10 @@ class FileShare(models.Model):
     class Meta:
         unique_together = ('file', 'shared_with_user')
         ordering = ['-created_at']
+        indexes = [
+            # Only live shares can expire; partial so the sweeper's scan stays small
+            models.Index(fields=['expires_at'], condition=models.Q(is_active=True), name='fileshare_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"{self.file.filename} shared with {self.shared_with_user.username}"
@@ -229,6 +444,34 @@ class FileComment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['file', '-created_at']),
+        ]
     
     def __str__(self):
         return f"Comment by {self.user.username} on {self.file.filename}"
+
+
+class SearchDocument(models.Model):
+    """One searchable object (file, comment, network or device), kept in sync by signals"""
+    KIND_CHOICES = [
+        ('file', 'File'),
+        ('comment', 'Comment'),
+        ('network', 'Network'),
+        ('device', 'Device'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    # Visibility: files and comments follow the file's access rules,
+    # networks and devices are only visible to their owner
+    file = models.ForeignKey(File, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    
+    class Meta:
+        unique_together = ['kind', 'object_id']
+    
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
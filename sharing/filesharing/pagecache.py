@@ -0,0 +1,161 @@
+"""
+Per-user caching of rendered pages.
+
+Views wrapped in cache_per_user() serve the rendered page from the cache
+until something it shows changes. The cache key combines the URL, the
+user, the user's CSRF secret (the pages embed forms) and the user's
+current version of every model family the page reads: ``devices``,
+``networks`` or ``files``. A change replaces the version with a fresh
+random value for every user who can see the changed row, so older entries
+stop matching and simply expire. The signal handlers in signals.py do this
+after commit; bulk writers that skip signals call bump_versions()
+themselves.
+
+Who can see a changed row is worked out from the row itself wherever it
+can be: the owner of a share, connection or invitation is read from its
+already loaded network or file (the views load it anyway), from the
+network or file whose deletion removed it, or from ``invited_by``; and
+nothing can be shared yet when a device, network or file is created.
+Only edits that other users see (a renamed device, network or file) look
+up who they are. Saves that only touch HEARTBEAT_TIMESTAMPS, which agents
+refresh constantly, invalidate nothing: a cached page may show a last-seen
+time up to PAGE_CACHE_SECONDS old, but never a stale online status.
+
+Only successful GETs by logged-in users are cached, and requests with
+flash messages waiting to be shown bypass the cache. The default
+cache is per process, which is fine for development. Production needs a
+backend shared by all workers (Redis or Memcached) so that every worker
+sees each version bump.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+
+from .models import Device, File, FileShare, NetworkInvitation, NetworkShare, SharedNetwork, WiFiNetwork
+
+DEVICES = 'devices'
+NETWORKS = 'networks'
+FILES = 'files'
+
+# Timestamps refreshed by every heartbeat; changing only these keeps cached pages
+HEARTBEAT_TIMESTAMPS = {'last_seen', 'last_activity'}
+
+
+def _version_key(family, user_id):
+    return f'page-version:{family}:{user_id}'
+
+
+def _versions(families, user_id):
+    keys = [_version_key(family, user_id) for family in families]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        # An evicted version must never come back with a value used before
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(family, user_ids):
+    """Invalidate every cached ``family`` page of the given users"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        cache.set_many({_version_key(family, user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def _cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and request.user.is_authenticated
+        # Without a CSRF cookie yet the page would embed a token the client never received
+        and request.META.get('CSRF_COOKIE')
+        and not len(get_messages(request))
+    )
+
+
+def page_key(request, families):
+    """Cache key of the page for this request and the current family versions"""
+    parts = [request.get_full_path(), str(request.user.pk), request.META['CSRF_COOKIE']]
+    parts.extend(_versions(families, request.user.pk))
+    digest = hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+    return f'page:{request.user.pk}:{digest}'
+
+
+def cache_per_user(*families):
+    """Cache a view's page per user until a row of one of ``families`` they can see changes"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+            key = page_key(request, families)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies \
+                        and not len(get_messages(request)):
+                    cache.set(key, response, settings.PAGE_CACHE_SECONDS)
+            return response
+        return wrapper
+    return decorator
+
+
+def _owner_id(instance, parent, origin=None):
+    """owner_id of the network or file ``instance`` belongs to, from the loaded parent when there is one"""
+    field = instance._meta.get_field(parent)
+    if field.is_cached(instance):
+        return getattr(instance, parent).owner_id
+    if isinstance(origin, field.related_model) and origin.pk == getattr(instance, field.attname):
+        # Deleted along with its parent
+        return origin.owner_id
+    return field.related_model.objects.filter(pk=getattr(instance, field.attname)) \
+        .values_list('owner_id', flat=True).first()
+
+
+def affected_pages(instance, created=False, origin=None):
+    """
+    ``{family: user_ids}`` of the cached pages that can show ``instance``.
+
+    ``origin`` is the object whose delete() removed ``instance``, if any.
+    """
+    if isinstance(instance, Device):
+        if created:
+            return {DEVICES: {instance.user_id}}
+        # Network owners see the names of devices connected to their networks
+        owners = SharedNetwork.objects.filter(device_id=instance.pk).values_list('network__owner_id', flat=True)
+        return {DEVICES: {instance.user_id}, NETWORKS: {instance.user_id, *owners}}
+    if isinstance(instance, WiFiNetwork):
+        if created:
+            return {NETWORKS: {instance.owner_id}}
+        recipients = NetworkShare.objects.filter(network_id=instance.pk, is_active=True) \
+            .values_list('shared_with_user_id', flat=True)
+        return {NETWORKS: {instance.owner_id, *recipients}}
+    if isinstance(instance, NetworkInvitation):
+        # Only a network's owner can invite to it
+        return {NETWORKS: {instance.invited_by_id}}
+    if isinstance(instance, SharedNetwork):
+        return {NETWORKS: {_owner_id(instance, 'network', origin)}}
+    if isinstance(instance, NetworkShare):
+        return {NETWORKS: {_owner_id(instance, 'network', origin), instance.shared_with_user_id}}
+    if isinstance(instance, File):
+        if created:
+            return {FILES: {instance.owner_id}}
+        recipients = FileShare.objects.filter(file_id=instance.pk, is_active=True) \
+            .values_list('shared_with_user_id', flat=True)
+        return {FILES: {instance.owner_id, *recipients}}
+    if isinstance(instance, FileShare):
+        return {FILES: {_owner_id(instance, 'file', origin), instance.shared_with_user_id}}
+    raise TypeError(f'{type(instance).__name__} is not shown on cached pages')
+
+
+def bump_pages(pages):
+    """bump_versions() for every family in an affected_pages() result"""
+    for family, user_ids in pages.items():
+        bump_versions(family, user_ids)
+
+
+CACHED_MODELS = (Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare)
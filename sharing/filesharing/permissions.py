@@ -0,0 +1,98 @@
+"""
+Effective permission of a user on a File.
+
+Every file endpoint asks get_file_permission() instead of checking owner,
+shares and is_public itself. Owner and public access come from the File
+row already loaded by the view; the user's FileShare (the only part that
+needs a query) is cached in the shared cache for
+FILE_PERMISSION_CACHE_SECONDS and dropped by the FileShare signals in
+signals.py whenever a share is created, changed or revoked. Results are
+also memoized on the request. Share expiry is checked on every lookup, so
+a cached share stops granting access the moment it expires.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import File, FileShare
+
+VIEW = 'view'
+DOWNLOAD = 'download'
+OWNER = 'owner'
+
+# Each level includes everything below it
+RANKS = {None: 0, VIEW: 1, DOWNLOAD: 2, OWNER: 3}
+
+_NO_SHARE = 'none'  # cached marker for "no usable share"
+
+
+def _share_key(file_id, user_id):
+    return f'file-share:{file_id}:{user_id}'
+
+
+def _share_grant(file_id, user_id):
+    """(permission_level, expires_at) of the user's active share, cached; None if there is none"""
+    key = _share_key(file_id, user_id)
+    grant = cache.get(key)
+    if grant is None:
+        share = (
+            FileShare.objects.filter(file_id=file_id, shared_with_user_id=user_id, is_active=True)
+            .values_list('permission_level', 'expires_at')
+            .first()
+        )
+        grant = share or _NO_SHARE
+        cache.set(key, grant, settings.FILE_PERMISSION_CACHE_SECONDS)
+    return None if grant == _NO_SHARE else grant
+
+
+def resolve_permission(user, file_obj):
+    """The strongest permission ``user`` has on ``file_obj``: OWNER, DOWNLOAD, VIEW or None"""
+    if user.is_authenticated and file_obj.owner_id == user.id:
+        return OWNER
+    permission = DOWNLOAD if file_obj.is_public else None
+    if user.is_authenticated and permission is None:
+        grant = _share_grant(file_obj.pk, user.id)
+        if grant is not None:
+            level, expires_at = grant
+            if expires_at is None or expires_at > timezone.now():
+                permission = level
+    return permission
+
+
+def get_file_permission(request, file_obj):
+    """resolve_permission() for the requesting user, memoized for the rest of the request"""
+    memo = request.__dict__.setdefault('_file_permissions', {})
+    if file_obj.pk not in memo:
+        memo[file_obj.pk] = resolve_permission(request.user, file_obj)
+    return memo[file_obj.pk]
+
+
+def has_file_permission(request, file_obj, needed):
+    """Whether the requesting user holds at least the ``needed`` level on the file"""
+    return RANKS[get_file_permission(request, file_obj)] >= RANKS[needed]
+
+
+def downloadable_files(user, file_ids):
+    """The ready files among ``file_ids`` that ``user`` may download, checked in a single query"""
+    now = timezone.now()
+    usable_share = FileShare.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        file=OuterRef('pk'),
+        shared_with_user_id=user.id,
+        is_active=True,
+        permission_level=DOWNLOAD,
+    )
+    return File.objects.filter(pk__in=file_ids, status='ready').filter(
+        Q(owner_id=user.id) | Q(is_public=True) | Exists(usable_share)
+    )
+
+
+def invalidate_share(file_id, user_id):
+    """Forget the cached share of one user on one file"""
+    cache.delete(_share_key(file_id, user_id))
+
+
+def invalidate_shares(pairs):
+    """Forget cached shares for many (file_id, user_id) pairs, e.g. after a bulk update"""
+    cache.delete_many([_share_key(file_id, user_id) for file_id, user_id in pairs])
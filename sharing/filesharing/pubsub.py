@@ -0,0 +1,64 @@
+"""
+Publish/subscribe channels for server-push updates.
+
+publish() may be called from any thread (sync views run in a thread pool
+under ASGI); subscribers are asyncio queues consumed by streaming views.
+InMemoryBroker only reaches subscribers in the current process. With more
+than one ASGI worker, point settings.PUBSUB_BACKEND at a broker backed by a
+shared service that implements the same publish()/subscribe() interface.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Messages held for a slow subscriber before new ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        pass  # the client catches up through the JSON API
+
+
+class InMemoryBroker:
+    """Process-local broker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                pass  # subscriber's event loop has shut down
+
+    def subscribe(self, channel):
+        """Return a queue receiving every message published on ``channel``; call from the event loop"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[channel].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        """Stop delivering messages to a queue returned by subscribe()"""
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """The process-wide broker configured in settings.PUBSUB_BACKEND"""
+    return import_string(settings.PUBSUB_BACKEND)()
@@ -0,0 +1,132 @@
+"""
+Per-user storage accounting and quotas.
+
+StorageUsage holds one row per user with the bytes their files take, in
+total and per File.file_type, so checking a quota or showing usage is a
+primary key lookup instead of a Sum() over File. Files count at their
+logical size even when the blob store shares their content with another
+file, and from the moment their row exists: a chunked upload reserves its
+declared size when the session is opened.
+
+charge() books a new file inside the transaction that creates it, with a
+single UPDATE that matches no row when the file would not fit, so
+concurrent uploads cannot overshoot the quota. Deleted files are refunded
+by the File post_delete signal. Multipart uploads are also checked while
+they stream (uploadhandlers.QuotaUploadHandler), so an oversize file is
+dropped before it is written out. rebuild_storage_usage() recomputes the
+ledger from File with one grouped query, for users without a row yet and
+for drift repair (the ``reconcile_storage`` command).
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .db import upsert_options
+from .models import File, StorageUsage
+
+FILE_TYPES = [file_type for file_type, _ in File.FILE_TYPE_CHOICES]
+
+USAGE_FIELDS = ('bytes_used', 'file_count', *[f'{file_type}_bytes' for file_type in FILE_TYPES])
+
+# Ledger rows written per INSERT during a full rebuild
+REBUILD_BATCH_SIZE = 1000
+
+
+class QuotaExceeded(Exception):
+    """Storing a file would take a user over their storage quota"""
+
+
+def _type_field(file_type):
+    return f'{file_type if file_type in FILE_TYPES else "other"}_bytes'
+
+
+def _increments(deltas):
+    """UPDATE kwargs adding ``{field: n}`` to the ledger columns"""
+    updates = {field: F(field) + n for field, n in deltas.items() if n}
+    updates['updated_at'] = timezone.now()
+    return updates
+
+
+def rebuild_storage_usage(user_ids=None):
+    """Recompute ledger rows from File; all users if ``user_ids`` is None"""
+    files = File.objects.all()
+    users = User.objects.all()
+    if user_ids is not None:
+        files = files.filter(owner_id__in=user_ids)
+        users = users.filter(pk__in=user_ids)
+
+    totals = defaultdict(Counter)
+    grouped = files.values_list('owner_id', 'file_type').annotate(size=Sum('file_size'), n=Count('pk')).order_by()
+    for owner_id, file_type, size, n in grouped:
+        totals[owner_id].update({'bytes_used': size, 'file_count': n, _type_field(file_type): size})
+
+    rows = [
+        StorageUsage(user_id=user_id, **{field: totals[user_id][field] for field in USAGE_FIELDS})
+        for user_id in users.values_list('pk', flat=True)
+    ]
+    StorageUsage.objects.bulk_create(
+        rows,
+        batch_size=REBUILD_BATCH_SIZE,
+        **upsert_options(['user'], [*USAGE_FIELDS, 'updated_at']),  # an admin-set quota_bytes is kept
+    )
+    return len(rows)
+
+
+def get_storage_usage(user):
+    """Fetch a user's ledger row with one lookup, building it on first use"""
+    try:
+        return StorageUsage.objects.get(user=user)
+    except StorageUsage.DoesNotExist:
+        rebuild_storage_usage([user.pk])
+        return StorageUsage.objects.get(user=user)
+
+
+def quota_of(usage):
+    """The quota in bytes that applies to a ledger row; None means unlimited"""
+    return usage.quota_bytes if usage.quota_bytes is not None else settings.STORAGE_QUOTA_BYTES
+
+
+def remaining_bytes(user):
+    """Bytes ``user`` may still store, or None when they have no quota"""
+    usage = get_storage_usage(user)
+    quota = quota_of(usage)
+    return None if quota is None else max(quota - usage.bytes_used, 0)
+
+
+def charge(user, file_type, size):
+    """Book a new file of ``size`` bytes for ``user``; raises QuotaExceeded if it does not fit"""
+    fits = Q(quota_bytes__isnull=False, bytes_used__lte=F('quota_bytes') - size)
+    if settings.STORAGE_QUOTA_BYTES is None:
+        fits |= Q(quota_bytes__isnull=True)
+    else:
+        fits |= Q(quota_bytes__isnull=True, bytes_used__lte=settings.STORAGE_QUOTA_BYTES - size)
+    updates = _increments({'bytes_used': size, 'file_count': 1, _type_field(file_type): size})
+
+    for attempt in range(2):
+        if StorageUsage.objects.filter(fits, user_id=user.pk).update(**updates):
+            return
+        if attempt or StorageUsage.objects.filter(user_id=user.pk).exists():
+            break
+        rebuild_storage_usage([user.pk])
+    raise QuotaExceeded('Not enough storage space left for this file')
+
+
+def refund(user_id, file_type, size):
+    """Take a deleted file of ``size`` bytes off the ledger"""
+    StorageUsage.objects.filter(user_id=user_id).update(
+        **_increments({'bytes_used': -size, 'file_count': -1, _type_field(file_type): -size})
+    )
+
+
+def retype(changes):
+    """Move bytes between type columns for ``(owner_id, old_type, new_type, size)`` reclassifications"""
+    deltas = defaultdict(Counter)
+    for owner_id, old_type, new_type, size in changes:
+        deltas[owner_id].update({_type_field(new_type): size})
+        deltas[owner_id].subtract({_type_field(old_type): size})
+    for owner_id, fields in deltas.items():
+        if any(fields.values()):
+            StorageUsage.objects.filter(user_id=owner_id).update(**_increments(fields))
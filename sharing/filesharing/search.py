@@ -0,0 +1,223 @@
+"""
+Full-text search over files, comments, networks and devices.
+
+Every searchable object has a SearchDocument row, kept current by the
+save/delete signals in signals.py (bulk writes call index_objects()
+themselves). The backend named by settings.SEARCH_BACKEND answers queries:
+
+- SQLiteFTSBackend matches against an FTS5 inverted index built over
+  SearchDocument (an external-content table maintained by triggers, see
+  migration 0010) and ranks hits with BM25. Lookups go through the index,
+  so their cost follows the number of matches, not the size of the tables.
+- DatabaseSearchBackend falls back to icontains on SearchDocument for
+  databases without FTS5.
+
+Either way results only include what the user may see: their own networks
+and devices, and files (with their comments) they own, can access through
+an active share (expired shares are deactivated by expiry.py), or that
+are public.
+"""
+import re
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.utils.module_loading import import_string
+
+from .models import Device, File, FileComment, FileShare, SearchDocument, WiFiNetwork
+
+FTS_TABLE = 'filesharing_search_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def document_for(instance):
+    """The SearchDocument fields for an object, or None if it should not be searchable"""
+    if isinstance(instance, File):
+        if instance.status != 'ready':
+            return None
+        return {'kind': 'file', 'file_id': instance.pk, 'owner_id': None,
+                'title': instance.filename, 'body': f'{instance.mime_type} {instance.file_type}'}
+    if isinstance(instance, FileComment):
+        return {'kind': 'comment', 'file_id': instance.file_id, 'owner_id': None,
+                'title': '', 'body': instance.comment}
+    if isinstance(instance, WiFiNetwork):
+        return {'kind': 'network', 'file_id': None, 'owner_id': instance.owner_id,
+                'title': instance.network_name, 'body': instance.get_security_type_display()}
+    if isinstance(instance, Device):
+        return {'kind': 'device', 'file_id': None, 'owner_id': instance.user_id,
+                'title': instance.device_name, 'body': instance.get_device_type_display()}
+    raise TypeError(f'{type(instance).__name__} is not searchable')
+
+
+KIND_OF = {File: 'file', FileComment: 'comment', WiFiNetwork: 'network', Device: 'device'}
+MODEL_OF = {kind: model for model, kind in KIND_OF.items()}
+
+
+def index_objects(instances):
+    """Add or refresh the documents of ``instances``, dropping those no longer searchable"""
+    rows, stale = [], []
+    for instance in instances:
+        fields = document_for(instance)
+        if fields is None:
+            stale.append(instance)
+        else:
+            fields['title'] = fields['title'][:255]
+            rows.append(SearchDocument(object_id=instance.pk, **fields))
+    if rows:
+        SearchDocument.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['kind', 'object_id'],
+            update_fields=['file', 'owner', 'title', 'body'],
+        )
+    remove_objects(stale)
+
+
+def remove_objects(instances):
+    """Drop the documents of ``instances``"""
+    by_kind = {}
+    for instance in instances:
+        by_kind.setdefault(KIND_OF[type(instance)], []).append(instance.pk)
+    for kind, ids in by_kind.items():
+        SearchDocument.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+def rebuild_index(batch_size=1000):
+    """Recreate every document from the source tables; returns the number indexed"""
+    SearchDocument.objects.all().delete()
+    total = 0
+    for model in KIND_OF:
+        queryset = model.objects.all()
+        if model is File:
+            queryset = queryset.filter(status='ready')
+        batch = []
+        for instance in queryset.iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) >= batch_size:
+                index_objects(batch)
+                total += len(batch)
+                batch = []
+        index_objects(batch)
+        total += len(batch)
+    get_search_backend().optimize()
+    return total
+
+
+def visible_documents(user):
+    """SearchDocuments ``user`` may see"""
+    usable_share = FileShare.objects.filter(
+        file=OuterRef('file_id'),
+        shared_with_user_id=user.id,
+        is_active=True,
+    )
+    return SearchDocument.objects.filter(
+        Q(kind__in=['network', 'device'], owner_id=user.id)
+        | Q(kind__in=['file', 'comment'], file__status='ready') & (
+            Q(file__owner_id=user.id) | Q(file__is_public=True) | Exists(usable_share)
+        )
+    )
+
+
+class SearchBackend:
+    """Interface of the pluggable search backends"""
+
+    def search(self, user, query, offset=0, limit=20):
+        """(kind, object_id) pairs of the documents matching ``query``, best first"""
+        raise NotImplementedError
+
+    def optimize(self):
+        """Compact the index after bulk changes"""
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Ranked matching through the SQLite FTS5 index"""
+
+    def match_expression(self, query):
+        # Quote every token so user input is never parsed as FTS5 syntax;
+        # the last one also matches as a prefix for search-as-you-type
+        tokens = TOKEN_RE.findall(query)
+        terms = [f'"{token}"' for token in tokens]
+        if terms:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, user, query, offset=0, limit=20):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        documents = SearchDocument._meta.db_table
+        # FTS5 drives the query; the visibility rules are correlated lookups
+        # evaluated for the matched rows only
+        sql = f"""
+            SELECT d.kind, d.object_id
+            FROM {FTS_TABLE} JOIN {documents} d ON d.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND (
+                (d.kind IN ('network', 'device') AND d.owner_id = %s)
+                OR (d.kind IN ('file', 'comment') AND EXISTS (
+                    SELECT 1 FROM {File._meta.db_table} f
+                    WHERE f.id = d.file_id AND f.status = 'ready' AND (
+                        f.owner_id = %s OR f.is_public OR EXISTS (
+                            SELECT 1 FROM {FileShare._meta.db_table} s
+                            WHERE s.file_id = f.id AND s.shared_with_user_id = %s AND s.is_active
+                        )
+                    )
+                ))
+            )
+            ORDER BY bm25({FTS_TABLE}, 10.0, 1.0)
+            LIMIT %s OFFSET %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [expression, user.id, user.id, user.id, limit, offset])
+            return [(kind, uuid.UUID(object_id)) for kind, object_id in cursor.fetchall()]
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """Substring matching for databases without an FTS5 index (unranked, scans the table)"""
+
+    def search(self, user, query, offset=0, limit=20):
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+        documents = visible_documents(user)
+        for token in tokens:
+            documents = documents.filter(Q(title__icontains=token) | Q(body__icontains=token))
+        return list(documents.order_by('kind', 'title').values_list('kind', 'object_id')[offset:offset + limit])
+
+
+def get_search_backend():
+    """Instantiate the backend configured in settings.SEARCH_BACKEND"""
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def search(user, query, page=1, per_page=20):
+    """
+    One page of search results for ``user``, best matches first.
+
+    Returns ``(results, has_next)`` where each result is a dict with the
+    ``kind`` and the loaded ``object``.
+    """
+    offset = (page - 1) * per_page
+    hits = get_search_backend().search(user, query, offset=offset, limit=per_page + 1)
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+
+    ids_by_kind = {}
+    for kind, object_id in hits:
+        ids_by_kind.setdefault(kind, []).append(object_id)
+    related = {'file': ['owner'], 'comment': ['user', 'file'], 'network': [], 'device': []}
+    loaded = {
+        kind: MODEL_OF[kind].objects.select_related(*related[kind]).in_bulk(ids)
+        for kind, ids in ids_by_kind.items()
+    }
+    results = [
+        {'kind': kind, 'object': loaded[kind][object_id]}
+        for kind, object_id in hits
+        if object_id in loaded[kind]
+    ]
+    return results, has_next
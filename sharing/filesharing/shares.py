@@ -0,0 +1,113 @@
+"""
+Sharing a file with many users at once.
+
+bulk_share() resolves every recipient with one query, finds the existing
+shares with one IN lookup, reactivates revoked ones with one UPDATE and
+inserts the rest with a single bulk_create, all in one transaction. Bulk
+writes skip model signals, so the permission cache and the cached pages
+of the recipients are invalidated here.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from . import pagecache, permissions
+from .models import FileShare
+
+# Hard cap on recipients per request
+MAX_RECIPIENTS = 1000
+
+
+class ShareError(Exception):
+    """A bulk share request that cannot be processed as a whole"""
+
+
+def _resolve_recipients(recipients):
+    """Map each requested id or username to its user id (None if unknown)"""
+    ids, usernames = set(), set()
+    for recipient in recipients:
+        if isinstance(recipient, int) or (isinstance(recipient, str) and recipient.isdigit()):
+            ids.add(int(recipient))
+        elif isinstance(recipient, str) and recipient.strip():
+            usernames.add(recipient.strip())
+
+    users = User.objects.filter(Q(id__in=ids) | Q(username__in=usernames)).values_list('id', 'username')
+    by_id, by_username = {}, {}
+    for user_id, username in users:
+        by_id[user_id] = user_id
+        by_username[username] = user_id
+
+    resolved = {}
+    for recipient in recipients:
+        key = str(recipient).strip()
+        if key.isdigit():
+            # A numeric string may also be somebody's username
+            resolved[key] = by_id.get(int(key)) or by_username.get(key)
+        else:
+            resolved[key] = by_username.get(key)
+    return resolved
+
+
+def bulk_share(file_obj, recipients, permission_level='download', expires_at=None):
+    """
+    Share ``file_obj`` with every user in ``recipients`` (ids or usernames).
+
+    Returns one ``{'recipient', 'user_id', 'status'}`` entry per distinct
+    recipient; status is one of ``shared``, ``reactivated``,
+    ``already_shared``, ``not_found`` or ``owner``.
+    """
+    if permission_level not in dict(FileShare.PERMISSION_CHOICES):
+        raise ShareError('Invalid permission level')
+    if len(recipients) > MAX_RECIPIENTS:
+        raise ShareError(f'At most {MAX_RECIPIENTS} recipients per request')
+
+    resolved = _resolve_recipients(recipients)
+    user_ids = {user_id for user_id in resolved.values() if user_id and user_id != file_obj.owner_id}
+
+    with transaction.atomic():
+        existing = dict(
+            FileShare.objects.select_for_update()
+            .filter(file=file_obj, shared_with_user_id__in=user_ids)
+            .values_list('shared_with_user_id', 'is_active')
+        )
+        revoked = [user_id for user_id, is_active in existing.items() if not is_active]
+        new = user_ids - existing.keys()
+
+        if revoked:
+            FileShare.objects.filter(file=file_obj, shared_with_user_id__in=revoked).update(
+                is_active=True,
+                permission_level=permission_level,
+                expires_at=expires_at,
+            )
+        FileShare.objects.bulk_create(
+            [
+                FileShare(
+                    file=file_obj,
+                    shared_with_user_id=user_id,
+                    permission_level=permission_level,
+                    expires_at=expires_at,
+                )
+                for user_id in new
+            ],
+            ignore_conflicts=True,  # a concurrent request may have shared it meanwhile
+        )
+        changed = [(file_obj.pk, user_id) for user_id in [*revoked, *new]]
+        transaction.on_commit(lambda: permissions.invalidate_shares(changed))
+        transaction.on_commit(lambda: pagecache.bump_versions(
+            pagecache.FILES, [file_obj.owner_id, *revoked, *new]
+        ))
+
+    report = []
+    for recipient, user_id in resolved.items():
+        if user_id is None:
+            status = 'not_found'
+        elif user_id == file_obj.owner_id:
+            status = 'owner'
+        elif user_id in new:
+            status = 'shared'
+        elif user_id in revoked:
+            status = 'reactivated'
+        else:
+            status = 'already_shared'
+        report.append({'recipient': recipient, 'user_id': user_id, 'status': status})
+    return report
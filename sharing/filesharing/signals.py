@@ -0,0 +1,132 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import pagecache, permissions, quotas, search, stats, typeahead
+from .comments import comment_channel, serialize_comment
+from .models import File, FileComment, FileShare
+from .pubsub import get_broker
+from .storage import release_blob
+from .thumbnails import schedule_thumbnails
+
+
+@receiver(post_delete, sender=File)
+def release_file_content(sender, instance, **kwargs):
+    """Drop the deleted File's reference to its stored content"""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        # Legacy upload stored outside the blob store
+        instance.file.delete(save=False)
+
+
+@receiver(post_delete, sender=File)
+def refund_storage(sender, instance, **kwargs):
+    """Give the owner back the quota the deleted File used"""
+    quotas.refund(instance.owner_id, instance.file_type, instance.file_size)
+
+
+@receiver(post_save, sender=File)
+def queue_thumbnails(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Render thumbnails in the background once an image's content is attached"""
+    if raw:
+        return
+    if created or (update_fields and 'blob' in update_fields):
+        schedule_thumbnails(instance)
+
+
+@receiver(post_save, sender=FileShare)
+@receiver(post_delete, sender=FileShare)
+def invalidate_share_permission(sender, instance, **kwargs):
+    """Drop the cached permission a share granted as soon as it changes"""
+    permissions.invalidate_share(instance.file_id, instance.shared_with_user_id)
+
+
+@receiver(post_save, sender=FileComment)
+def publish_comment(sender, instance, created, raw=False, **kwargs):
+    """Push new comments to everyone streaming the file's comments"""
+    if created and not raw:
+        channel = comment_channel(instance.file_id)
+        message = serialize_comment(instance)
+        transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+
+# ============ Dashboard Counters ============
+
+def remember_stats_fields(sender, instance, **kwargs):
+    """Keep the values the dashboard counters depend on, to diff against on save"""
+    instance._stats_snapshot = stats.snapshot(instance)
+
+
+def update_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """Apply the counter changes caused by creating or updating a row"""
+    if raw:
+        return
+    old = None if created else instance._stats_snapshot
+    new = stats.snapshot(instance)
+    if not created and old is None:
+        # Loaded with deferred fields: the previous state is unknown
+        stats.rebuild_user_stats(stats.affected_users(instance))
+    else:
+        stats.apply_delta(stats.contributions(sender, old), stats.contributions(sender, new))
+    instance._stats_snapshot = new
+
+
+def update_stats_on_delete(sender, instance, **kwargs):
+    """Remove a deleted row's contribution from the counters"""
+    values = stats.snapshot(instance)
+    if values is None:
+        stats.rebuild_user_stats(stats.affected_users(instance))
+    else:
+        stats.apply_delta(stats.contributions(sender, values), {})
+
+
+for model in stats.TRACKED_FIELDS:
+    post_init.connect(remember_stats_fields, sender=model, dispatch_uid=f'stats_init_{model.__name__}')
+    post_save.connect(update_stats_on_save, sender=model, dispatch_uid=f'stats_save_{model.__name__}')
+    post_delete.connect(update_stats_on_delete, sender=model, dispatch_uid=f'stats_delete_{model.__name__}')
+
+
+# ============ Search Index ============
+
+def index_for_search(sender, instance, raw=False, **kwargs):
+    """Add or refresh the object's search document"""
+    if not raw:
+        search.index_objects([instance])
+
+
+def remove_from_search(sender, instance, **kwargs):
+    """Drop a deleted object's search document"""
+    search.remove_objects([instance])
+
+
+for model in search.KIND_OF:
+    post_save.connect(index_for_search, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+    post_delete.connect(remove_from_search, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
+
+
+# ============ Page Cache ============
+
+def invalidate_cached_pages(sender, instance, created=False, raw=False, update_fields=None, origin=None, **kwargs):
+    """Retire cached pages that show the object once the change is committed"""
+    if raw or (update_fields and update_fields <= pagecache.HEARTBEAT_TIMESTAMPS):
+        return
+    pages = pagecache.affected_pages(instance, created, origin)
+    # After commit, so a page rendered from the old data meanwhile is never stored under the new version
+    transaction.on_commit(lambda: pagecache.bump_pages(pages))
+
+
+for model in pagecache.CACHED_MODELS:
+    post_save.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'pagecache_save_{model.__name__}')
+    post_delete.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'pagecache_delete_{model.__name__}')
+
+
+# ============ Recipient Typeahead ============
+
+@receiver(post_save, sender=User)
+def index_user_for_typeahead(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Refresh the user's lookup keys unless the save cannot have changed them (e.g. a login)"""
+    if raw or (update_fields and not {'username', 'email'} & set(update_fields)):
+        return
+    typeahead.index_users([instance])
@@ -0,0 +1,129 @@
+"""
+Denormalized per-user dashboard counters.
+
+UserStats holds the counts the dashboard and profile show. The signal
+handlers in signals.py keep them current by applying +1/-1 deltas whenever
+a tracked row is created, deleted or changes the fields a counter depends
+on. rebuild_user_stats() recomputes rows from scratch with grouped queries
+and is used for users without a stats row yet and for drift repair.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F
+
+from .db import upsert_options
+from .models import Device, NetworkInvitation, NetworkShare, SharedNetwork, UserStats, WiFiNetwork
+
+# Fields whose old values are remembered to work out what changed on save
+TRACKED_FIELDS = {
+    Device: ('user_id',),
+    WiFiNetwork: ('owner_id',),
+    NetworkShare: ('shared_with_user_id', 'is_active'),
+    SharedNetwork: ('network_id', 'is_connected'),
+    NetworkInvitation: ('invited_user_id', 'status'),
+}
+
+# Users recomputed per round of grouped queries during a full rebuild
+REBUILD_BATCH_SIZE = 1000
+
+COUNTER_FIELDS = ('devices_count', 'networks_count', 'shared_networks_count', 'active_connections', 'pending_invitations')
+
+
+def snapshot(instance):
+    """Tracked field values of an instance, or None if some were deferred"""
+    values = {}
+    for attname in TRACKED_FIELDS[type(instance)]:
+        if attname not in instance.__dict__:
+            return None
+        values[attname] = instance.__dict__[attname]
+    return values
+
+
+def _network_owner(network_id):
+    return WiFiNetwork.objects.filter(pk=network_id).values_list('owner_id', flat=True).first()
+
+
+def contributions(model, values):
+    """The (user_id, counter) pairs a row with these field values adds one to"""
+    if not values:
+        return Counter()
+    if model is Device:
+        return Counter({(values['user_id'], 'devices_count'): 1})
+    if model is WiFiNetwork:
+        return Counter({(values['owner_id'], 'networks_count'): 1})
+    if model is NetworkShare and values['is_active']:
+        return Counter({(values['shared_with_user_id'], 'shared_networks_count'): 1})
+    if model is SharedNetwork and values['is_connected']:
+        owner_id = _network_owner(values['network_id'])
+        return Counter({(owner_id, 'active_connections'): 1}) if owner_id else Counter()
+    if model is NetworkInvitation and values['status'] == 'pending':
+        return Counter({(values['invited_user_id'], 'pending_invitations'): 1})
+    return Counter()
+
+
+def affected_users(instance):
+    """Every user whose counters a row can touch, whatever its current state"""
+    if isinstance(instance, SharedNetwork):
+        return [_network_owner(instance.network_id)]
+    user_field = TRACKED_FIELDS[type(instance)][0]
+    return [getattr(instance, user_field)]
+
+
+def apply_delta(old, new):
+    """Move counters from an old contribution to a new one"""
+    delta = Counter(new)
+    delta.subtract(old)
+    by_user = {}
+    for (user_id, field), n in delta.items():
+        if n:
+            by_user.setdefault(user_id, {})[field] = F(field) + n
+    for user_id, updates in by_user.items():
+        # Users without a stats row are built from scratch on first lookup
+        UserStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def rebuild_user_stats(user_ids=None):
+    """Recompute stats rows from the source tables; all users if ``user_ids`` is None"""
+    if user_ids is None:
+        all_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        return sum(
+            rebuild_user_stats(all_ids[i:i + REBUILD_BATCH_SIZE])
+            for i in range(0, len(all_ids), REBUILD_BATCH_SIZE)
+        )
+
+    # Skip ids of users deleted in the meantime
+    user_ids = list(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    def grouped(queryset, user_field):
+        queryset = queryset.filter(**{f'{user_field}__in': user_ids})
+        return dict(queryset.values_list(user_field).annotate(n=Count('pk')).order_by())
+
+    devices = grouped(Device.objects.all(), 'user')
+    networks = grouped(WiFiNetwork.objects.all(), 'owner')
+    shared = grouped(NetworkShare.objects.filter(is_active=True), 'shared_with_user')
+    connections = grouped(SharedNetwork.objects.filter(is_connected=True), 'network__owner')
+    invitations = grouped(NetworkInvitation.objects.filter(status='pending'), 'invited_user')
+
+    rows = [
+        UserStats(
+            user_id=user_id,
+            devices_count=devices.get(user_id, 0),
+            networks_count=networks.get(user_id, 0),
+            shared_networks_count=shared.get(user_id, 0),
+            active_connections=connections.get(user_id, 0),
+            pending_invitations=invitations.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    UserStats.objects.bulk_create(rows, **upsert_options(['user'], [*COUNTER_FIELDS, 'updated_at']))
+    return len(rows)
+
+
+def get_user_stats(user):
+    """Fetch a user's stats row with one lookup, building it on first use"""
+    try:
+        return UserStats.objects.get(user=user)
+    except UserStats.DoesNotExist:
+        rebuild_user_stats([user.pk])
+        return UserStats.objects.get(user=user)
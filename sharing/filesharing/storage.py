@@ -0,0 +1,98 @@
+"""
+Content-addressed, deduplicating storage for File uploads.
+
+Every distinct piece of content is stored once as a Blob named after its
+SHA-256 digest. File rows point at their Blob (and File.file at the blob's
+storage name, so URLs and delivery backends keep working) and each Blob
+counts its references. The stored bytes are only removed when the last
+File referencing them is deleted. Compressible content is stored gzipped
+(see compression.py).
+"""
+import os
+
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from django.db.models import F
+
+from . import compression
+from .downloads import compute_checksum
+from .models import Blob
+
+
+class MovableFile(DjangoFile):
+    """A file already on local disk; exposes its path so storage can move it instead of copying"""
+    def __init__(self, path, size):
+        super().__init__(None, name=path)
+        self.size = size
+
+    def temporary_file_path(self):
+        return self.name
+
+    def close(self):
+        pass  # nothing is held open
+
+
+def _save_content(blob, content, mime_type):
+    """Write ``content`` as ``blob``'s file, gzipped when compression.choose_encoding() says so"""
+    encoding = compression.choose_encoding(content, mime_type)
+    if not encoding:
+        blob.file.save(blob.digest, content, save=False)
+        return encoding, None
+
+    path, stored_size = compression.compress_to_tempfile(content)
+    try:
+        blob.file.save(blob.digest, MovableFile(path, stored_size), save=False)
+    finally:
+        if os.path.exists(path):  # storage copied it rather than moving it
+            os.remove(path)
+    return encoding, stored_size
+
+
+def store_blob(content, digest=None, mime_type=''):
+    """
+    Store ``content`` in the blob store and take a reference to it.
+
+    The digest is taken from ``digest``, then from the ``sha256`` attribute
+    set by the hashing upload handlers, and only computed as a last resort.
+    Content that is already stored is not written again; the returned blob's
+    ``content_written`` says whether this call wrote it. ``mime_type`` is
+    the uploader's claim, used to skip compressing already-compressed media.
+    """
+    digest = digest or getattr(content, 'sha256', None) or compute_checksum(content)
+
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            digest=digest,
+            defaults={'size': content.size},
+        )
+        blob.content_written = created or not blob.file or not blob.file.storage.exists(blob.file.name)
+        if blob.content_written:
+            blob.encoding, blob.stored_size = _save_content(blob, content, mime_type)
+            Blob.objects.filter(pk=digest).update(
+                file=blob.file.name, encoding=blob.encoding, stored_size=blob.stored_size,
+            )
+        Blob.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1)
+    blob.ref_count += 1
+    return blob
+
+
+def attach_blob(file_obj, blob):
+    """Point a File at its blob (does not save the File)"""
+    file_obj.blob = blob
+    file_obj.file = blob.file.name
+    file_obj.checksum = blob.digest
+
+
+def release_blob(digest):
+    """Drop one reference to a blob, deleting its content and thumbnails once unreferenced"""
+    with transaction.atomic():
+        Blob.objects.filter(pk=digest).update(ref_count=F('ref_count') - 1)
+        blob = Blob.objects.select_for_update().filter(pk=digest).first()
+        if blob is None or blob.ref_count > 0:
+            return False
+        storage = blob.file.storage
+        names = [blob.file.name, *blob.thumbnails.values_list('file', flat=True)]
+        blob.delete()  # cascades to the thumbnail rows
+        # Only unlink once the rows are gone for good
+        transaction.on_commit(lambda: [storage.delete(name) for name in names])
+    return True
@@ -0,0 +1,62 @@
+"""
+A small in-process worker pool for work that should not hold up a request.
+
+Jobs run on a shared ThreadPoolExecutor sized by settings.BACKGROUND_WORKERS.
+Nothing is persisted: jobs queued when the process exits are lost, so every
+job must be safe to redo later (lazily or from a management command).
+Set BACKGROUND_TASKS_SYNC = True to run jobs inline, e.g. in tests.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='filesharing-worker',
+            )
+        return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+    finally:
+        # Worker threads hold their own connections; don't leak them
+        close_old_connections()
+
+
+def submit(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the worker pool"""
+    if settings.BACKGROUND_TASKS_SYNC:
+        return fn(*args, **kwargs)
+    return get_executor().submit(_run, fn, args, kwargs)
+
+
+def submit_on_commit(fn, *args, **kwargs):
+    """Queue a job once the current transaction commits, so it sees the committed rows"""
+    transaction.on_commit(lambda: submit(fn, *args, **kwargs))
+
+
+def shutdown():
+    """Wait for every queued job to finish; a new pool is started on the next submit()"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
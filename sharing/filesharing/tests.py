@@ -1,3 +1,1290 @@
-from django.test import TestCase
+import asyncio
+import atexit
+import gzip
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import compression, counters, heartbeats, pagecache, permissions, quotas, search, storage, tiering, uploads, usage
+from .benchmarks.runner import compare, report, run_scenario
+from .benchmarks.scenarios import SCENARIOS, World
+from .benchmarks.seed import Volumes, seed
+from .buffers import WriteBuffer
+from .db import upsert_options
+from .downloads import parse_range_header
+from .expiry import sweep_expired
+from .models import (
+    Blob, ConnectionUsage, Device, File, FileComment, FileDownloadDaily, FileShare, NetworkInvitation, NetworkShare,
+    SearchDocument, SharedNetwork, Thumbnail, UploadSession, UserStats, WiFiNetwork,
+)
+from .quotas import get_storage_usage, rebuild_storage_usage
+from .stats import get_user_stats, rebuild_user_stats
+
+
+class QueryBudgetTestCase(TestCase):
+    """Pages must issue a fixed number of queries however much data they show"""
+
+    def seed_files(self, owner, count, recipients=()):
+        """Create ``count`` files for ``owner``, each shared with every recipient"""
+        files = File.objects.bulk_create([
+            File(
+                owner=owner,
+                file=f'files/seed/{owner.username}-{i}.jpg',
+                filename=f'{owner.username}-{i}.jpg',
+                file_type='image' if i % 2 else 'document',
+                file_size=1024 * (i + 1),
+                mime_type='image/jpeg' if i % 2 else 'application/pdf',
+            )
+            for i in range(count)
+        ])
+        FileShare.objects.bulk_create([
+            FileShare(file=file_obj, shared_with_user=recipient)
+            for file_obj in files
+            for recipient in recipients
+        ])
+        return files
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, grow, budget):
+        """Query count stays within ``budget`` and does not change as data grows"""
+        before = self.count_queries(url)
+        grow()
+        after = self.count_queries(url)
+        self.assertLessEqual(before, budget)
+        self.assertEqual(before, after, f'{url} went from {before} to {after} queries as data grew')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CHUNKED_UPLOAD_DIR=tempfile.mkdtemp(), CHUNKED_UPLOAD_CHUNK_SIZE=10)
+class ChunkedUploadTests(TestCase):
+    content = b'0123456789abcdefghijKLMNO'
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('filesharing:api-upload-init'),
+            json.dumps({'filename': 'notes.txt', 'size': len(self.content), 'mime_type': 'text/plain'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['upload_id']
+
+    def put_chunk(self, offset):
+        return self.client.put(
+            reverse('filesharing:api-upload-chunk', args=[self.upload_id, offset]),
+            self.content[offset:offset + 10],
+            content_type='application/octet-stream',
+        )
+
+    def finalize(self):
+        return self.client.post(reverse('filesharing:api-upload-finalize', args=[self.upload_id]))
+
+    def test_chunks_assemble_into_a_ready_file(self):
+        self.assertEqual(File.objects.get().status, 'uploading')
+        for offset in (0, 10, 20):
+            self.assertEqual(self.put_chunk(offset).status_code, 200)
+
+        self.assertEqual(self.finalize().status_code, 201)
+        file_obj = File.objects.get()
+        self.assertEqual(file_obj.status, 'ready')
+        with file_obj.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+
+    def test_interrupted_uploads_resume_from_the_acknowledged_offset(self):
+        self.put_chunk(0)
+        self.assertEqual(self.put_chunk(20).status_code, 409)  # skips a chunk
+        self.assertEqual(self.put_chunk(0).status_code, 200)  # re-sent chunks are harmless
+        status = self.client.get(reverse('filesharing:api-upload-status', args=[self.upload_id])).json()
+        self.assertEqual((status['offset'], status['complete']), (10, False))
+        self.assertEqual(self.finalize().status_code, 409)
+
+        self.put_chunk(10)
+        self.put_chunk(20)
+        self.assertEqual(self.finalize().status_code, 201)
+
+    def test_abandoned_uploads_are_reaped(self):
+        self.put_chunk(0)
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS + 1))
+        call_command('cleanup_uploads', stdout=StringIO())
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class RangeDownloadTests(TestCase):
+    content = b'0123456789abcdefghijKLMNO'
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile('notes.txt', self.content, content_type='text/plain'),
+        })
+        self.file = File.objects.get()
+        self.url = reverse('filesharing:file-download', args=[self.file.pk])
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range_header(self):
+        self.assertEqual(parse_range_header('bytes=2-4', 25), [(2, 4)])
+        self.assertEqual(parse_range_header('bytes=-3', 25), [(22, 24)])
+        self.assertEqual(parse_range_header('bytes=20-', 25), [(20, 24)])
+        self.assertEqual(parse_range_header('bytes=0-4,3-9', 25), [(0, 9)])  # coalesced
+        self.assertEqual(parse_range_header('bytes=30-', 25), [])
+        self.assertIsNone(parse_range_header('items=0-4', 25))
+        self.assertIsNone(parse_range_header('bytes=4-2', 25))
+
+    def test_byte_ranges(self):
+        response, body = self.get(range='bytes=2-4')
+        self.assertEqual((response.status_code, body, response['Content-Range']), (206, b'234', 'bytes 2-4/25'))
+
+        response, body = self.get(range='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges'))
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(b'01', body)
+        self.assertIn(b'56', body)
+
+        response, _ = self.get(range='bytes=30-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */25'))
+
+    def test_conditional_requests(self):
+        response, body = self.get()
+        self.assertEqual(body, self.content)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get(if_none_match=etag)[0].status_code, 304)
+        self.assertEqual(self.get(if_modified_since=last_modified)[0].status_code, 304)
+        self.assertEqual(self.get(range='bytes=2-4', if_range=etag)[0].status_code, 206)
+        self.assertEqual(self.get(range='bytes=2-4', if_range='"stale"')[0].status_code, 200)
+
+    def test_files_without_a_checksum_are_hashed_in_the_background(self):
+        File.objects.update(checksum='')
+        response, body = self.get()
+        self.assertEqual(body, self.content)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(File.objects.get().checksum, self.file.blob_id)
+        self.assertIn('ETag', self.get()[0])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), FILE_DELIVERY_BACKEND='filesharing.delivery.XAccelRedirectDelivery')
+class DeliveryBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile('notes.txt', b'offloaded content', content_type='text/plain'),
+        })
+        self.file = File.objects.get()
+        self.url = reverse('filesharing:file-download', args=[self.file.pk])
+        counters.flush()
+
+    def test_x_accel_redirect_hands_the_file_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], settings.FILE_DELIVERY_INTERNAL_URL + self.file.file.name)
+        self.assertEqual(response.content, b'')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_x_sendfile_names_the_absolute_path(self):
+        with self.settings(FILE_DELIVERY_BACKEND='filesharing.delivery.XSendfileDelivery'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.file.file.path)
+
+    def test_only_transfers_from_the_first_byte_count_as_downloads(self):
+        self.client.get(self.url)
+        self.client.get(self.url, headers={'range': 'bytes=5-'})
+        self.client.get(self.url, headers={'if_none_match': '"cached"'})
+        self.assertEqual(counters.pending_downloads(self.file.pk), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BlobStoreTests(TestCase):
+    content = b'the same bytes, uploaded twice'
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+
+    def upload(self, name):
+        self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile(name, self.content, content_type='text/plain'),
+        })
+        return File.objects.get(filename=name)
+
+    def test_identical_uploads_share_one_blob_until_the_last_is_deleted(self):
+        first, second = self.upload('a.txt'), self.upload('b.txt')
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual((first.file.name, second.file.name), (blob.file.name, blob.file.name))
+        path = blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_migrate_to_blobstore_deduplicates_legacy_files(self):
+        for i in range(2):
+            legacy = File(owner=self.user, filename=f'legacy-{i}.txt', file_size=len(self.content))
+            legacy.file.save('legacy.txt', ContentFile(self.content), save=True)
+        call_command('migrate_to_blobstore', stdout=StringIO())
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(set(File.objects.values_list('blob', 'checksum')), {(blob.digest, blob.digest)})
+
+
+@override_settings(DOWNLOAD_COUNTER_FLUSH_THRESHOLD=3, DOWNLOAD_COUNTER_FLUSH_INTERVAL=3600, BACKGROUND_TASKS_SYNC=True)
+class DownloadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.file = File.objects.create(owner=self.user, filename='a.pdf', file_size=10)
+        counters.flush()
+
+    def test_downloads_are_buffered_then_written_with_f_updates(self):
+        counters.record_downloads([self.file.pk, self.file.pk])
+        self.assertEqual(counters.pending_downloads(self.file.pk), 2)
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.download_count, 0)
+
+        counters.record_download(self.file.pk)  # reaches the threshold
+        self.assertEqual(counters.pending_downloads(self.file.pk), 0)
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.download_count, 3)
+        self.assertEqual(FileDownloadDaily.objects.get(file=self.file).count, 3)
+
+    def test_downloads_of_deleted_files_are_dropped(self):
+        counters.record_download(self.file.pk)
+        self.file.delete()
+        self.assertEqual(counters.flush(), 0)
+
+    def test_failed_flush_is_retried_by_the_next_one(self):
+        counters.record_downloads([self.file.pk, self.file.pk])
+        with mock.patch.object(counters._buffer, '_write', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                counters.flush()
+        counters.record_download(self.file.pk)  # reaches the threshold
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.download_count, 3)
+        self.assertEqual(counters.pending_downloads(self.file.pk), 0)
+
+    def test_failed_flush_at_exit_is_logged(self):
+        def fail(batch):
+            raise RuntimeError('database is gone')
+
+        buffer = WriteBuffer(
+            'test writes', fail, dict.update, 'DOWNLOAD_COUNTER_FLUSH_INTERVAL', 'DOWNLOAD_COUNTER_FLUSH_THRESHOLD',
+        )
+        self.addCleanup(atexit.unregister, buffer._flush_at_exit)
+        buffer.add(lambda pending: pending.update(a=1))
+        with self.assertLogs('filesharing.buffers', 'ERROR') as logs:
+            buffer._flush_at_exit()
+        self.assertIn('1 buffered entries lost', logs.output[0])
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friend = User.objects.create_user('friend', password='pass12345')
+        router = Device.objects.create(
+            user=self.owner, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        self.network = WiFiNetwork.objects.create(
+            owner=self.owner, source_device=router, network_name='home', frequency_band='5GHz', channel=36,
+        )
+        laptop = Device.objects.create(
+            user=self.friend, device_name='laptop', device_type='laptop', mac_address='00:11:22:33:44:01',
+        )
+        self.connection = SharedNetwork.objects.create(network=self.network, device=laptop)
+
+    def counters(self, user):
+        stats = get_user_stats(user)
+        return {field: getattr(stats, field) for field in ('devices_count', 'networks_count', 'active_connections')}
+
+    def test_signals_keep_counters_current(self):
+        self.assertEqual(self.counters(self.owner), {'devices_count': 1, 'networks_count': 1, 'active_connections': 1})
+        share = NetworkShare.objects.create(network=self.network, shared_with_user=self.friend)
+        invitation = NetworkInvitation.objects.create(
+            network=self.network, invited_user=self.friend, invited_by=self.owner,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        stats = get_user_stats(self.friend)
+        self.assertEqual((stats.shared_networks_count, stats.pending_invitations), (1, 1))
+
+        share.is_active = False
+        share.save()
+        invitation.status = 'accepted'
+        invitation.save()
+        self.connection.is_connected = False
+        self.connection.save()
+        stats = get_user_stats(self.friend)
+        self.assertEqual((stats.shared_networks_count, stats.pending_invitations), (0, 0))
+        self.assertEqual(self.counters(self.owner)['active_connections'], 0)
+
+        self.network.delete()
+        self.assertEqual(self.counters(self.owner), {'devices_count': 1, 'networks_count': 0, 'active_connections': 0})
+
+    def test_reading_counters_is_one_query(self):
+        get_user_stats(self.owner)
+        with self.assertNumQueries(1):
+            get_user_stats(self.owner)
+
+    def test_rebuild_repairs_drift(self):
+        get_user_stats(self.owner)
+        UserStats.objects.update(devices_count=99)
+        rebuild_user_stats()
+        self.assertEqual(self.counters(self.owner)['devices_count'], 1)
+
+    def test_upserts_only_name_the_conflict_target_where_supported(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertNotIn('unique_fields', upsert_options(['user'], ['devices_count']))
+        self.assertEqual(upsert_options(['user'], ['devices_count'])['unique_fields'], ['user'])
+
+
+class CommentStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.file = File.objects.create(owner=self.user, filename='a.pdf', file_size=10, file='files/a.pdf')
+        self.url = reverse('filesharing:api-file-comment-stream', args=[self.file.pk])
+
+    async def test_new_comments_are_pushed_as_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content.__aiter__()
+        self.assertTrue((await events.__anext__()).startswith(b'retry:'))
+
+        comment = await sync_to_async(FileComment.objects.create)(file=self.file, user=self.user, comment='hello')
+        event = await asyncio.wait_for(events.__anext__(), 2)
+        self.assertIn(f'id: {comment.pk}'.encode(), event)
+        self.assertIn(b'"comment": "hello"', event)
+        await events.aclose()
+
+    async def test_reconnecting_clients_get_missed_comments(self):
+        first = await sync_to_async(FileComment.objects.create)(file=self.file, user=self.user, comment='seen')
+        await sync_to_async(FileComment.objects.create)(file=self.file, user=self.user, comment='missed')
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, headers={'Last-Event-ID': str(first.pk)})
+        events = response.streaming_content.__aiter__()
+        await events.__anext__()  # retry
+        self.assertIn(b'"comment": "missed"', await asyncio.wait_for(events.__anext__(), 2))
+        await events.aclose()
+
+    def test_streaming_needs_the_asgi_server(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+
+
+class CommentPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        self.file = File.objects.create(owner=self.user, filename='a.pdf', file_size=10, file='files/a.pdf')
+        self.url = reverse('filesharing:api-file-comments', args=[self.file.pk])
+        started = timezone.now() - timedelta(minutes=5)
+        for i in range(45):
+            comment = FileComment.objects.create(file=self.file, user=self.user, comment=f'c{i}')
+            # Pairs share a timestamp, so the cursor has to break ties by id
+            FileComment.objects.filter(pk=comment.pk).update(created_at=started + timedelta(seconds=i // 2))
+
+    def test_before_cursor_walks_history_without_gaps_or_repeats(self):
+        page = self.client.get(self.url, {'limit': 20}).json()
+        self.assertTrue(page['has_more'])
+        seen = [comment['comment'] for comment in page['comments']]
+        while page['has_more']:
+            page = self.client.get(self.url, {'limit': 20, 'before': page['oldest_cursor']}).json()
+            seen += [comment['comment'] for comment in page['comments']]
+        self.assertEqual(sorted(seen), sorted(f'c{i}' for i in range(45)))
+
+    def test_since_cursor_returns_only_new_comments(self):
+        latest = self.client.get(self.url).json()['latest_cursor']
+        page = self.client.get(self.url, {'since': latest}).json()
+        self.assertEqual((page['total'], page['latest_cursor']), (0, latest))
+
+        FileComment.objects.create(file=self.file, user=self.user, comment='new')
+        page = self.client.get(self.url, {'since': latest}).json()
+        self.assertEqual([comment['comment'] for comment in page['comments']], ['new'])
+
+    def test_bad_cursors_and_limits_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'many'}).status_code, 400)
+        with self.settings(COMMENTS_PAGE_MAX=30):
+            self.assertEqual(self.client.get(self.url, {'limit': 10 ** 6}).json()['total'], 30)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        photo = io.BytesIO()
+        Image.new('RGB', (3000, 2000), (200, 10, 10)).save(photo, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('filesharing:file-upload'), {
+                'file': SimpleUploadedFile('photo.jpg', photo.getvalue(), content_type='image/jpeg'),
+            })
+        self.file = File.objects.get()
+        self.url = reverse('filesharing:file-thumbnail', args=[self.file.pk, 'medium'])
+
+    def test_every_size_and_format_is_rendered_after_upload(self):
+        self.assertEqual(Thumbnail.objects.count(), len(settings.THUMBNAIL_SIZES) * 2)
+        medium = Thumbnail.objects.get(size='medium', format='webp')
+        self.assertEqual(max(medium.width, medium.height), settings.THUMBNAIL_SIZES['medium'])
+        self.assertEqual(medium.width * 2, medium.height * 3)  # aspect ratio kept
+
+    def test_format_follows_accept_and_responses_are_cacheable(self):
+        response = self.client.get(self.url, headers={'accept': 'image/webp,*/*'})
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        revalidated = self.client.get(self.url, headers={'if_none_match': response['ETag'], 'accept': 'image/webp'})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.client.get(self.url)['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.client.get(reverse('filesharing:file-thumbnail', args=[self.file.pk, 'huge'])).status_code, 404)
+
+    def test_missing_thumbnails_are_rendered_on_demand(self):
+        Thumbnail.objects.all().delete()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(Thumbnail.objects.count(), 1)
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.assertEqual(Thumbnail.objects.count(), len(settings.THUMBNAIL_SIZES) * 2)
+
+    def test_thumbnails_need_view_permission(self):
+        self.client.force_login(User.objects.create_user('stranger', password='pass12345'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FilePermissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friend = User.objects.create_user('friend', password='pass12345')
+        self.file = File.objects.create(owner=self.owner, filename='a.pdf', file_size=10, file='files/a.pdf')
+
+    def resolve(self, user):
+        return permissions.resolve_permission(user, File.objects.get(pk=self.file.pk))
+
+    def test_levels(self):
+        self.assertEqual(self.resolve(self.owner), permissions.OWNER)
+        self.assertIsNone(self.resolve(self.friend))
+        File.objects.filter(pk=self.file.pk).update(is_public=True)
+        self.assertEqual(self.resolve(self.friend), permissions.DOWNLOAD)
+
+    def test_cached_shares_follow_share_changes(self):
+        share = FileShare.objects.create(file=self.file, shared_with_user=self.friend, permission_level='view')
+        self.assertEqual(self.resolve(self.friend), permissions.VIEW)
+        with self.assertNumQueries(1):  # the File only; the share comes from the cache
+            self.resolve(self.friend)
+
+        share.permission_level = 'download'
+        share.save()
+        self.assertEqual(self.resolve(self.friend), permissions.DOWNLOAD)
+        share.delete()
+        self.assertIsNone(self.resolve(self.friend))
+
+    def test_expired_shares_grant_nothing_even_when_cached(self):
+        FileShare.objects.create(
+            file=self.file, shared_with_user=self.friend, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        self.assertEqual(self.resolve(self.friend), permissions.DOWNLOAD)
+        with mock.patch('filesharing.permissions.timezone.now', return_value=timezone.now() + timedelta(hours=2)):
+            self.assertIsNone(self.resolve(self.friend))
+
+    def test_downloadable_files_checks_many_files_in_one_query(self):
+        other = File.objects.create(owner=self.owner, filename='b.pdf', file_size=10, file='files/b.pdf')
+        FileShare.objects.create(file=other, shared_with_user=self.friend)
+        with self.assertNumQueries(1):
+            allowed = list(permissions.downloadable_files(self.friend, [self.file.pk, other.pk]))
+        self.assertEqual(allowed, [other])
+
+
+class BulkShareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friends = [User.objects.create_user(f'friend{i}', password='pass12345') for i in range(3)]
+        self.file = File.objects.create(owner=self.owner, filename='a.pdf', file_size=10, file='files/a.pdf')
+        self.url = reverse('filesharing:api-file-bulk-share', args=[self.file.pk])
+        self.client.force_login(self.owner)
+
+    def share(self, **payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_shares_with_many_users_and_reports_each_recipient(self):
+        revoked = FileShare.objects.create(file=self.file, shared_with_user=self.friends[2], is_active=False)
+        response = self.share(users=[self.friends[0].pk, 'friend1', 'friend2', 'nobody', 'owner'], permission_level='view')
+        self.assertEqual(response.status_code, 200)
+        statuses = {result['recipient']: result['status'] for result in response.json()['results']}
+        self.assertEqual(statuses, {
+            str(self.friends[0].pk): 'shared', 'friend1': 'shared', 'friend2': 'reactivated',
+            'nobody': 'not_found', 'owner': 'owner',
+        })
+        self.assertEqual(FileShare.objects.filter(file=self.file, is_active=True, permission_level='view').count(), 3)
+        revoked.refresh_from_db()
+        self.assertTrue(revoked.is_active)
+
+        again = self.share(users=['friend1'])
+        self.assertEqual(again.json()['results'][0]['status'], 'already_shared')
+
+    def test_new_shares_are_visible_to_the_permission_cache(self):
+        self.assertIsNone(permissions.resolve_permission(self.friends[0], self.file))  # caches "no share"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.share(users=['friend0'])
+        self.assertEqual(permissions.resolve_permission(self.friends[0], self.file), permissions.DOWNLOAD)
+
+    def test_malformed_requests_are_rejected(self):
+        self.assertEqual(self.share(users=[]).status_code, 400)
+        self.assertEqual(self.share(users='friend0').status_code, 400)
+        self.assertEqual(self.share(users=['friend0'], permission_level='manage').status_code, 400)
+        self.assertEqual(self.share(users=['friend0'], permission_level=['view']).status_code, 400)
+        self.assertEqual(self.share(users=['friend0'], permission_level={'level': 'view'}).status_code, 400)
+        self.assertFalse(FileShare.objects.exists())
+
+        self.client.force_login(self.friends[0])
+        self.assertEqual(self.share(users=['friend1']).status_code, 403)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        photo = io.BytesIO()
+        Image.new('RGB', (64, 48)).save(photo, 'PNG')
+        self.photo = photo.getvalue()
+
+    def test_files_are_stored_then_classified_in_the_background(self):
+        files = [
+            SimpleUploadedFile('a.png', self.photo, content_type='application/octet-stream'),
+            SimpleUploadedFile('b.png', self.photo, content_type='application/octet-stream'),
+            SimpleUploadedFile('fake.jpg', b'not an image', content_type='image/jpeg'),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('filesharing:api-batch-upload'), {'files': files})
+        self.assertEqual(response.json()['accepted'], 3)
+
+        types = dict(File.objects.values_list('filename', 'file_type'))
+        self.assertEqual(types, {'a.png': 'image', 'b.png': 'image', 'fake.jpg': 'other'})
+        self.assertEqual(Blob.objects.get(pk=File.objects.get(filename='a.png').blob_id).ref_count, 2)
+
+        ids = ','.join(result['file_id'] for result in response.json()['files'])
+        status = self.client.get(reverse('filesharing:api-batch-upload-status'), {'ids': ids}).json()
+        self.assertEqual(status['pending'], 0)
+        self.assertEqual({entry['status'] for entry in status['files']}, {'ready'})
+
+    def test_failed_batch_leaves_no_stored_content(self):
+        stored = []
+
+        def store(content, **kwargs):
+            blob = storage.store_blob(content, **kwargs)
+            stored.append(blob.file.name)
+            return blob
+
+        files = [
+            SimpleUploadedFile('a.png', self.photo, content_type='image/png'),
+            SimpleUploadedFile('b.txt', b'some text', content_type='text/plain'),
+        ]
+        with mock.patch.object(uploads, 'store_blob', side_effect=store), \
+                mock.patch.object(File.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                uploads.batch_upload(self.user, files)
+
+        self.assertEqual(len(stored), 2)
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(any(default_storage.exists(name) for name in stored))
+
+    def test_limits(self):
+        self.assertEqual(self.client.post(reverse('filesharing:api-batch-upload')).status_code, 400)
+        with self.settings(BATCH_UPLOAD_MAX_FILES=1):
+            response = self.client.post(reverse('filesharing:api-batch-upload'), {'files': [
+                SimpleUploadedFile(f'{i}.txt', b'x', content_type='text/plain') for i in range(2)
+            ]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cleanup_finishes_stalled_batches(self):
+        # Post-processing is queued on commit, which never comes here: the batch stalls
+        self.client.post(reverse('filesharing:api-batch-upload'), {
+            'files': [SimpleUploadedFile('stuck.png', self.photo, content_type='image/png')],
+        })
+        File.objects.update(created_at=timezone.now() - timedelta(minutes=settings.BATCH_UPLOAD_STALE_MINUTES - 1))
+        call_command('cleanup_uploads', stdout=StringIO())
+        self.assertEqual(File.objects.get().status, 'processing')
+
+        call_command('cleanup_uploads', '--stale-minutes', '0', stdout=StringIO())
+        self.assertEqual(File.objects.get().status, 'ready')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ZipDownloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        self.photo = os.urandom(50_000)
+        for name, content, content_type in [
+            ('notes.txt', b'hello ' * 1000, 'text/plain'),
+            ('notes.txt', b'second copy', 'text/plain'),
+            ('report.pdf', b'%PDF-1.4 ' + b'text ' * 1000, 'application/pdf'),
+            ('photo.jpg', self.photo, 'image/jpeg'),
+        ]:
+            self.client.post(reverse('filesharing:file-upload'), {
+                'file': SimpleUploadedFile(name, content, content_type=content_type),
+            })
+        self.pks = list(File.objects.values_list('pk', flat=True))
+        self.ids = [str(pk) for pk in self.pks]
+        counters.flush()
+
+    def get(self, ids):
+        return self.client.get(reverse('filesharing:files-archive'), {'ids': ids})
+
+    def test_archive_holds_every_file_under_a_unique_name(self):
+        response = self.get(self.ids)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        entries = {info.filename: info for info in archive.infolist()}
+        self.assertEqual(set(entries), {'notes.txt', 'notes (2).txt', 'report.pdf', 'photo.jpg'})
+        self.assertEqual(archive.read('photo.jpg'), self.photo)
+        self.assertEqual(entries['photo.jpg'].compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(entries['report.pdf'].compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_downloads_count_only_once_the_archive_is_complete(self):
+        response = self.get(self.ids)
+        next(iter(response.streaming_content))
+        response.close()  # client went away
+        self.assertEqual([counters.pending_downloads(pk) for pk in self.pks], [0, 0, 0, 0])
+
+        b''.join(self.get(self.ids).streaming_content)
+        self.assertEqual([counters.pending_downloads(pk) for pk in self.pks], [1, 1, 1, 1])
+
+    def test_every_file_must_be_downloadable(self):
+        self.client.force_login(User.objects.create_user('stranger', password='pass12345'))
+        self.assertEqual(self.get(self.ids).status_code, 302)
+        File.objects.update(is_public=True)
+        self.assertEqual(self.get(self.ids).status_code, 200)
+        self.assertEqual(self.get(['not-a-uuid']).status_code, 302)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friend = User.objects.create_user('friend', password='pass12345')
+        self.report = File.objects.create(
+            owner=self.owner, filename='Quarterly_report_2024.pdf', file_size=10, file='files/a.pdf',
+            mime_type='application/pdf', file_type='document',
+        )
+        FileComment.objects.create(file=self.report, user=self.owner, comment='Please review the report numbers')
+        laptop = Device.objects.create(
+            user=self.owner, device_name='Office laptop', device_type='laptop', mac_address='00:11:22:33:44:00',
+        )
+        WiFiNetwork.objects.create(
+            owner=self.owner, source_device=laptop, network_name='HomeNet', frequency_band='5GHz', channel=36,
+        )
+
+    def kinds(self, user, query):
+        return [result['kind'] for result in search.search(user, query)[0]]
+
+    def test_triggers_index_every_kind_and_titles_rank_first(self):
+        self.assertEqual(self.kinds(self.owner, 'report')[0], 'file')  # title match beats the comment body
+        self.assertEqual(sorted(self.kinds(self.owner, 'report')), ['comment', 'file'])
+        self.assertEqual(self.kinds(self.owner, 'office laptop'), ['device'])
+        self.assertEqual(self.kinds(self.owner, 'homen'), ['network'])  # last token matches as a prefix
+
+        self.report.filename = 'renamed.pdf'
+        self.report.save()
+        self.assertEqual(self.kinds(self.owner, 'quarterly'), [])
+        self.report.delete()
+        self.assertEqual(self.kinds(self.owner, 'review'), [])
+        self.assertFalse(SearchDocument.objects.filter(kind__in=['file', 'comment']).exists())
+
+    def test_results_only_include_what_the_user_may_see(self):
+        self.assertEqual(self.kinds(self.friend, 'report'), [])
+        share = FileShare.objects.create(file=self.report, shared_with_user=self.friend)
+        self.assertEqual(sorted(self.kinds(self.friend, 'report')), ['comment', 'file'])
+        share.is_active = False
+        share.save()
+        self.assertEqual(self.kinds(self.friend, 'report'), [])
+        self.assertEqual(self.kinds(self.friend, 'laptop'), [])
+
+    def test_query_syntax_is_never_interpreted(self):
+        self.assertEqual(self.kinds(self.owner, '"AND OR NEAR( *'), [])
+        self.assertEqual(self.kinds(self.owner, '   '), [])
+
+    def test_rebuild_and_fallback_backend_agree(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(sorted(self.kinds(self.owner, 'report')), ['comment', 'file'])
+        with self.settings(SEARCH_BACKEND='filesharing.search.DatabaseSearchBackend'):
+            self.assertEqual(sorted(self.kinds(self.owner, 'port')), ['comment', 'file'])  # substring match
+
+
+@override_settings(HEARTBEAT_FLUSH_THRESHOLD=3, HEARTBEAT_FLUSH_INTERVAL=3600, BACKGROUND_TASKS_SYNC=True)
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        heartbeats.flush()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.other = User.objects.create_user('other', password='pass12345')
+        self.laptop = Device.objects.create(
+            user=self.owner, device_name='laptop', device_type='laptop', mac_address='00:11:22:33:44:01',
+        )
+        self.phone = Device.objects.create(
+            user=self.owner, device_name='phone', device_type='phone', mac_address='00:11:22:33:44:02',
+        )
+        self.router = Device.objects.create(
+            user=self.other, device_name='router', device_type='router', mac_address='00:11:22:33:44:03',
+        )
+        network = WiFiNetwork.objects.create(
+            owner=self.other, source_device=self.router, network_name='cafe', frequency_band='5GHz', channel=36,
+        )
+        self.connection = SharedNetwork.objects.create(network=network, device=self.laptop)
+        self.client.force_login(self.owner)
+
+    def beat(self, body):
+        return self.client.post(reverse('filesharing:api-heartbeat'), json.dumps(body), content_type='application/json')
+
+    def test_reports_are_buffered_until_the_threshold(self):
+        response = self.beat({
+            'devices': [{'id': str(self.laptop.id), 'ip_address': '10.0.0.2'}, {'id': str(self.router.id)}],
+            'connections': [{'id': str(self.connection.id), 'data_used': 500, 'is_connected': False}],
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['accepted'], {'devices': 1, 'connections': 1})
+        self.assertEqual(response.json()['rejected'], [str(self.router.id)])
+        self.laptop.refresh_from_db()
+        self.assertIsNone(self.laptop.ip_address)
+
+        self.assertEqual(heartbeats.flush(), 2)
+        self.laptop.refresh_from_db()
+        self.connection.refresh_from_db()
+        self.assertEqual(self.laptop.ip_address, '10.0.0.2')
+        self.assertEqual((self.connection.data_used, self.connection.is_connected), (500, False))
+        self.assertEqual(get_user_stats(self.other).active_connections, 0)
+
+    def test_crossing_the_threshold_flushes_on_the_worker_pool(self):
+        self.beat({'devices': [{'id': str(self.laptop.id)}, {'id': str(self.phone.id)}]})
+        self.beat({'devices': [{'id': str(self.phone.id), 'is_online': False}]})  # coalesced with the first report
+        self.phone.refresh_from_db()
+        self.assertTrue(self.phone.is_online)
+
+        self.beat({'connections': [{'id': str(self.connection.id)}]})
+        self.phone.refresh_from_db()
+        self.assertFalse(self.phone.is_online)
+        self.assertIsNotNone(self.phone.last_seen)
+        self.assertEqual(heartbeats.flush(), 0)
+
+    def test_reports_of_a_failed_flush_are_retried(self):
+        self.beat({'devices': [{'id': str(self.laptop.id), 'ip_address': '10.0.0.2'}]})
+        with mock.patch.object(heartbeats._buffer, '_write', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                heartbeats.flush()
+        self.beat({'devices': [{'id': str(self.laptop.id), 'is_online': False}]})
+        self.assertEqual(heartbeats.flush(), 1)
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.laptop.ip_address, self.laptop.is_online), ('10.0.0.2', False))
+
+    def test_invalid_reports_are_rejected(self):
+        self.assertEqual(self.beat({'devices': [{'id': 'nope'}]}).status_code, 400)
+        self.assertEqual(self.beat({'devices': [{'id': str(self.laptop.id), 'is_online': 'false'}]}).status_code, 400)
+        with self.settings(HEARTBEAT_MAX_REPORTS=1):
+            response = self.beat({'devices': [{'id': str(self.laptop.id)}, {'id': str(self.phone.id)}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sweep_marks_silent_devices_offline(self):
+        Device.objects.filter(pk=self.laptop.pk).update(last_seen=timezone.now() - timedelta(minutes=5))
+        Device.objects.filter(pk=self.phone.pk).update(last_seen=timezone.now())
+        call_command('sweep_devices', stdout=StringIO())
+        self.assertEqual(list(Device.objects.filter(is_online=False)), [self.laptop])
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600, BACKGROUND_TASKS_SYNC=True)
+class UsageTests(TestCase):
+    def setUp(self):
+        heartbeats.flush()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        router = Device.objects.create(
+            user=self.owner, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        laptop = Device.objects.create(
+            user=self.owner, device_name='laptop', device_type='laptop', mac_address='00:11:22:33:44:01',
+        )
+        self.network = WiFiNetwork.objects.create(
+            owner=self.owner, source_device=router, network_name='home', frequency_band='5GHz', channel=36,
+        )
+        self.first = SharedNetwork.objects.create(network=self.network, device=router)
+        self.second = SharedNetwork.objects.create(network=self.network, device=laptop)
+        self.client.force_login(self.owner)
+        self.url = reverse('filesharing:api-network-usage', args=[self.network.id])
+
+    def beat(self, first, second):
+        self.client.post(reverse('filesharing:api-heartbeat'), json.dumps({'connections': [
+            {'id': str(self.first.id), 'data_used': first},
+            {'id': str(self.second.id), 'data_used': second},
+        ]}), content_type='application/json')
+        heartbeats.flush()
+
+    def test_usage_delta_treats_a_drop_as_a_reset(self):
+        self.assertEqual(usage.usage_delta(100, 300), 200)
+        self.assertEqual(usage.usage_delta(300, 10), 10)
+
+    def test_heartbeats_add_growth_at_every_resolution(self):
+        self.beat(100, 50)
+        self.beat(300, 50)
+        self.beat(10, 60)  # the first connection's counter was reset
+        for resolution in usage.RESOLUTIONS:
+            rows = ConnectionUsage.objects.filter(resolution=resolution)
+            self.assertEqual(rows.aggregate(total=Sum('bytes_used'))['total'], 100 + 200 + 10 + 50 + 10)
+
+        response = self.client.get(self.url, {'start': (timezone.now() - timedelta(hours=1)).isoformat()}).json()
+        self.assertEqual((response['resolution'], response['total_bytes']), ('minute', 370))
+
+    def test_long_windows_use_coarser_rollups(self):
+        self.beat(100, 0)
+        start = (timezone.now() - timedelta(days=10)).isoformat()
+        response = self.client.get(self.url, {'start': start}).json()
+        self.assertEqual((response['resolution'], response['total_bytes']), ('hour', 100))
+        start = (timezone.now() - timedelta(days=30)).isoformat()
+        self.assertEqual(self.client.get(self.url, {'start': start}).json()['resolution'], 'day')
+
+        self.assertEqual(self.client.get(self.url, {'resolution': 'minute', 'start': start}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'resolution': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, 400)
+
+    def test_prune_drops_rows_past_their_retention(self):
+        self.beat(100, 0)
+        self.assertEqual(usage.prune_usage(timezone.now() + timedelta(days=3)), 1)
+        self.assertEqual(
+            sorted(ConnectionUsage.objects.values_list('resolution', flat=True)), ['day', 'hour'],
+        )
+
+
+class FilesListQueryTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.recipients = [User.objects.create_user(f'friend{i}', password='pass12345') for i in range(5)]
+        self.client.force_login(self.owner)
+
+    def test_files_list_query_count_is_constant(self):
+        self.seed_files(self.owner, 2, self.recipients[:1])
+        self.assertConstantQueries(
+            reverse('filesharing:files-list'),
+            lambda: self.seed_files(self.owner, 40, self.recipients),
+            budget=6,
+        )
+
+    def test_files_list_shows_share_counts(self):
+        self.seed_files(self.owner, 1, self.recipients)
+        response = self.client.get(reverse('filesharing:files-list'))
+        self.assertContains(response, '5 shared')
+
+    def test_shared_files_query_count_is_constant(self):
+        viewer = self.recipients[0]
+        self.client.force_login(viewer)
+        self.seed_files(self.owner, 2, [viewer])
+
+        def grow():
+            for i in range(1, 5):
+                self.seed_files(self.recipients[i], 10, [viewer])
+
+        self.assertConstantQueries(reverse('filesharing:shared-files'), grow, budget=6)
+
+
+class NetworksListQueryTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.device = Device.objects.create(
+            user=self.owner, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        self.client.force_login(self.owner)
+
+    def seed_networks(self, count, connections=2):
+        """Create ``count`` networks with connected devices and one share each"""
+        start = WiFiNetwork.objects.count()
+        friend, _ = User.objects.get_or_create(username='friend')
+        for i in range(start, start + count):
+            network = WiFiNetwork.objects.create(
+                owner=self.owner, source_device=self.device, network_name=f'net-{i}', frequency_band='5GHz', channel=36,
+            )
+            for j in range(connections):
+                device = Device.objects.create(
+                    user=self.owner, device_name=f'dev-{i}-{j}', device_type='phone',
+                    mac_address=f'00:11:22:{i // 256:02x}:{i % 256:02x}:{j + 1:02x}',
+                )
+                SharedNetwork.objects.create(network=network, device=device, data_used=100)
+            NetworkShare.objects.create(network=network, shared_with_user=friend)
+
+    def test_networks_list_query_count_is_constant(self):
+        self.seed_networks(1)
+        self.assertConstantQueries(reverse('filesharing:networks-list'), lambda: self.seed_networks(20), budget=4)
+
+    def test_with_usage_annotations(self):
+        self.seed_networks(1, connections=3)
+        SharedNetwork.objects.filter(device__device_name='dev-0-0').update(is_connected=False)
+        network = WiFiNetwork.objects.with_usage().get()
+        self.assertEqual(network.connected_count, 2)
+        self.assertEqual(network.total_data_used, 300)
+        self.assertEqual(network.share_count, 1)
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600, BACKGROUND_TASKS_SYNC=True)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        heartbeats.flush()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friend = User.objects.create_user('friend', password='pass12345')
+        self.router = Device.objects.create(
+            user=self.owner, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        self.network = WiFiNetwork.objects.create(
+            owner=self.owner, source_device=self.router, network_name='home', frequency_band='5GHz', channel=36,
+        )
+        self.client.force_login(self.owner)
+        self.client.get(reverse('filesharing:devices-list'))  # sets the CSRF cookie cached pages need
+
+    def version(self, family, user):
+        return cache.get(f'page-version:{family}:{user.pk}')
+
+    def test_pages_are_served_from_cache_until_a_shown_row_changes(self):
+        first = self.client.get(reverse('filesharing:devices-list'))
+        with self.assertNumQueries(2):  # session and user only
+            self.assertEqual(self.client.get(reverse('filesharing:devices-list')).content, first.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.router.device_name = 'renamed'
+            self.router.save()
+        self.assertContains(self.client.get(reverse('filesharing:devices-list')), 'renamed')
+
+    def test_sharing_refreshes_the_recipients_page(self):
+        recipient = self.client_class()
+        recipient.force_login(self.friend)
+        recipient.get(reverse('filesharing:devices-list'))
+        self.assertNotContains(recipient.get(reverse('filesharing:shared-networks')), 'home')
+        with self.captureOnCommitCallbacks(execute=True):
+            NetworkShare.objects.create(network=self.network, shared_with_user=self.friend)
+        self.assertContains(recipient.get(reverse('filesharing:shared-networks')), 'home')
+
+    def test_owners_are_derived_without_queries(self):
+        share = NetworkShare(network=self.network, shared_with_user=self.friend)
+        invitation = NetworkInvitation(
+            network_id=self.network.pk, invited_user=self.friend, invited_by=self.owner, expires_at=timezone.now(),
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(pagecache.affected_pages(share), {pagecache.NETWORKS: {self.owner.pk, self.friend.pk}})
+            self.assertEqual(pagecache.affected_pages(invitation), {pagecache.NETWORKS: {self.owner.pk}})
+            self.assertEqual(pagecache.affected_pages(self.network, created=True), {pagecache.NETWORKS: {self.owner.pk}})
+
+        orphan = NetworkShare(network_id=self.network.pk, shared_with_user=self.friend)
+        with self.assertNumQueries(0):
+            pagecache.affected_pages(orphan, origin=self.network)
+
+    def beat(self, report):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('filesharing:api-heartbeat'), json.dumps({'devices': [report]}), content_type='application/json',
+            )
+            heartbeats.flush()
+
+    def test_timestamp_only_heartbeats_do_not_invalidate(self):
+        self.client.get(reverse('filesharing:devices-list'))
+        version = self.version(pagecache.DEVICES, self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.router.save(update_fields=['last_seen'])
+        self.beat({'id': str(self.router.id)})
+        self.assertEqual(self.version(pagecache.DEVICES, self.owner), version)
+
+        self.beat({'id': str(self.router.id), 'ip_address': '10.0.0.9'})
+        self.assertContains(self.client.get(reverse('filesharing:devices-list')), '10.0.0.9')
+
+    def test_online_status_changes_invalidate(self):
+        devices = reverse('filesharing:devices-list')
+        self.assertNotContains(self.client.get(devices), 'Offline')
+        self.beat({'id': str(self.router.id), 'is_online': False})
+        self.assertContains(self.client.get(devices), 'Offline')
+
+        self.beat({'id': str(self.router.id)})
+        self.assertNotContains(self.client.get(devices), 'Offline')
+        Device.objects.filter(pk=self.router.pk).update(last_seen=timezone.now() - timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            heartbeats.sweep_offline_devices()
+        self.assertContains(self.client.get(devices), 'Offline')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class BenchmarkTests(TransactionTestCase):
+    def test_every_scenario_runs_against_seeded_data(self):
+        volumes = Volumes(users=4, devices=2, networks=1, connections=2, files=3, shares=1, comments=2,
+                          distinct_contents=2, file_size=1024)
+        counts = seed(volumes)
+        self.assertEqual(counts['users'], 4)
+        world = World.load(upload_size=volumes.file_size)
+
+        results = [run_scenario(name, world, requests=3, warmup=1) for name in SCENARIOS]
+        for result in results:
+            self.assertEqual((result.requests, result.errors), (3, 0), result.name)
+            self.assertGreater(result.queries_per_request, 0, result.name)
+
+        baseline = report(results, {})
+        self.assertEqual(compare(results, baseline), [])
+        baseline['scenarios']['search']['queries_per_request'] -= 2
+        self.assertEqual(len(compare(results, baseline)), 1)
+
+    def test_compare_needs_a_local_baseline(self):
+        with self.assertRaisesMessage(CommandError, '--save-baseline'):
+            call_command('benchmark', compare=os.path.join(tempfile.mkdtemp(), 'baseline.json'))
+
+
+class UserTypeaheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = User.objects.create_user('alice', email='alice@example.com', password='pass12345')
+        User.objects.create_user('alfred', email='fred@example.com')
+        User.objects.create_user('bob', email='al.bob@example.com')
+        User.objects.create_user('alina', email='alina@example.com', is_active=False)
+        self.client.force_login(self.me)
+        self.url = reverse('filesharing:api-user-typeahead')
+
+    def test_matches_username_then_email_prefix(self):
+        response = self.client.get(self.url, {'q': 'AL'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['alfred', 'bob'])
+        self.assertNotIn('email', response.json()['results'][0])
+
+    def test_short_query_returns_nothing(self):
+        self.assertEqual(self.client.get(self.url, {'q': 'a'}).json()['results'], [])
+
+    def test_rate_limited(self):
+        with self.settings(TYPEAHEAD_RATE_LIMIT=(2, 60)):
+            statuses = [self.client.get(self.url, {'q': 'al'}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_non_ascii_capitals_match_either_case(self):
+        User.objects.create_user('Élodie', email='ÉLODIE@example.com')
+        for query in ('él', 'ÉL'):
+            results = self.client.get(self.url, {'q': query}).json()['results']
+            self.assertEqual([user['username'] for user in results], ['Élodie'])
+
+    def test_keys_follow_renames(self):
+        user = User.objects.get(username='bob')
+        user.username = 'Ålbert'
+        user.save()
+        self.assertEqual([u['username'] for u in self.client.get(self.url, {'q': 'ål'}).json()['results']], ['Ålbert'])
+
+    def test_tampered_recipient_redisplays_the_form(self):
+        router = Device.objects.create(
+            user=self.me, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        network = WiFiNetwork.objects.create(
+            owner=self.me, source_device=router, network_name='home', frequency_band='5GHz', channel=36,
+        )
+        response = self.client.post(reverse('filesharing:network-share', args=[network.pk]), {
+            'shared_with_user': 'abc', 'permission_level': 'view',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['shared_with_user'])
+
+
+class ExpirySweepTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.friend = User.objects.create_user('friend', password='pass12345')
+        device = Device.objects.create(
+            user=self.owner, device_name='router', device_type='router', mac_address='00:11:22:33:44:00',
+        )
+        self.network = WiFiNetwork.objects.create(
+            owner=self.owner, source_device=device, network_name='home', frequency_band='5GHz', channel=36,
+        )
+
+    def test_sweep_expires_overdue_rows_in_batches(self):
+        past, future = timezone.now() - timedelta(hours=1), timezone.now() + timedelta(hours=1)
+        files = self.seed_files(self.owner, 3)
+        FileShare.objects.bulk_create([
+            FileShare(file=files[0], shared_with_user=self.friend, expires_at=past),
+            FileShare(file=files[1], shared_with_user=self.friend, expires_at=past),
+            FileShare(file=files[2], shared_with_user=self.friend, expires_at=future),
+        ])
+        NetworkShare.objects.create(network=self.network, shared_with_user=self.friend, expires_at=past)
+        NetworkInvitation.objects.create(
+            network=self.network, invited_user=self.friend, invited_by=self.owner, expires_at=past,
+        )
+        self.assertEqual(get_user_stats(self.friend).pending_invitations, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = sweep_expired(batch_size=1)
+
+        self.assertEqual(counts, {'file_shares': 2, 'network_shares': 1, 'invitations': 1})
+        self.assertEqual(FileShare.objects.filter(is_active=True).count(), 1)
+        self.assertEqual(NetworkInvitation.objects.get().status, 'expired')
+        stats = get_user_stats(self.friend)
+        self.assertEqual((stats.shared_networks_count, stats.pending_invitations), (0, 0))
+        self.assertEqual(sweep_expired(), {'file_shares': 0, 'network_shares': 0, 'invitations': 0})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), STORAGE_QUOTA_BYTES=1000, BACKGROUND_TASKS_SYNC=True)
+class StorageQuotaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+
+    def upload(self, name, size):
+        return self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile(name, b'x' * size, content_type='application/pdf'),
+        })
+
+    def test_uploads_and_deletes_keep_the_ledger_current(self):
+        self.upload('a.pdf', 600)
+        usage = get_storage_usage(self.user)
+        self.assertEqual((usage.bytes_used, usage.file_count, usage.document_bytes), (600, 1, 600))
+
+        self.upload('b.pdf', 600)  # skipped while streaming in
+        self.assertEqual(File.objects.count(), 1)
+
+        self.client.post(reverse('filesharing:file-delete', args=[File.objects.get().pk]))
+        usage.refresh_from_db()
+        self.assertEqual((usage.bytes_used, usage.file_count, usage.document_bytes), (0, 0, 0))
+
+    def test_charge_refuses_files_over_quota(self):
+        quotas.charge(self.user, 'image', 1000)
+        with self.assertRaises(quotas.QuotaExceeded):
+            quotas.charge(self.user, 'image', 1)
+
+    def test_rebuild_matches_files(self):
+        get_storage_usage(self.user)
+        File.objects.bulk_create([  # bypasses the ledger
+            File(owner=self.user, filename=f'{i}.jpg', file_type='image', file_size=100) for i in range(3)
+        ])
+        rebuild_storage_usage()
+        usage = get_storage_usage(self.user)
+        self.assertEqual((usage.bytes_used, usage.file_count, usage.image_bytes), (300, 3, 300))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TIERING_COLD_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class TieringTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+        self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile('old.pdf', b'cold content', content_type='application/pdf'),
+        })
+        self.file = File.objects.get()
+        File.objects.update(created_at=timezone.now() - timedelta(days=90))
+
+    def test_cold_files_move_and_are_served_from_the_cold_tier(self):
+        self.assertEqual(tiering.run_tiering(dry_run=True)['blobs'], 1)
+        self.assertEqual(tiering.run_tiering(), {'blobs': 1, 'bytes': 12, 'skipped': 0})
+        blob = Blob.objects.get()
+        self.assertEqual(blob.tier, tiering.COLD)
+        self.assertFalse(os.path.exists(default_storage.hot_path(blob.file.name)))
+
+        with self.settings(TIERING_POLICY={**settings.TIERING_POLICY, 'promote_downloads': 1}):
+            response = self.client.get(reverse('filesharing:file-download', args=[self.file.pk]))
+        self.assertEqual(b''.join(response.streaming_content), b'cold content')
+        self.assertEqual(Blob.objects.get().tier, tiering.HOT)
+        self.assertTrue(os.path.exists(default_storage.hot_path(blob.file.name)))
+
+    def test_recently_downloaded_files_stay_hot(self):
+        FileDownloadDaily.objects.create(file=self.file, day=timezone.localdate(), count=1)
+        self.assertEqual(tiering.run_tiering()['blobs'], 0)
+
+    def test_deleting_a_cold_file_removes_its_content(self):
+        tiering.run_tiering()
+        cold_path = default_storage.cold_path(self.file.file.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file.delete()
+        self.assertFalse(os.path.exists(cold_path))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class CompressionTests(TestCase):
+    content = b'name,size,owner\n' + b''.join(b'report-%d.pdf,%d,owner\n' % (i, i * 7) for i in range(1000))
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass12345')
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, content_type):
+        self.client.post(reverse('filesharing:file-upload'), {
+            'file': SimpleUploadedFile(name, content, content_type=content_type),
+        })
+        return File.objects.select_related('blob').get(filename=name)
+
+    def download(self, file_obj, **headers):
+        response = self.client.get(reverse('filesharing:file-download', args=[file_obj.pk]), headers=headers)
+        return response, b''.join(response.streaming_content)
+
+    def test_compressible_uploads_are_stored_gzipped_and_served_decoded(self):
+        file_obj = self.upload('files.csv', self.content, 'text/csv')
+        self.assertEqual(file_obj.blob.encoding, compression.GZIP)
+        self.assertLess(file_obj.blob.stored_size, len(self.content) // 4)
+        self.assertEqual(file_obj.file_size, len(self.content))
+
+        response, body = self.download(file_obj)
+        self.assertEqual(body, self.content)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response, body = self.download(file_obj, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+
+    def test_clients_accepting_gzip_get_the_stored_bytes(self):
+        file_obj = self.upload('files.csv', self.content, 'text/csv')
+        response, body = self.download(file_obj, accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), file_obj.blob.stored_size)
+        self.assertEqual(gzip.decompress(body), self.content)
+        self.assertNotEqual(response['ETag'], self.download(file_obj)[0]['ETag'])
+
+    def test_offload_backends_send_the_stored_gzip_to_clients_accepting_it(self):
+        file_obj = self.upload('files.csv', self.content, 'text/csv')
+        url = reverse('filesharing:file-download', args=[file_obj.pk])
+        with self.settings(FILE_DELIVERY_BACKEND='filesharing.delivery.XAccelRedirectDelivery'):
+            response = self.client.get(url, headers={'accept_encoding': 'gzip'})
+            self.assertEqual(response['X-Accel-Redirect'], settings.FILE_DELIVERY_INTERNAL_URL + file_obj.file.name)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+            # Decoded in the worker for clients without gzip, and for ranges
+            response, body = self.download(file_obj)
+            self.assertNotIn('X-Accel-Redirect', response)
+            self.assertEqual(body, self.content)
+            response, body = self.download(file_obj, accept_encoding='gzip', range='bytes=0-9')
+            self.assertEqual(body, self.content[:10])
+
+    def test_media_and_incompressible_content_is_stored_as_is(self):
+        self.assertEqual(self.upload('photo.jpg', self.content, 'image/jpeg').blob.encoding, '')
+        self.assertEqual(self.upload('random.bin', os.urandom(8192), 'application/octet-stream').blob.encoding, '')
+
+        report = compression.savings_report()
+        self.assertEqual([row['encoding'] for row in report['encodings']], [''])
@@ -0,0 +1,32 @@
+"""
+Fixed-window request rate limiting on the shared cache.
+
+Each (scope, user) pair gets a counter that lives for one window; requests
+past the limit are refused until it expires. With a cache shared by all
+workers the limit holds across processes.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def rate_limited(request, scope, limit, window):
+    """
+    Count a request against ``limit`` per ``window`` seconds.
+
+    Returns 0 when the request is allowed, otherwise the number of seconds
+    until the window resets (for a Retry-After header).
+    """
+    window_start = int(time.time()) // window * window
+    ident = request.user.pk if request.user.is_authenticated else request.META.get('REMOTE_ADDR', '')
+    key = f'throttle:{scope}:{ident}:{window_start}'
+    # add() is a no-op when the counter exists, so the window is never extended
+    cache.add(key, 0, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:  # expired between add() and incr()
+        cache.set(key, 1, window)
+        count = 1
+    if count > limit:
+        return max(window_start + window - int(time.time()), 1)
+    return 0
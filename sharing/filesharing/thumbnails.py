@@ -0,0 +1,139 @@
+"""
+Thumbnail generation for image files.
+
+Thumbnails are derived from a File's Blob, so identical uploads share one
+set. After an image upload the full set (every size in THUMBNAIL_SIZES, as
+WebP and JPEG) is rendered on the background worker pool; a request for a
+thumbnail that is not there yet renders just that one inline. The
+``generate_thumbnails`` management command backfills existing images.
+"""
+import io
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from PIL import Image, ImageOps
+
+from . import tasks
+from .compression import open_content
+from .models import Blob, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+# format -> (Pillow format name, content type)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# Blobs Pillow could not decode are not retried for this long
+FAILURE_TTL = 60 * 60
+
+
+def _failure_key(digest):
+    return f'thumbnail-failed:{digest}'
+
+
+def preferred_format(request):
+    """WebP for clients that advertise it, JPEG for everyone else"""
+    return 'webp' if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else 'jpeg'
+
+
+def _open_image(blob, max_px):
+    """Decode a blob's image, oriented upright and ready to encode as RGB"""
+    with open_content(blob) as fh:
+        image = Image.open(fh)
+        # Let the JPEG decoder downscale while decoding; far cheaper for big photos
+        image.draft('RGB', (max_px, max_px))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _encode(image, fmt):
+    pil_format = FORMATS[fmt][0]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, quality=settings.THUMBNAIL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _save(blob, size, fmt, image):
+    """Encode and store one rendition; returns the existing row if another worker won the race"""
+    content = ContentFile(_encode(image, fmt), name=f'{blob.digest}-{size}.{fmt}')
+    thumbnail = Thumbnail(blob=blob, size=size, format=fmt, width=image.width, height=image.height)
+    thumbnail.file.save(content.name, content, save=False)
+    try:
+        with transaction.atomic():
+            thumbnail.save()
+    except IntegrityError:
+        thumbnail.file.delete(save=False)
+        return Thumbnail.objects.get(blob=blob, size=size, format=fmt)
+    return thumbnail
+
+
+def generate_thumbnails(blob, sizes=None, formats=None):
+    """
+    Render the missing thumbnails of an image blob.
+
+    Sizes are rendered largest first, each one downscaled from the previous
+    rendition rather than from the original. Returns the number created, or
+    None if the content could not be decoded as an image.
+    """
+    sizes = sizes or list(settings.THUMBNAIL_SIZES)
+    formats = formats or list(FORMATS)
+    existing = set(blob.thumbnails.values_list('size', 'format'))
+    wanted = [
+        (size, [fmt for fmt in formats if (size, fmt) not in existing])
+        for size in sorted(sizes, key=settings.THUMBNAIL_SIZES.get, reverse=True)
+    ]
+    wanted = [(size, fmts) for size, fmts in wanted if fmts]
+    if not wanted:
+        return 0
+
+    try:
+        image = _open_image(blob, settings.THUMBNAIL_SIZES[wanted[0][0]])
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Cannot render thumbnails for blob %s: %s', blob.digest, e)
+        cache.set(_failure_key(blob.digest), True, FAILURE_TTL)
+        return None
+
+    created = 0
+    for size, fmts in wanted:
+        max_px = settings.THUMBNAIL_SIZES[size]
+        image.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+        for fmt in fmts:
+            _save(blob, size, fmt, image)
+            created += 1
+    return created
+
+
+def get_thumbnail(blob, size, fmt):
+    """Fetch a thumbnail, rendering it inline if the background job has not yet; None if impossible"""
+    thumbnail = Thumbnail.objects.filter(blob=blob, size=size, format=fmt).first()
+    if thumbnail is not None or cache.get(_failure_key(blob.digest)):
+        return thumbnail
+    if generate_thumbnails(blob, sizes=[size], formats=[fmt]) is None:
+        return None
+    return Thumbnail.objects.filter(blob=blob, size=size, format=fmt).first()
+
+
+def generate_blob_thumbnails(digest):
+    """Background job: render the full thumbnail set of the blob with this digest"""
+    blob = Blob.objects.filter(pk=digest).first()
+    if blob is not None:
+        generate_thumbnails(blob)
+
+
+def schedule_thumbnails(file_obj):
+    """Queue the full thumbnail set of an image File once its transaction commits"""
+    if file_obj.file_type == 'image' and file_obj.blob_id:
+        tasks.submit_on_commit(generate_blob_thumbnails, file_obj.blob_id)
@@ -0,0 +1,191 @@
+"""
+Hot/cold tiering of stored file content.
+
+Blob content starts on the fast volume under MEDIA_ROOT. run_tiering()
+(the ``tier_files`` management command) moves blobs that no longer earn
+their place there to TIERING_COLD_ROOT, a slower or cheaper volume. A blob
+is cold once every File using it is older than ``min_age_days``, has not
+been downloaded for ``idle_days`` (FileDownloadDaily) and has at most
+``max_downloads`` downloads in total (settings.TIERING_POLICY, each key
+overridable per run).
+
+Nothing that reads files needs to know about tiers: the default storage
+(TieredFileSystemStorage) finds a name under the cold root when it is not
+on the hot one, so serve_file, ZIP downloads and thumbnail rendering all
+work unchanged. Blob.tier records where the content lives, for the
+download view (the front-end server behind an offload delivery backend
+only sees MEDIA_ROOT) and for reporting. Cold blobs downloaded
+``promote_downloads`` times within ``idle_days`` are moved back in the
+background.
+
+A move copies the content under a temporary name, renames it into place,
+removes the old copy and only then flips Blob.tier, so readers always find
+one complete copy and an interrupted run is simply picked up again by the
+next one.
+"""
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+from django.utils._os import safe_join
+
+from . import tasks
+from .models import Blob, File, FileDownloadDaily
+
+HOT = 'hot'
+COLD = 'cold'
+
+# Size of the reads used to copy content between tiers
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class TieredFileSystemStorage(FileSystemStorage):
+    """MEDIA_ROOT storage that also finds files moved under TIERING_COLD_ROOT"""
+
+    def hot_path(self, name):
+        return super().path(name)
+
+    def cold_path(self, name):
+        return safe_join(settings.TIERING_COLD_ROOT, name)
+
+    def path(self, name):
+        hot = self.hot_path(name)
+        if os.path.exists(hot) or not settings.TIERING_COLD_ROOT:
+            return hot
+        cold = self.cold_path(name)
+        return cold if os.path.exists(cold) else hot
+
+    def delete(self, name):
+        super().delete(name)  # whichever copy path() finds first
+        if settings.TIERING_COLD_ROOT:
+            try:
+                os.remove(self.cold_path(name))
+            except FileNotFoundError:
+                pass
+
+
+def get_policy(**overrides):
+    """settings.TIERING_POLICY with the given keys replaced (None leaves a key alone)"""
+    return {**settings.TIERING_POLICY, **{key: value for key, value in overrides.items() if value is not None}}
+
+
+def cold_candidates(policy, now=None):
+    """Hot blobs whose every file is old, idle and rarely downloaded, in digest order"""
+    now = now or timezone.now()
+    keeps_hot = (
+        Q(created_at__gt=now - timedelta(days=policy['min_age_days']))
+        | Q(daily_downloads__day__gt=timezone.localdate(now) - timedelta(days=policy['idle_days']))
+    )
+    if policy['max_downloads'] is not None:
+        keeps_hot |= Q(download_count__gt=policy['max_downloads'])
+    busy = File.objects.filter(keeps_hot, blob=OuterRef('pk'))
+    return Blob.objects.filter(tier=HOT, ref_count__gt=0).exclude(Exists(busy)).order_by('digest')
+
+
+def _move(src, dst):
+    """Copy ``src`` to ``dst`` through a temporary name, then remove ``src``"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    partial = f'{dst}.partial'
+    with open(src, 'rb') as fin, open(partial, 'wb') as fout:
+        shutil.copyfileobj(fin, fout, COPY_BLOCK_SIZE)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(partial, dst)
+    try:
+        os.remove(src)
+    except FileNotFoundError:  # deleted by release_blob() meanwhile
+        pass
+
+
+def get_tiered_storage():
+    """The default storage, which must be able to see both tiers"""
+    if not isinstance(default_storage, TieredFileSystemStorage):
+        raise ImproperlyConfigured('Tiering needs STORAGES["default"] to be filesharing.tiering.TieredFileSystemStorage')
+    return default_storage
+
+
+def _set_tier(blob, tier):
+    """Move ``blob``'s content to ``tier``; returns False if there was nothing to move"""
+    storage = get_tiered_storage()
+    locations = {HOT: storage.hot_path(blob.file.name), COLD: storage.cold_path(blob.file.name)}
+    source = locations[COLD if tier == HOT else HOT]
+    if os.path.exists(source):
+        _move(source, locations[tier])
+    elif not os.path.exists(locations[tier]):
+        return False  # content missing from both tiers
+
+    if not Blob.objects.filter(pk=blob.pk).update(tier=tier, tiered_at=timezone.now()):
+        # The last file went away while the content was being moved
+        storage.delete(blob.file.name)
+        return False
+    blob.tier = tier
+    return True
+
+
+def demote(blob):
+    """Move a blob's content to the cold tier"""
+    return _set_tier(blob, COLD)
+
+
+def promote(blob):
+    """Move a blob's content back to the hot tier"""
+    return _set_tier(blob, HOT)
+
+
+def promote_digest(digest):
+    """promote() by digest, for the worker pool"""
+    blob = Blob.objects.filter(pk=digest, tier=COLD).first()
+    return promote(blob) if blob is not None else False
+
+
+def record_cold_read(blob, policy=None):
+    """Queue a cold blob for promotion once it has been downloaded often enough lately"""
+    policy = policy or get_policy()
+    if blob.tier != COLD or not policy['promote_downloads']:
+        return False
+    since = timezone.localdate() - timedelta(days=policy['idle_days'])
+    recent = FileDownloadDaily.objects.filter(file__blob=blob, day__gt=since).aggregate(n=Sum('count'))['n'] or 0
+    if recent + 1 < policy['promote_downloads']:  # this download is not flushed yet
+        return False
+    tasks.submit(promote_digest, blob.digest)
+    return True
+
+
+def run_tiering(policy=None, batch_size=None, limit=None, dry_run=False):
+    """
+    Move every cold candidate to the cold tier, ``batch_size`` blobs per query.
+
+    Returns ``{'blobs': n, 'bytes': n, 'skipped': n}``; with ``dry_run``
+    the counts describe what would move and nothing is touched.
+    """
+    policy = policy or get_policy()
+    candidates = cold_candidates(policy)
+    if limit is not None:
+        candidates = candidates[:limit]
+    if dry_run:
+        totals = Blob.objects.filter(pk__in=candidates.values('pk')).aggregate(blobs=Count('pk'), bytes=Sum('size'))
+        return {'blobs': totals['blobs'], 'bytes': totals['bytes'] or 0, 'skipped': 0}
+
+    batch_size = batch_size or settings.TIERING_BATCH_SIZE
+    report = {'blobs': 0, 'bytes': 0, 'skipped': 0}
+    last_digest = ''
+    while limit is None or report['blobs'] + report['skipped'] < limit:
+        # Keyset pagination, so blobs that could not be moved are not picked again
+        batch = list(cold_candidates(policy).filter(digest__gt=last_digest)[:batch_size])
+        for blob in batch:
+            if limit is not None and report['blobs'] + report['skipped'] >= limit:
+                break
+            if demote(blob):
+                report['blobs'] += 1
+                report['bytes'] += blob.size
+            else:
+                report['skipped'] += 1
+        if len(batch) < batch_size:
+            break
+        last_digest = batch[-1].digest
+    return report
@@ -0,0 +1,67 @@
+"""
+Prefix lookup of users for the share and invitation forms.
+
+Matches are found with range scans (``key >= prefix AND key < next``) over
+indexed UserLookupKey columns holding each username and email lowercased
+by Python, so each lookup reads only the handful of index entries that
+start with the prefix, however many accounts exist. The typed prefix is
+lowercased the same way: SQL LOWER() only folds ASCII on SQLite, so keys
+computed in the database would never match names like "Élodie". The keys
+are refreshed by a signal whenever a user is saved; bulk writers that skip
+signals create them with lookup_keys(). Results are capped at
+settings.TYPEAHEAD_MAX_RESULTS.
+"""
+from django.conf import settings
+
+from .models import UserLookupKey
+
+
+def lookup_keys(user):
+    """The UserLookupKey values of ``user``"""
+    return {'username': user.username.lower(), 'email': user.email.lower()}
+
+
+def index_users(users):
+    """Create or refresh the lookup keys of ``users``"""
+    for user in users:
+        UserLookupKey.objects.update_or_create(user_id=user.pk, defaults=lookup_keys(user))
+
+
+def prefix_bounds(prefix):
+    """(low, high) so that ``low <= value < high`` holds exactly for strings starting with ``prefix``"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _range(field, prefix, limit, exclude_user):
+    low, high = prefix_bounds(prefix)
+    return list(
+        UserLookupKey.objects
+        .filter(**{f'{field}__gte': low, f'{field}__lt': high}, user__is_active=True)
+        .exclude(user_id=getattr(exclude_user, 'pk', None))
+        .order_by(field)
+        .values('user_id', 'user__username', 'user__first_name', 'user__last_name')[:limit]
+    )
+
+
+def suggest_users(query, exclude_user=None, limit=None):
+    """Active users whose username or email starts with ``query`` (case-insensitive), usernames first"""
+    prefix = query.strip().lower()
+    limit = min(limit or settings.TYPEAHEAD_MAX_RESULTS, settings.TYPEAHEAD_MAX_RESULTS)
+    if len(prefix) < settings.TYPEAHEAD_MIN_CHARS:
+        return []
+
+    matches = _range('username', prefix, limit, exclude_user)
+    if len(matches) < limit:
+        seen = {match['user_id'] for match in matches}
+        matches += [
+            match for match in _range('email', prefix, limit, exclude_user)
+            if match['user_id'] not in seen
+        ][:limit - len(matches)]
+    return [
+        {
+            'id': match['user_id'],
+            'username': match['user__username'],
+            'name': f'{match["user__first_name"]} {match["user__last_name"]}'.strip(),
+        }
+        for match in matches
+    ]
@@ -0,0 +1,86 @@
+"""
+Upload handlers used for multipart file uploads.
+
+The hashing handlers behave exactly like Django's memory and temporary-file
+handlers but hash every byte as it streams in, so the content-addressed
+store can find a duplicate without reading the upload back from disk.
+QuotaUploadHandler goes in front of them and drops files that would not
+fit in the uploader's storage quota before their excess bytes are written.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    FileUploadHandler, MemoryFileUploadHandler, SkipFile, TemporaryFileUploadHandler,
+)
+
+from . import quotas
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+    Skip files that would take the uploader over their storage quota.
+
+    Must come first in FILE_UPLOAD_HANDLERS: it passes every chunk on to
+    the next handler until a file outgrows the space left, then skips the
+    rest of that file. The names of skipped files are listed in
+    ``request.quota_rejected``. quotas.charge() remains the authoritative
+    check when the File is created.
+    """
+
+    remaining = None  # bytes the uploader may still store; None = no limit
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.quota_rejected = []
+        self.checked = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        if not self.checked:
+            # Looked up on the first file, so forms without files cost nothing
+            user = getattr(self.request, 'user', None)
+            if user is not None and user.is_authenticated:
+                self.remaining = quotas.remaining_bytes(user)
+            self.checked = True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.remaining is not None:
+            self.received += len(raw_data)
+            if self.received > self.remaining:
+                self.request.quota_rejected.append(self.file_name)
+                raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.remaining is not None:
+            self.remaining -= file_size
+        return None  # the next handler builds the file
+
+
+class HashingUploadMixin:
+    """Hash uploaded bytes as they arrive and expose the digest as ``file.sha256``"""
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            # This handler kept the chunk
+            self.sha256.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Keep small uploads in memory, hashing them on the way in"""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file, hashing them on the way in"""
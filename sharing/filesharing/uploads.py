@@ -0,0 +1,300 @@
+"""
+Resumable chunked uploads.
+
+A client opens a session with init_upload(), PUTs fixed-size chunks at
+increasing offsets and calls finalize_upload() once every byte has arrived.
+Each chunk is streamed from the request straight into a single part file at
+its offset, so nothing is buffered in memory and an interrupted upload simply
+resumes from UploadSession.received_bytes.
+
+Batch uploads take many files in one multipart request instead. The files
+are stored as they arrive, their File rows are inserted with one
+bulk_create in the 'processing' state, and classification plus thumbnail
+rendering run on the background worker pool (process_batch()).
+"""
+import mimetypes
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from django.utils import timezone
+
+from PIL import Image
+
+from . import quotas, search, tasks
+from .compression import open_content
+from .downloads import compute_checksum
+from .models import File, UploadSession
+from .storage import MovableFile, attach_blob, store_blob
+from .thumbnails import generate_blob_thumbnails
+
+# Size of the reads used to copy a chunk from the request to disk
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a chunked upload request cannot be honoured"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def detect_file_type(mime):
+    """Map a MIME type onto one of File.FILE_TYPE_CHOICES"""
+    mime = (mime or '').lower()
+    if mime.startswith('image'):
+        return 'image'
+    elif mime.startswith('video'):
+        return 'video'
+    elif mime.startswith('audio'):
+        return 'audio'
+    elif 'pdf' in mime or 'document' in mime or 'word' in mime or 'spreadsheet' in mime:
+        return 'document'
+    elif 'zip' in mime or 'rar' in mime or 'archive' in mime:
+        return 'archive'
+    return 'other'
+
+
+def part_path(session):
+    """Location of the part file backing an upload session"""
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id}.part')
+
+
+def init_upload(owner, filename, total_size, mime_type='', is_public=False):
+    """Create a pending File and the UploadSession that will fill it"""
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('A filename is required')
+    if total_size <= 0:
+        raise UploadError('File size must be greater than zero')
+    if total_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError('File is larger than the maximum upload size', status=413)
+
+    file_type = detect_file_type(mime_type)
+    with transaction.atomic():
+        # The declared size is reserved now, so no chunk is accepted past the quota
+        try:
+            quotas.charge(owner, file_type, total_size)
+        except quotas.QuotaExceeded as e:
+            raise UploadError(str(e), status=413)
+        file_obj = File.objects.create(
+            owner=owner,
+            filename=filename,
+            file_size=total_size,
+            mime_type=mime_type[:100],
+            file_type=file_type,
+            is_public=is_public,
+            status='uploading',
+        )
+        session = UploadSession.objects.create(
+            file=file_obj,
+            owner=owner,
+            total_size=total_size,
+            chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+        )
+
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """Stream one chunk from ``stream`` into the part file at ``offset``"""
+    if offset % session.chunk_size:
+        raise UploadError('Offset must be a multiple of the chunk size')
+    if offset > session.received_bytes:
+        raise UploadError(f'Chunk out of order, resume from offset {session.received_bytes}', status=409)
+
+    expected = min(session.chunk_size, session.total_size - offset)
+    if expected <= 0 or length != expected:
+        raise UploadError(f'Chunk at offset {offset} must be exactly {max(expected, 0)} bytes')
+
+    path = part_path(session)
+    if not os.path.exists(path):
+        raise UploadError('Upload has expired', status=410)
+
+    with open(path, 'r+b') as fh:
+        fh.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                raise UploadError('Connection closed before the chunk was complete')
+            fh.write(block)
+            remaining -= len(block)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    # Only move the acknowledged offset forward; re-sent chunks are no-ops
+    new_offset = offset + length
+    UploadSession.objects.filter(pk=session.pk, received_bytes__lt=new_offset).update(
+        received_bytes=new_offset,
+        updated_at=timezone.now(),
+    )
+    session.received_bytes = max(session.received_bytes, new_offset)
+    return session.received_bytes
+
+
+def finalize_upload(session):
+    """Move the completed part file into the blob store and mark the File ready"""
+    if not session.is_complete():
+        raise UploadError(f'Upload incomplete, resume from offset {session.received_bytes}', status=409)
+
+    path = part_path(session)
+    if not os.path.exists(path):
+        raise UploadError('Upload has expired', status=410)
+
+    file_obj = session.file
+    with open(path, 'rb') as fh:
+        digest = compute_checksum(DjangoFile(fh))
+
+    with transaction.atomic():
+        # A new blob takes over the part file by rename; a duplicate leaves it behind
+        attach_blob(file_obj, store_blob(MovableFile(path, session.total_size), digest, file_obj.mime_type))
+        file_obj.status = 'ready'
+        file_obj.save(update_fields=['file', 'blob', 'checksum', 'status', 'updated_at'])
+        session.delete()
+
+    if os.path.exists(path):
+        os.remove(path)
+    return file_obj
+
+
+def abort_upload(session):
+    """Discard an upload session, its pending File and its part file"""
+    path = part_path(session)
+    session.file.delete()  # cascades to the session
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def reap_stale_uploads(max_age=None):
+    """Delete uploads that have not received a chunk within ``max_age``"""
+    if max_age is None:
+        max_age = timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+    cutoff = timezone.now() - max_age
+
+    reaped = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).select_related('file'):
+        abort_upload(session)
+        reaped += 1
+
+    # Part files whose session vanished (e.g. deleted through the admin)
+    if os.path.isdir(settings.CHUNKED_UPLOAD_DIR):
+        live = {f'{pk}.part' for pk in UploadSession.objects.values_list('id', flat=True)}
+        for name in os.listdir(settings.CHUNKED_UPLOAD_DIR):
+            path = os.path.join(settings.CHUNKED_UPLOAD_DIR, name)
+            if name not in live and os.path.getmtime(path) < cutoff.timestamp():
+                os.remove(path)
+
+    return reaped
+
+
+# ============ Batch Uploads ============
+
+# Browsers send this when they do not know better
+GENERIC_MIME_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+
+
+def batch_upload(owner, uploaded_files, is_public=False):
+    """
+    Store many uploaded files and create their File rows in one INSERT.
+
+    Returns one ``{'filename', 'status', ...}`` entry per upload, in order;
+    rejected uploads carry an ``error`` instead of a ``file_id``. Accepted
+    files stay in the 'processing' state until process_batch() has run.
+    """
+    max_size = settings.CHUNKED_UPLOAD_MAX_SIZE
+    results, pending = [], []
+
+    # Content stored by this batch; the Blob rows roll back with a failed
+    # batch but the files do not, so they are deleted by hand then
+    written = []
+    try:
+        with transaction.atomic():
+            for uploaded in uploaded_files:
+                filename = os.path.basename(uploaded.name or '').strip()[:255]
+                if not filename:
+                    results.append({'filename': uploaded.name, 'status': 'rejected', 'error': 'A filename is required'})
+                    continue
+                if not uploaded.size or uploaded.size > max_size:
+                    results.append({'filename': filename, 'status': 'rejected', 'error': 'Empty or too large'})
+                    continue
+                try:
+                    # Booked as 'other' until process_batch() classifies it
+                    quotas.charge(owner, 'other', uploaded.size)
+                except quotas.QuotaExceeded as e:
+                    results.append({'filename': filename, 'status': 'rejected', 'error': str(e)})
+                    continue
+
+                file_obj = File(
+                    owner=owner,
+                    filename=filename,
+                    file_size=uploaded.size,
+                    mime_type=(uploaded.content_type or '')[:100],
+                    is_public=is_public,
+                    status='processing',
+                )
+                blob = store_blob(uploaded, mime_type=file_obj.mime_type)
+                if blob.content_written:
+                    written.append(blob.file)
+                attach_blob(file_obj, blob)
+                results.append({'filename': filename, 'status': 'processing'})
+                pending.append((results[-1], file_obj))
+
+            File.objects.bulk_create([file_obj for _, file_obj in pending])
+            file_ids = [file_obj.pk for _, file_obj in pending]
+            if file_ids:
+                tasks.submit_on_commit(process_batch, file_ids)
+    except Exception:
+        for stored in written:
+            stored.storage.delete(stored.name)
+        raise
+
+    for result, file_obj in pending:
+        result.update(file_id=str(file_obj.pk), size=file_obj.file_size)
+    return results
+
+
+def classify_upload(file_obj):
+    """Work out a File's MIME and file type, checking claimed images really decode"""
+    mime = file_obj.mime_type.lower()
+    if mime in GENERIC_MIME_TYPES:
+        mime = mimetypes.guess_type(file_obj.filename)[0] or 'application/octet-stream'
+    file_type = detect_file_type(mime)
+    if file_type == 'image':
+        try:
+            with open_content(file_obj.blob) as fh:
+                Image.open(fh)  # reads the header only
+        except (OSError, Image.DecompressionBombError):
+            file_type = 'other'
+    return mime, file_type
+
+
+def process_batch(file_ids):
+    """Classify a batch of uploaded files, mark them ready and queue their thumbnails"""
+    files = list(File.objects.filter(pk__in=file_ids, status='processing').select_related('blob'))
+    retyped = []
+    for file_obj in files:
+        old_type = file_obj.file_type
+        file_obj.mime_type, file_obj.file_type = classify_upload(file_obj)
+        file_obj.status = 'ready'
+        retyped.append((file_obj.owner_id, old_type, file_obj.file_type, file_obj.file_size))
+    with transaction.atomic():
+        File.objects.bulk_update(files, ['mime_type', 'file_type', 'status'])
+        quotas.retype(retyped)  # bulk_update sends no signals
+    search.index_objects(files)
+
+    # One job per image, so renders run in parallel across the pool
+    for digest in {file_obj.blob_id for file_obj in files if file_obj.file_type == 'image'}:
+        tasks.submit(generate_blob_thumbnails, digest)
+    return len(files)
+
+
+def process_stale_batches(max_age):
+    """Finish batch files left in 'processing', e.g. because the process restarted"""
+    cutoff = timezone.now() - max_age
+    file_ids = list(File.objects.filter(status='processing', created_at__lt=cutoff).values_list('pk', flat=True))
+    return process_batch(file_ids) if file_ids else 0
@@ -48,15 +48,30 @@ urlpatterns = [
     path('files/', views.files_list, name='files-list'),
     path('files/upload/', views.upload_file, name='file-upload'),
     path('files/shared/', views.shared_files, name='shared-files'),
+    path('files/archive/', views.download_archive, name='files-archive'),
     path('files/<uuid:pk>/', views.file_detail, name='file-detail'),
     path('files/<uuid:pk>/share/', views.share_file, name='file-share'),
     path('files/<uuid:pk>/download/', views.download_file, name='file-download'),
+    path('files/<uuid:pk>/thumbnail/<str:size>/', views.file_thumbnail, name='file-thumbnail'),
     path('files/<uuid:pk>/delete/', views.delete_file, name='file-delete'),
     path('files/<uuid:file_pk>/share/<uuid:share_pk>/revoke/', views.revoke_share, name='file-share-revoke'),
     
     # API Endpoints
     path('api/network/<uuid:pk>/stats/', views.api_network_stats, name='api-network-stats'),
+    path('api/network/<uuid:pk>/usage/', views.api_network_usage, name='api-network-usage'),
     path('api/device/<uuid:pk>/status/', views.api_device_status, name='api-device-status'),
+    path('api/heartbeat/', views.api_heartbeat, name='api-heartbeat'),
+    path('api/users/typeahead/', views.api_user_typeahead, name='api-user-typeahead'),
+    path('api/files/<uuid:pk>/shares/', views.api_bulk_share, name='api-file-bulk-share'),
     path('api/files/<uuid:pk>/comments/', views.api_file_comments, name='api-file-comments'),
+    path('api/files/<uuid:pk>/comments/stream/', views.api_file_comment_stream, name='api-file-comment-stream'),
+    
+    # Chunked Upload API
+    path('api/uploads/', views.api_upload_init, name='api-upload-init'),
+    path('api/uploads/batch/', views.api_batch_upload, name='api-batch-upload'),
+    path('api/uploads/batch/status/', views.api_batch_upload_status, name='api-batch-upload-status'),
+    path('api/uploads/<uuid:pk>/', views.api_upload_status, name='api-upload-status'),
+    path('api/uploads/<uuid:pk>/chunks/<int:offset>/', views.api_upload_chunk, name='api-upload-chunk'),
+    path('api/uploads/<uuid:pk>/finalize/', views.api_upload_finalize, name='api-upload-finalize'),
 ]
 
@@ -0,0 +1,123 @@
+"""
+Per-connection data usage over time.
+
+Agents report the cumulative ``data_used`` of each connection in their
+heartbeats; when a flush writes a new value, the growth since the previous
+one is added to ConnectionUsage rows at minute, hour and day resolution in
+the same transaction. The coarse rows are therefore always current and a
+query over a month reads about thirty day rows per connection instead of
+every sample.
+
+Fine-grained rows are only kept as long as settings.USAGE_RETENTION says
+(prune_usage(), run by the ``prune_usage`` management command); the coarser
+rollups outlive them.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+from django.utils import timezone
+
+from .models import ConnectionUsage
+
+RESOLUTIONS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def bucket_start(when, resolution):
+    """Start of the ``resolution`` bucket containing ``when`` (UTC)"""
+    when = when.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return when.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return when.replace(minute=0, second=0, microsecond=0)
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def usage_delta(previous, current):
+    """Bytes used between two cumulative readings; a drop means the counter was reset"""
+    return current - previous if current >= previous else current
+
+
+def record_usage(deltas, when=None):
+    """
+    Add usage to every resolution.
+
+    ``deltas`` maps ``(connection_id, network_id)`` to the bytes used since
+    the last reading. Must run inside a transaction.
+    """
+    deltas = {key: n for key, n in deltas.items() if n > 0}
+    if not deltas:
+        return
+    when = when or timezone.now()
+    for resolution in RESOLUTIONS:
+        bucket = bucket_start(when, resolution)
+        ConnectionUsage.objects.bulk_create(
+            [
+                ConnectionUsage(connection_id=connection_id, network_id=network_id,
+                                resolution=resolution, bucket=bucket)
+                for connection_id, network_id in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        # Increment in SQL so concurrent flushes never lose bytes
+        increment = Case(
+            *[When(connection_id=connection_id, then=Value(n)) for (connection_id, _), n in deltas.items()],
+            default=Value(0),
+            output_field=BigIntegerField(),
+        )
+        ConnectionUsage.objects.filter(
+            resolution=resolution,
+            bucket=bucket,
+            connection_id__in=[connection_id for connection_id, _ in deltas],
+        ).update(bytes_used=F('bytes_used') + increment)
+
+
+def pick_resolution(start, end, now=None):
+    """The finest resolution that still covers ``start`` and fits USAGE_MAX_POINTS buckets"""
+    now = now or timezone.now()
+    for resolution, step in RESOLUTIONS.items():
+        retention = settings.USAGE_RETENTION.get(resolution)
+        if retention is not None and start < now - timedelta(seconds=retention):
+            continue
+        if (end - start) / step <= settings.USAGE_MAX_POINTS:
+            return resolution
+    return 'day'
+
+
+def network_usage(network, start, end, resolution=None):
+    """
+    Usage of all connections of ``network`` between ``start`` and ``end``.
+
+    Returns ``(resolution, [(bucket, bytes_used), ...])`` with empty buckets
+    left out.
+    """
+    resolution = resolution or pick_resolution(start, end)
+    rows = (
+        ConnectionUsage.objects.filter(
+            network=network,
+            resolution=resolution,
+            bucket__gte=bucket_start(start, resolution),
+            bucket__lt=end,
+        )
+        .values('bucket')
+        .annotate(total=Sum('bytes_used'))
+        .order_by('bucket')
+    )
+    return resolution, [(row['bucket'], row['total']) for row in rows]
+
+
+def prune_usage(now=None):
+    """Delete rows older than their resolution's retention; returns how many were deleted"""
+    now = now or timezone.now()
+    deleted = 0
+    for resolution in RESOLUTIONS:
+        retention = settings.USAGE_RETENTION.get(resolution)
+        if retention is None:
+            continue
+        cutoff = bucket_start(now - timedelta(seconds=retention), resolution)
+        deleted += ConnectionUsage.objects.filter(resolution=resolution, bucket__lt=cutoff).delete()[0]
+    return deleted
@@ -1,22 +1,50 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse, HttpResponseForbidden
-from django.db.models import Q, Count, Sum
+from django.http import FileResponse, Http404, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.contrib import messages
 from datetime import timedelta, datetime
+import asyncio
 import json
 
+from . import quotas
 from .forms import (
     DeviceRegistrationForm, WiFiNetworkForm, ShareNetworkForm,
     NetworkInvitationForm, UserRegistrationForm, UserProfileForm,
     UpdateDeviceForm, UpdateNetworkForm, FileUploadForm, FileShareForm, FileCommentForm
 )
-from .models import Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare, FileComment
+from .models import Device, WiFiNetwork, SharedNetwork, NetworkShare, NetworkInvitation, File, FileShare, FileComment, UploadSession
+from .archives import stream_zip
+from .comments import comment_channel, comments_page, encode_cursor, serialize_comment
+from .compression import accepts_encoding
+from .counters import record_download, record_downloads
+from .delivery import StreamingDelivery, get_delivery_backend
+from .heartbeats import CONNECTION_FIELDS, DEVICE_FIELDS, HeartbeatError, clean_report, record_heartbeat
+from .pagecache import DEVICES, FILES, NETWORKS, cache_per_user
+from .permissions import DOWNLOAD, OWNER, VIEW, downloadable_files, get_file_permission, has_file_permission, resolve_permission
+from .pubsub import get_broker
+from .search import search as search_index
+from .stats import get_user_stats
+from .shares import ShareError, bulk_share
+from .storage import attach_blob, store_blob
+from .usage import RESOLUTIONS as USAGE_RESOLUTIONS, network_usage
+from .thumbnails import FORMATS as THUMBNAIL_FORMATS, get_thumbnail, preferred_format
+from .tiering import COLD, record_cold_read
+from .throttle import rate_limited
+from .typeahead import suggest_users
+from .uploads import UploadError, init_upload, write_chunk, finalize_upload, abort_upload, detect_file_type, batch_upload
 
 
 # ============ Authentication Views ============
@@ -89,27 +117,18 @@ def dashboard(request):
     """Main dashboard"""
     user = request.user
     
-    # Get user stats
-    devices = user.devices.all()
-    networks = user.wifi_networks.all()
-    shared_networks = user.shared_networks_with_me.filter(is_active=True)
-    pending_invitations = user.network_invitations.filter(status='pending')
-    
-    # Active connections
-    active_connections = SharedNetwork.objects.filter(
-        network__owner=user,
-        is_connected=True
-    ).count()
+    # Counters come precomputed from a single row
+    stats = get_user_stats(user)
     
     context = {
-        'devices_count': devices.count(),
-        'networks_count': networks.count(),
-        'shared_networks_count': shared_networks.count(),
-        'active_connections': active_connections,
-        'pending_invitations': pending_invitations.count(),
-        'recent_networks': networks[:5],
-        'recent_devices': devices[:5],
-        'pending_invitations_list': pending_invitations[:5],
+        'devices_count': stats.devices_count,
+        'networks_count': stats.networks_count,
+        'shared_networks_count': stats.shared_networks_count,
+        'active_connections': stats.active_connections,
+        'pending_invitations': stats.pending_invitations,
+        'recent_networks': user.wifi_networks.with_usage()[:5],
+        'recent_devices': user.devices.all()[:5],
+        'pending_invitations_list': user.network_invitations.filter(status='pending')[:5],
     }
     
     return render(request, 'dashboard/index.html', context)
@@ -118,6 +137,7 @@ def dashboard(request):
 # ============ Device Management Views ============
 
 @login_required
+@cache_per_user(DEVICES)
 def devices_list(request):
     """List all devices for the user"""
     devices = request.user.devices.all()
@@ -210,9 +230,10 @@ def delete_device(request, pk):
 # ============ WiFi Network Views ============
 
 @login_required
+@cache_per_user(NETWORKS)
 def networks_list(request):
     """List all WiFi networks owned by user"""
-    networks = request.user.wifi_networks.all()
+    networks = request.user.wifi_networks.with_usage()
     
     context = {
         'networks': networks,
@@ -256,6 +277,7 @@ def create_network(request):
 
 
 @login_required
+@cache_per_user(NETWORKS)
 def network_detail(request, pk):
     """View WiFi network details"""
     network = get_object_or_404(WiFiNetwork, pk=pk, owner=request.user)
@@ -346,7 +368,7 @@ def share_network(request, pk):
 def revoke_share(request, network_pk, share_pk):
     """Revoke network share"""
     network = get_object_or_404(WiFiNetwork, pk=network_pk, owner=request.user)
-    share = get_object_or_404(NetworkShare, pk=share_pk, network=network)
+    share = get_object_or_404(NetworkShare.objects.select_related('network'), pk=share_pk, network=network)
     
     username = share.shared_with_user.username
     share.delete()
@@ -436,6 +458,7 @@ def reject_invitation(request, pk):
 # ============ Shared Networks View ============
 
 @login_required
+@cache_per_user(NETWORKS)
 def shared_networks(request):
     """View networks shared with the user"""
     shares = NetworkShare.objects.filter(shared_with_user=request.user, is_active=True)
@@ -453,12 +476,11 @@ def shared_networks(request):
 @login_required
 def profile(request):
     """View user profile"""
-    user_devices = request.user.devices.all()
-    user_networks = request.user.wifi_networks.all()
+    stats = get_user_stats(request.user)
     
     context = {
-        'devices_count': user_devices.count(),
-        'networks_count': user_networks.count(),
+        'devices_count': stats.devices_count,
+        'networks_count': stats.networks_count,
         'page_title': 'My Profile',
     }
     
@@ -490,19 +512,15 @@ def edit_profile(request):
 @login_required
 def api_network_stats(request, pk):
     """API endpoint for network statistics"""
-    network = get_object_or_404(WiFiNetwork, pk=pk, owner=request.user)
-    
-    connected_count = network.connected_devices.filter(is_connected=True).count()
-    total_data_used = network.connected_devices.aggregate(
-        total=Sum('data_used')
-    )['total'] or 0
+    network = get_object_or_404(WiFiNetwork.objects.with_usage(), pk=pk, owner=request.user)
     
     data = {
         'network_name': network.network_name,
         'is_active': network.is_active,
-        'connected_devices': connected_count,
+        'connected_devices': network.connected_count,
         'max_devices': network.max_devices,
-        'total_data_used': total_data_used,
+        'total_data_used': network.total_data_used,
+        'active_shares': network.share_count,
         'signal_strength': network.signal_strength,
         'channel': network.channel,
         'frequency_band': network.frequency_band,
@@ -511,6 +529,38 @@ def api_network_stats(request, pk):
     return JsonResponse(data)
 
 
+@login_required
+def api_network_usage(request, pk):
+    """API endpoint for network data usage over a time window"""
+    network = get_object_or_404(WiFiNetwork, pk=pk, owner=request.user)
+
+    now = timezone.now()
+    try:
+        end = datetime.fromisoformat(request.GET['end']) if request.GET.get('end') else now
+        start = datetime.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=1)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be ISO 8601 timestamps'}, status=400)
+    start, end = [timezone.make_aware(value) if timezone.is_naive(value) else value for value in (start, end)]
+    if start >= end:
+        return JsonResponse({'error': 'start must be before end'}, status=400)
+
+    resolution = request.GET.get('resolution') or None
+    if resolution is not None and resolution not in USAGE_RESOLUTIONS:
+        return JsonResponse({'error': 'resolution must be minute, hour or day'}, status=400)
+    if resolution is not None and (end - start) / USAGE_RESOLUTIONS[resolution] > settings.USAGE_MAX_POINTS:
+        return JsonResponse({'error': f'Too many {resolution} buckets, use a coarser resolution'}, status=400)
+
+    resolution, points = network_usage(network, start, end, resolution)
+    return JsonResponse({
+        'network_id': str(network.id),
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_bytes': sum(used for _, used in points),
+        'points': [{'start': bucket.isoformat(), 'bytes': used} for bucket, used in points],
+    })
+
+
 @login_required
 def api_device_status(request, pk):
     """API endpoint for device status"""
@@ -528,28 +578,79 @@ def api_device_status(request, pk):
     return JsonResponse(data)
 
 
+@login_required
+def api_user_typeahead(request):
+    """API endpoint for recipient suggestions by username or email prefix"""
+    limit, window = settings.TYPEAHEAD_RATE_LIMIT
+    retry_after = rate_limited(request, 'typeahead', limit, window)
+    if retry_after:
+        response = JsonResponse({'error': 'Too many requests, slow down'}, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    try:
+        max_results = int(request.GET.get('limit', settings.TYPEAHEAD_MAX_RESULTS))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    if max_results < 1:
+        return JsonResponse({'error': 'limit must be positive'}, status=400)
+
+    users = suggest_users(request.GET.get('q', ''), exclude_user=request.user, limit=max_results)
+    return JsonResponse({'results': users})
+
+
+@login_required
+@require_http_methods(['POST'])
+def api_heartbeat(request):
+    """Accept batched status reports for the user's devices and their connections"""
+    try:
+        payload = json.loads(request.body or b'{}')
+        device_reports = dict(clean_report(r, DEVICE_FIELDS) for r in payload.get('devices') or [])
+        connection_reports = dict(clean_report(r, CONNECTION_FIELDS) for r in payload.get('connections') or [])
+    except HeartbeatError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid heartbeat'}, status=400)
+    if len(device_reports) + len(connection_reports) > settings.HEARTBEAT_MAX_REPORTS:
+        return JsonResponse({'error': f'At most {settings.HEARTBEAT_MAX_REPORTS} reports per heartbeat'}, status=400)
+    
+    # Only the user's own devices, and connections made by them, can be reported on
+    owned_devices = {str(pk) for pk in Device.objects.filter(pk__in=device_reports, user=request.user).values_list('pk', flat=True)}
+    owned_connections = {
+        str(pk) for pk in SharedNetwork.objects.filter(pk__in=connection_reports, device__user=request.user).values_list('pk', flat=True)
+    }
+    record_heartbeat(
+        {pk: values for pk, values in device_reports.items() if pk in owned_devices},
+        {pk: values for pk, values in connection_reports.items() if pk in owned_connections},
+    )
+    
+    return JsonResponse({
+        'accepted': {'devices': len(owned_devices), 'connections': len(owned_connections)},
+        'rejected': sorted((device_reports.keys() - owned_devices) | (connection_reports.keys() - owned_connections)),
+    }, status=202)
+
+
 # ============ Utility Views ============
 
 @login_required
 def search(request):
-    """Search across networks and devices"""
+    """Search across files, comments, networks and devices"""
     query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
     
     if len(query) < 2:
-        networks = []
-        devices = []
+        results, has_next = [], False
     else:
-        networks = request.user.wifi_networks.filter(
-            Q(network_name__icontains=query)
-        )
-        devices = request.user.devices.filter(
-            Q(device_name__icontains=query)
-        )
+        results, has_next = search_index(request.user, query, page=page, per_page=settings.SEARCH_RESULTS_PER_PAGE)
     
     context = {
         'query': query,
-        'networks': networks,
-        'devices': devices,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
         'page_title': f'Search Results for "{query}"',
     }
     
@@ -574,7 +675,8 @@ def get_started(request):
 def files_list(request):
     """List all files uploaded by the current user"""
     user = request.user
-    files = user.uploaded_files.all()
+    # Share counts are annotated so cards don't query their shares one by one
+    files = user.uploaded_files.filter(status='ready').annotate(share_count=Count('shares')).order_by('-created_at')
     
     # Pagination
     from django.core.paginator import Paginator
@@ -589,7 +691,7 @@ def files_list(request):
         'page_obj': page_obj,
         'files': page_obj.object_list,
         'shared_count': shared_with_me.count(),
-        'total_files': files.count(),
+        'total_files': paginator.count,
         'title': 'My Files',
     }
     return render(request, 'files/list.html', context)
@@ -600,27 +702,30 @@ def upload_file(request):
     """Upload a new file"""
     if request.method == 'POST':
         form = FileUploadForm(request.POST, request.FILES)
+        # Dropped by QuotaUploadHandler while it was still streaming in
+        if getattr(request, 'quota_rejected', None):
+            messages.error(request, f'Not enough storage space left for "{request.quota_rejected[0]}"')
+            return redirect('filesharing:files-list')
         if form.is_valid():
+            uploaded = request.FILES['file']
             file_obj = form.save(commit=False)
             file_obj.owner = request.user
-            file_obj.filename = request.FILES['file'].name
-            file_obj.file_size = request.FILES['file'].size
-            file_obj.mime_type = request.FILES['file'].content_type
+            file_obj.filename = uploaded.name
+            file_obj.file_size = uploaded.size
+            file_obj.mime_type = uploaded.content_type
             
             # Determine file type from mime type
-            mime = file_obj.mime_type.lower()
-            if mime.startswith('image'):
-                file_obj.file_type = 'image'
-            elif mime.startswith('video'):
-                file_obj.file_type = 'video'
-            elif mime.startswith('audio'):
-                file_obj.file_type = 'audio'
-            elif 'pdf' in mime or 'document' in mime or 'word' in mime or 'spreadsheet' in mime:
-                file_obj.file_type = 'document'
-            elif 'zip' in mime or 'rar' in mime or 'archive' in mime:
-                file_obj.file_type = 'archive'
+            file_obj.file_type = detect_file_type(file_obj.mime_type)
             
-            file_obj.save()
+            # Identical content already in the blob store is not stored again
+            try:
+                with transaction.atomic():
+                    quotas.charge(request.user, file_obj.file_type, file_obj.file_size)
+                    attach_blob(file_obj, store_blob(uploaded, mime_type=file_obj.mime_type))
+                    file_obj.save()
+            except quotas.QuotaExceeded:
+                messages.error(request, f'Not enough storage space left for "{file_obj.filename}"')
+                return redirect('filesharing:files-list')
             messages.success(request, f'File "{file_obj.filename}" uploaded successfully!')
             return redirect('filesharing:files-list')
         else:
@@ -639,19 +744,21 @@ def upload_file(request):
 @login_required
 def file_detail(request, pk):
     """View file details and share options"""
-    file_obj = get_object_or_404(File, id=pk)
+    file_obj = get_object_or_404(File, id=pk, status='ready')
     
     # Check permissions
-    if file_obj.owner != request.user and not FileShare.objects.filter(file=file_obj, shared_with_user=request.user, is_active=True).exists():
+    permission = get_file_permission(request, file_obj)
+    if permission is None:
         messages.error(request, 'You do not have permission to view this file')
         return redirect('filesharing:files-list')
     
-    # Get shares and comments
+    # Get shares and the newest page of comments (older ones load through the API)
     shares = file_obj.shares.filter(is_active=True)
-    comments = file_obj.comments.all().order_by('-created_at')
+    comments, more_comments = comments_page(file_obj.comments.all(), limit=settings.COMMENTS_PAGE_SIZE)
     
-    # Get all users except current user for sharing dropdown
-    users = User.objects.exclude(id=request.user.id)
+    # Recipients are picked through the typeahead API instead of a list of every user
+    share_form = FileShareForm(user=request.user) if permission == OWNER else None
+    has_other_users = permission == OWNER and User.objects.filter(is_active=True).exclude(id=request.user.id).exists()
     
     comment_form = FileCommentForm()
     
@@ -679,9 +786,16 @@ def file_detail(request, pk):
         'file': file_obj,
         'shares': shares,
         'comments': comments,
+        'comments_count': file_obj.comments.count(),
+        'more_comments': more_comments,
+        'latest_comment_cursor': encode_cursor(comments[0]) if comments else '',
+        'oldest_comment_cursor': encode_cursor(comments[-1]) if comments else '',
         'comment_form': comment_form,
-        'is_owner': file_obj.owner == request.user,
-        'users': users,
+        'is_owner': permission == OWNER,
+        'can_download': has_file_permission(request, file_obj, DOWNLOAD),
+        'share_form': share_form,
+        'has_other_users': has_other_users,
+        'comment_stream': isinstance(request, ASGIRequest),
         'title': file_obj.filename,
     }
     return render(request, 'files/detail.html', context)
@@ -691,10 +805,10 @@ def file_detail(request, pk):
 @require_http_methods(['POST'])
 def share_file(request, pk):
     """Share a file with another user"""
-    file_obj = get_object_or_404(File, id=pk)
+    file_obj = get_object_or_404(File, id=pk, status='ready')
     
     # Check ownership
-    if file_obj.owner != request.user:
+    if not has_file_permission(request, file_obj, OWNER):
         return HttpResponseForbidden('You can only share your own files')
     
     # Get form data
@@ -760,16 +874,57 @@ def share_file(request, pk):
     return redirect('filesharing:file-detail', pk=pk)
 
 
+@login_required
+@require_http_methods(['POST'])
+def api_bulk_share(request, pk):
+    """Share a file with many users in one request"""
+    file_obj = get_object_or_404(File, id=pk, status='ready')
+    
+    if not has_file_permission(request, file_obj, OWNER):
+        return JsonResponse({'error': 'You can only share your own files'}, status=403)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+        recipients = payload.get('users')
+        permission_level = payload.get('permission_level', 'download')
+        expires_at = payload.get('expires_at')
+        expires_at = datetime.fromisoformat(expires_at) if expires_at else None
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid share request'}, status=400)
+    if not isinstance(recipients, list) or not recipients:
+        return JsonResponse({'error': 'Provide a non-empty list of user ids or usernames in "users"'}, status=400)
+    if not isinstance(permission_level, str):
+        return JsonResponse({'error': '"permission_level" must be "view" or "download"'}, status=400)
+    if expires_at and timezone.is_naive(expires_at):
+        expires_at = timezone.make_aware(expires_at)
+    
+    try:
+        results = bulk_share(
+            file_obj,
+            recipients,
+            permission_level=permission_level,
+            expires_at=expires_at,
+        )
+    except ShareError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'file_id': str(file_obj.id),
+        'shared': sum(1 for result in results if result['status'] in ('shared', 'reactivated')),
+        'results': results,
+    })
+
+
 @login_required
 @require_http_methods(['POST'])
 def revoke_share(request, file_pk, share_pk):
     """Revoke file share"""
     file_obj = get_object_or_404(File, id=file_pk)
     
-    if file_obj.owner != request.user:
+    if not has_file_permission(request, file_obj, OWNER):
         return HttpResponseForbidden('Only file owner can revoke shares')
     
-    share = get_object_or_404(FileShare, id=share_pk, file=file_obj)
+    share = get_object_or_404(FileShare.objects.select_related('file'), id=share_pk, file=file_obj)
     share.delete()
     messages.success(request, 'Share revoked!')
     
@@ -779,29 +934,93 @@ def revoke_share(request, file_pk, share_pk):
 @login_required
 def download_file(request, pk):
     """Download a file"""
-    file_obj = get_object_or_404(File, id=pk)
+    file_obj = get_object_or_404(File.objects.select_related('blob'), id=pk, status='ready')
     
     # Check permissions
-    is_owner = file_obj.owner == request.user
-    is_shared = FileShare.objects.filter(
-        file=file_obj,
-        shared_with_user=request.user,
-        is_active=True,
-        permission_level='download'
-    ).exists()
-    is_public = file_obj.is_public
-    
-    if not (is_owner or is_shared or is_public):
+    if not has_file_permission(request, file_obj, DOWNLOAD):
         messages.error(request, 'You do not have permission to download this file')
         return redirect('filesharing:files-list')
     
-    # Increment download count
-    file_obj.download_count += 1
-    file_obj.save()
+    # Hand the transfer to the configured delivery backend. Cold content is
+    # streamed from the cold tier, which the front-end server cannot see;
+    # compressed content is only streamed (and decoded) for range requests,
+    # which count in original bytes, and clients that do not accept it
+    blob = file_obj.blob
+    if blob is not None and blob.tier == COLD:
+        backend = StreamingDelivery()
+        record_cold_read(blob)
+    elif blob is not None and blob.encoding and (
+        request.META.get('HTTP_RANGE') or not accepts_encoding(request, blob.encoding)
+    ):
+        backend = StreamingDelivery()
+    else:
+        backend = get_delivery_backend()
+    response = backend.deliver(request, file_obj)
+    
+    # Increment download count (partial re-fetches and 304s don't count)
+    if backend.counts_as_download(request, response):
+        record_download(file_obj.pk)
+    
+    return response
+
+
+@login_required
+def download_archive(request):
+    """Download several files as one ZIP archive (?ids=<id>&ids=<id>...)"""
+    file_ids = list(dict.fromkeys(request.GET.getlist('ids')))
+    if not file_ids:
+        messages.error(request, 'Select at least one file to download')
+        return redirect('filesharing:files-list')
+    if len(file_ids) > settings.ZIP_DOWNLOAD_MAX_FILES:
+        messages.error(request, f'At most {settings.ZIP_DOWNLOAD_MAX_FILES} files can be downloaded at once')
+        return redirect('filesharing:files-list')
+    
+    # One query checks every file; any file the user may not download fails the request
+    try:
+        files = list(downloadable_files(request.user, file_ids).select_related('blob').order_by('filename'))
+    except ValidationError:
+        files = []
+    if len(files) != len(file_ids):
+        messages.error(request, 'You do not have permission to download some of these files')
+        return redirect('filesharing:files-list')
     
-    # Return file download
-    from django.http import FileResponse
-    response = FileResponse(file_obj.file.open('rb'), as_attachment=True, filename=file_obj.filename)
+    # Downloads are counted once the whole archive has been sent
+    downloaded = [file_obj.pk for file_obj in files]
+    response = StreamingHttpResponse(
+        stream_zip(files, on_complete=lambda: record_downloads(downloaded)),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = content_disposition_header(True, f'files-{timezone.now():%Y%m%d-%H%M%S}.zip')
+    return response
+
+
+@login_required
+def file_thumbnail(request, pk, size):
+    """Serve a downscaled preview of an image file"""
+    file_obj = get_object_or_404(File, id=pk, status='ready', file_type='image')
+    if size not in settings.THUMBNAIL_SIZES:
+        raise Http404('Unknown thumbnail size')
+    
+    # Same audience as the file page
+    if not has_file_permission(request, file_obj, VIEW):
+        return HttpResponseForbidden('You do not have permission to view this file')
+    
+    if not file_obj.blob_id:
+        # Not moved into the blob store yet (see migrate_to_blobstore)
+        return redirect(file_obj.file.url)
+    
+    fmt = preferred_format(request)
+    etag = f'"{file_obj.blob_id}-{size}-{fmt}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # Normally rendered in the background after upload; render now if it isn't yet
+        thumbnail = get_thumbnail(file_obj.blob, size, fmt)
+        if thumbnail is None:
+            raise Http404('No preview available')
+        response = FileResponse(thumbnail.file.open('rb'), content_type=THUMBNAIL_FORMATS[fmt][1])
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.THUMBNAIL_CACHE_SECONDS, immutable=True)
+    patch_vary_headers(response, ['Accept'])
     return response
 
 
@@ -811,22 +1030,22 @@ def delete_file(request, pk):
     """Delete a file"""
     file_obj = get_object_or_404(File, id=pk)
     
-    if file_obj.owner != request.user:
+    if not has_file_permission(request, file_obj, OWNER):
         return HttpResponseForbidden('You can only delete your own files')
     
     filename = file_obj.filename
-    file_obj.file.delete()
-    file_obj.delete()
+    file_obj.delete()  # stored content is released once nothing references it
     messages.success(request, f'File "{filename}" deleted successfully!')
     
     return redirect('filesharing:files-list')
 
 
 @login_required
+@cache_per_user(FILES)
 def shared_files(request):
     """List files shared with current user"""
     user = request.user
-    shares = FileShare.objects.filter(shared_with_user=user, is_active=True)
+    shares = FileShare.objects.filter(shared_with_user=user, is_active=True).select_related('file__owner')
     
     # Pagination
     from django.core.paginator import Paginator
@@ -845,39 +1064,226 @@ def shared_files(request):
 @login_required
 def api_file_comments(request, pk):
     """API endpoint to get file comments as JSON"""
-    file_obj = get_object_or_404(File, id=pk)
+    file_obj = get_object_or_404(File, id=pk, status='ready')
     
     # Check permissions
-    if file_obj.owner != request.user and not FileShare.objects.filter(file=file_obj, shared_with_user=request.user, is_active=True).exists():
+    if not has_file_permission(request, file_obj, VIEW):
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
-    # Get comments
-    comments = file_obj.comments.all().order_by('-created_at')
-    
-    # Format comments for JSON
-    comments_data = []
-    for comment in comments:
-        # Calculate time difference
-        time_diff = timezone.now() - comment.created_at
-        if time_diff.days > 0:
-            time_ago = f"{time_diff.days}d ago"
-        elif time_diff.seconds > 3600:
-            time_ago = f"{time_diff.seconds // 3600}h ago"
-        elif time_diff.seconds > 60:
-            time_ago = f"{time_diff.seconds // 60}m ago"
-        else:
-            time_ago = "just now"
-        
-        comments_data.append({
-            'id': str(comment.id),
-            'user': comment.user.username,
-            'comment': comment.comment,
-            'time_ago': time_ago,
-            'created_at': comment.created_at.isoformat()
-        })
+    # Keyset pagination: ?since=<cursor> for new comments, ?before=<cursor> for history
+    try:
+        limit = min(max(int(request.GET.get('limit', settings.COMMENTS_PAGE_SIZE)), 1), settings.COMMENTS_PAGE_MAX)
+        comments, has_more = comments_page(
+            file_obj.comments.all(),
+            since=request.GET.get('since'),
+            before=request.GET.get('before'),
+            limit=limit,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+    
+    now = timezone.now()
+    comments_data = [serialize_comment(comment, now) for comment in comments]
     
     return JsonResponse({
         'file_id': str(file_obj.id),
         'comments': comments_data,
-        'total': len(comments_data)
+        'total': len(comments_data),
+        'has_more': has_more,
+        'latest_cursor': comments_data[0]['cursor'] if comments_data else request.GET.get('since'),
+        'oldest_cursor': comments_data[-1]['cursor'] if comments_data else None,
+    })
+
+
+def _comments_after(file_obj, last_comment_id, limit=100):
+    """Comments posted after the given one, oldest first (used to replay missed events)"""
+    try:
+        anchor = FileComment.objects.filter(pk=last_comment_id, file=file_obj).first()
+    except ValidationError:
+        return []
+    if anchor is None:
+        return []
+    comments, _ = comments_page(file_obj.comments.all(), since=encode_cursor(anchor), limit=limit)
+    return [serialize_comment(comment) for comment in reversed(comments)]
+
+
+def _sse_event(comment):
+    """Format a serialized comment as a Server-Sent Event"""
+    return f"id: {comment['id']}\nevent: comment\ndata: {json.dumps(comment)}\n\n"
+
+
+@login_required
+async def api_file_comment_stream(request, pk):
+    """Stream new comments on a file as Server-Sent Events"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Comment streaming requires the ASGI server'}, status=501)
+    
+    user = await request.auser()
+    file_obj = await aget_object_or_404(File, id=pk, status='ready')
+    
+    # Check permissions
+    if await sync_to_async(resolve_permission)(user, file_obj) is None:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    last_event_id = request.headers.get('Last-Event-ID', '').strip()
+    
+    async def events():
+        broker = get_broker()
+        channel = comment_channel(file_obj.id)
+        queue = broker.subscribe(channel)
+        try:
+            yield f'retry: {settings.COMMENT_STREAM_RETRY_MS}\n\n'
+            
+            # Replay anything posted while the client was reconnecting
+            if last_event_id:
+                for comment in await sync_to_async(_comments_after)(file_obj, last_event_id):
+                    yield _sse_event(comment)
+            
+            while True:
+                try:
+                    comment = await asyncio.wait_for(queue.get(), timeout=settings.COMMENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse_event(comment)
+        finally:
+            broker.unsubscribe(channel, queue)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ============ Chunked Upload API ============
+
+def _upload_session_data(session):
+    """Serialize an upload session for the chunked upload API"""
+    return {
+        'upload_id': str(session.id),
+        'file_id': str(session.file_id),
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'offset': session.received_bytes,
+        'complete': session.is_complete(),
+    }
+
+
+@login_required
+@require_http_methods(['POST'])
+def api_upload_init(request):
+    """Start a resumable chunked upload"""
+    try:
+        payload = json.loads(request.body or b'{}')
+        total_size = int(payload.get('size', 0))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid upload request'}, status=400)
+    
+    try:
+        session = init_upload(
+            owner=request.user,
+            filename=payload.get('filename', ''),
+            total_size=total_size,
+            mime_type=payload.get('mime_type') or 'application/octet-stream',
+            is_public=bool(payload.get('is_public', False)),
+        )
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    
+    return JsonResponse(_upload_session_data(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def api_upload_status(request, pk):
+    """Report the offset to resume an upload from, or cancel it"""
+    session = get_object_or_404(UploadSession.objects.select_related('file'), pk=pk, owner=request.user)
+    
+    if request.method == 'DELETE':
+        abort_upload(session)
+        return JsonResponse({'upload_id': str(pk), 'cancelled': True})
+    
+    return JsonResponse(_upload_session_data(session))
+
+
+@login_required
+@require_http_methods(['PUT'])
+def api_upload_chunk(request, pk, offset):
+    """Receive one fixed-size chunk of a chunked upload"""
+    session = get_object_or_404(UploadSession, pk=pk, owner=request.user)
+    
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        write_chunk(session, offset, request, length)
+    except UploadError as e:
+        data = _upload_session_data(session)
+        data['error'] = str(e)
+        return JsonResponse(data, status=e.status)
+    
+    return JsonResponse(_upload_session_data(session))
+
+
+@login_required
+@require_http_methods(['POST'])
+def api_upload_finalize(request, pk):
+    """Assemble a fully received chunked upload into a ready File"""
+    session = get_object_or_404(UploadSession.objects.select_related('file'), pk=pk, owner=request.user)
+    
+    try:
+        file_obj = finalize_upload(session)
+    except UploadError as e:
+        data = _upload_session_data(session)
+        data['error'] = str(e)
+        return JsonResponse(data, status=e.status)
+    
+    return JsonResponse({
+        'file_id': str(file_obj.id),
+        'filename': file_obj.filename,
+        'file_size': file_obj.file_size,
+        'file_type': file_obj.file_type,
+    }, status=201)
+
+
+# ============ Batch Upload API ============
+
+@login_required
+@require_http_methods(['POST'])
+def api_batch_upload(request):
+    """Upload many files in one multipart request (field name "files")"""
+    uploaded_files = request.FILES.getlist('files')
+    over_quota = getattr(request, 'quota_rejected', [])  # skipped while streaming in
+    if not uploaded_files and not over_quota:
+        return JsonResponse({'error': 'No files received'}, status=400)
+    if len(uploaded_files) > settings.BATCH_UPLOAD_MAX_FILES:
+        return JsonResponse({'error': f'At most {settings.BATCH_UPLOAD_MAX_FILES} files per batch'}, status=400)
+    
+    results = batch_upload(request.user, uploaded_files, is_public=request.POST.get('is_public') == 'true')
+    results += [
+        {'filename': filename, 'status': 'rejected', 'error': 'Not enough storage space left for this file'}
+        for filename in over_quota
+    ]
+    accepted = sum(1 for result in results if result['status'] != 'rejected')
+    return JsonResponse({
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'files': results,
+    }, status=202 if accepted else 400)
+
+
+@login_required
+def api_batch_upload_status(request):
+    """Processing status of files from a batch upload (?ids=<id>,<id>,...)"""
+    ids = [i for i in request.GET.get('ids', '').split(',') if i][:settings.BATCH_UPLOAD_MAX_FILES]
+    try:
+        files = File.objects.filter(owner=request.user, pk__in=ids).values('id', 'filename', 'status', 'file_type')
+        files = list(files)
+    except ValidationError:
+        return JsonResponse({'error': 'Invalid file id'}, status=400)
+    
+    return JsonResponse({
+        'files': [
+            {'file_id': str(f['id']), 'filename': f['filename'], 'status': f['status'], 'file_type': f['file_type']}
+            for f in files
+        ],
+        'pending': sum(1 for f in files if f['status'] == 'processing'),
     })
@@ -3,6 +3,10 @@ ASGI config for sharing project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn sharing.asgi:application``)
+to enable the Server-Sent Events comment stream on file detail pages; under
+WSGI the pages fall back to polling the comments JSON endpoint.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
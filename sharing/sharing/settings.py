@@ -146,6 +146,132 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media storage that also finds content moved to the cold tier (see filesharing/tiering.py)
+STORAGES = {
+    'default': {'BACKEND': 'filesharing.tiering.TieredFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Cold storage tier (run `manage.py tier_files` daily; --dry-run reports what would move)
+TIERING_COLD_ROOT = os.path.join(BASE_DIR, 'media_cold')  # slower or cheaper volume
+TIERING_POLICY = {
+    'min_age_days': 30,  # files younger than this stay hot
+    'idle_days': 14,  # ... and so do files downloaded within this many days
+    'max_downloads': 100,  # ... and files downloaded more often than this overall (None = no limit)
+    'promote_downloads': 3,  # downloads within idle_days that bring cold content back (None = never)
+}
+TIERING_BATCH_SIZE = 100  # blobs fetched per candidate query
+
+# At-rest compression of new blobs (`manage.py compression_report` shows the savings)
+FILE_COMPRESSION_ENABLED = True
+FILE_COMPRESSION_MIN_SIZE = 4 * 1024  # smaller files are stored as they are
+FILE_COMPRESSION_MIN_RATIO = 1.5  # sampled original/compressed size needed to compress
+FILE_COMPRESSION_PROBE_BYTES = 64 * 1024  # sampled from the start, middle and end
+FILE_COMPRESSION_LEVEL = 6  # gzip level, 1 (fast) to 9 (small)
+
+# Enforce storage quotas and hash multipart uploads while they stream in
+# (the quota handler must come first)
+FILE_UPLOAD_HANDLERS = [
+    'filesharing.uploadhandlers.QuotaUploadHandler',
+    'filesharing.uploadhandlers.HashingMemoryFileUploadHandler',
+    'filesharing.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# Resumable chunked uploads
+# Partial uploads live outside MEDIA_ROOT so they are never served before finalize
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_chunks')
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+CHUNKED_UPLOAD_MAX_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24  # abandoned uploads are reaped after this
+
+# Storage quota per user in bytes (None = unlimited); StorageUsage.quota_bytes overrides it
+STORAGE_QUOTA_BYTES = 10 * 1024 * 1024 * 1024  # 10 GB
+
+# Batch uploads (many files in one multipart request)
+BATCH_UPLOAD_MAX_FILES = 500
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_UPLOAD_MAX_FILES  # Django rejects requests with more
+BATCH_UPLOAD_STALE_MINUTES = 10  # `cleanup_uploads` finishes batch files still processing after this
+
+# File delivery backend used by download_file
+# 'filesharing.delivery.StreamingDelivery'      - stream through Django (development)
+# 'filesharing.delivery.XAccelRedirectDelivery' - hand off to nginx
+# 'filesharing.delivery.XSendfileDelivery'      - hand off to Apache mod_xsendfile / lighttpd
+FILE_DELIVERY_BACKEND = 'filesharing.delivery.StreamingDelivery'
+FILE_DELIVERY_INTERNAL_URL = '/protected-media/'  # nginx internal location aliased to MEDIA_ROOT
+ZIP_DOWNLOAD_MAX_FILES = 500  # files per streamed ZIP download
+
+# Buffered download counters (flushed when either limit is reached)
+DOWNLOAD_COUNTER_FLUSH_INTERVAL = 10  # seconds
+DOWNLOAD_COUNTER_FLUSH_THRESHOLD = 100  # buffered downloads
+
+# Device heartbeats (coalesced in memory, flushed when either limit is reached)
+HEARTBEAT_FLUSH_INTERVAL = 5  # seconds
+HEARTBEAT_FLUSH_THRESHOLD = 500  # buffered devices + connections
+HEARTBEAT_MAX_REPORTS = 1000  # per request
+DEVICE_OFFLINE_AFTER = 120  # seconds without a heartbeat before the sweeper marks a device offline
+
+# Share and invitation expiry (run `manage.py sweep_expired` every minute or so)
+EXPIRY_SWEEP_BATCH_SIZE = 500  # rows per UPDATE
+
+# Connection usage time series: seconds each resolution is kept (None = forever)
+USAGE_RETENTION = {
+    'minute': 2 * 24 * 3600,
+    'hour': 90 * 24 * 3600,
+    'day': None,
+}
+USAGE_MAX_POINTS = 500  # buckets per usage API response
+
+# Server-push comment stream (Server-Sent Events, needs the ASGI server)
+# The in-memory broker only reaches clients connected to the same process
+PUBSUB_BACKEND = 'filesharing.pubsub.InMemoryBroker'
+COMMENT_STREAM_KEEPALIVE = 15  # seconds between keepalive comments
+COMMENT_STREAM_RETRY_MS = 5000  # client reconnect delay
+
+# In-process background worker pool (filesharing.tasks)
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_SYNC = False  # run jobs inline instead, e.g. in tests
+
+# Image thumbnails: name -> longest edge in pixels, rendered as WebP and JPEG
+THUMBNAIL_SIZES = {
+    'small': 160,
+    'medium': 480,
+    'large': 1280,
+}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_SECONDS = 365 * 24 * 60 * 60  # thumbnails of a file never change
+
+# Cache used by the permission resolver and other short-lived lookups.
+# Use a shared backend (Redis, Memcached) when running several processes,
+# otherwise share revocations and page cache invalidations only reach the
+# process that handled them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Per-user page cache (invalidated by model signals, see filesharing/pagecache.py)
+PAGE_CACHE_SECONDS = 300
+
+# How long a user's FileShare lookup is cached by the permission resolver
+# (share create/revoke invalidates it immediately)
+FILE_PERMISSION_CACHE_SECONDS = 60
+
+# Full-text search
+# 'filesharing.search.SQLiteFTSBackend'    - FTS5 index (SQLite)
+# 'filesharing.search.DatabaseSearchBackend' - icontains fallback for other databases
+SEARCH_BACKEND = 'filesharing.search.SQLiteFTSBackend'
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Comments API pagination
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_PAGE_MAX = 100  # hard cap on ?limit=
+
+# Recipient typeahead on the share and invitation forms
+TYPEAHEAD_MIN_CHARS = 2
+TYPEAHEAD_MAX_RESULTS = 10
+TYPEAHEAD_RATE_LIMIT = (30, 10)  # requests per window seconds, per user
+
 # Make sure this is set for development
 DEBUG = True
 